@@ -2,6 +2,7 @@ from typing import Annotated
 
 import nerve.runtime.state as state
 from loguru import logger
+from nerve.tools.protocol import serial
 
 HA = "#A"
 HB = "#B"
@@ -54,6 +55,7 @@ def _solve(program):
     return program
 
 
+@serial
 def provide_solution(solution: Annotated[str, "The solution you found"]) -> str:
     """Use this tool to provide the final solution to the problem."""
 
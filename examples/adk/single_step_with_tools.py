@@ -7,8 +7,10 @@ from loguru import logger
 from nerve.models import Configuration
 from nerve.runtime import logging, state
 from nerve.runtime.agent import Agent
+from nerve.tools.protocol import serial
 
 
+@serial
 async def provide_answer(result: Annotated[float, "The result of the math problem"]) -> None:
     """Provide the answer to the question."""
 
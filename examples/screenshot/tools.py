@@ -4,6 +4,7 @@ import shutil
 import typing as t
 
 from nerve.runtime import state
+from nerve.tools.protocol import serial
 
 
 def take_screenshot() -> dict[str, str]:
@@ -33,6 +34,7 @@ def take_screenshot() -> dict[str, str]:
     }
 
 
+@serial
 def describe_screenshot(description: t.Annotated[str, "The description of the screenshot."]) -> None:
     """
     Describe the screenshot.
@@ -12,10 +12,12 @@ from nerve.cli.defaults import (
     DEFAULT_CONVERSATION_STRATEGY,
     DEFAULT_GENERATOR,
     DEFAULT_MAX_STEPS,
+    DEFAULT_STEP_TIMEOUT,
     DEFAULT_TIMEOUT,
 )
 from nerve.cli.execute import execute_flow
 from nerve.cli.replay import replay
+from nerve.cli.stats import print_stats
 from nerve.generation import conversation
 from nerve.runtime import logging
 
@@ -72,11 +74,49 @@ def play(
         bool,
         typer.Option("--fast", "-f", help="Do not sleep between events"),
     ] = False,
+    speed: t.Annotated[
+        float,
+        typer.Option("--speed", "-s", help="Replay speed factor", min=0.01),
+    ] = 1.0,
+    from_step: t.Annotated[
+        int | None,
+        typer.Option("--from-step", help="Replay from this step"),
+    ] = None,
+    until_step: t.Annotated[
+        int | None,
+        typer.Option("--until", help="Replay until this step (included)"),
+    ] = None,
+    only: t.Annotated[
+        list[str] | None,
+        typer.Option("--only", help="Only replay events with this name (can be repeated)"),
+    ] = None,
 ) -> None:
     logging.init(None, False)
     logger.info(f"🧠 nerve v{nerve.__version__}")
 
-    asyncio.run(replay(trace_path, fast))
+    asyncio.run(replay(trace_path, fast, speed=speed, from_step=from_step, until_step=until_step, only=only))
+
+
+@cli.command(
+    context_settings={"help_option_names": ["-h", "--help"]},
+    no_args_is_help=True,
+    help="Print tool, step and actor metrics of a trace file.",
+)
+def stats(
+    trace_path: t.Annotated[
+        pathlib.Path,
+        typer.Argument(help="Trace file to analyze"),
+    ] = pathlib.Path("trace.jsonl"),
+    as_json: t.Annotated[
+        bool,
+        typer.Option("--json", "-j", help="Print the metrics as JSON"),
+    ] = False,
+    top: t.Annotated[
+        int,
+        typer.Option("--top", "-n", help="Number of slowest steps to report"),
+    ] = 5,
+) -> None:
+    print_stats(trace_path, as_json, top)
 
 
 @cli.command(
@@ -96,7 +136,11 @@ def run(
     ] = DEFAULT_GENERATOR,
     conversation_strategy: t.Annotated[
         str,
-        typer.Option("--conversation", "-c", help="Conversation strategy to use"),
+        typer.Option(
+            "--conversation",
+            "-c",
+            help="Conversation strategy to use: full, a number of messages (10) or a budget of tokens (16k).",
+        ),
     ] = DEFAULT_CONVERSATION_STRATEGY,
     interactive: t.Annotated[
         bool,
@@ -114,6 +158,10 @@ def run(
         int | None,
         typer.Option("--timeout", "-t", help="Timeout in seconds"),
     ] = DEFAULT_TIMEOUT,
+    step_timeout: t.Annotated[
+        float | None,
+        typer.Option("--step-timeout", help="Timeout of each step in seconds"),
+    ] = DEFAULT_STEP_TIMEOUT,
     log_path: t.Annotated[
         pathlib.Path | None,
         typer.Option("--log", help="Log to a file."),
@@ -122,6 +170,22 @@ def run(
         pathlib.Path | None,
         typer.Option("--trace", help="Save the final state to a file."),
     ] = None,
+    cache: t.Annotated[
+        pathlib.Path | None,
+        typer.Option("--cache", help="Cache generator responses in this file and reuse them for identical requests."),
+    ] = None,
+    checkpoint: t.Annotated[
+        pathlib.Path | None,
+        typer.Option("--checkpoint", help="Save the progress of the run to this file."),
+    ] = None,
+    checkpoint_every: t.Annotated[
+        int,
+        typer.Option("--checkpoint-every", help="Save the progress every N steps.", min=1),
+    ] = 1,
+    resume: t.Annotated[
+        pathlib.Path | None,
+        typer.Option("--resume", help="Resume the run from this checkpoint file."),
+    ] = None,
 ) -> None:
     logging.init(log_path, debug)
     logger.info(f"🧠 nerve v{nerve.__version__}")
@@ -137,5 +201,10 @@ def run(
             timeout,
             interactive,
             trace,
+            cache,
+            checkpoint,
+            checkpoint_every,
+            resume,
+            step_timeout,
         )
     )
@@ -4,7 +4,9 @@ import pathlib
 DEFAULT_GENERATOR: str = os.getenv("NERVE_GENERATOR", "openai/gpt-4o-mini")
 DEFAULT_MAX_STEPS: int = int(os.getenv("NERVE_MAX_STEPS", 100))
 DEFAULT_TIMEOUT: int | None = int(os.getenv("NERVE_TIMEOUT", 0)) or None
+DEFAULT_STEP_TIMEOUT: float | None = float(os.getenv("NERVE_STEP_TIMEOUT", 0)) or None
 DEFAULT_CONVERSATION_STRATEGY: str = os.getenv("NERVE_CONVERSATION_STRATEGY", "full")
+DEFAULT_CACHE_MAX_SIZE: int = int(os.getenv("NERVE_CACHE_MAX_SIZE", 256 * 1024 * 1024))
 
 DEFAULT_NERVE_HOME: pathlib.Path = pathlib.Path.home() / ".nerve"
 
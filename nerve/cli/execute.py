@@ -4,10 +4,12 @@ import typer
 from loguru import logger
 
 import nerve.runtime.state as state
-from nerve.cli.defaults import DEFAULT_AGENTS_LOAD_PATH
+from nerve.cli.defaults import DEFAULT_AGENTS_LOAD_PATH, DEFAULT_CACHE_MAX_SIZE
 from nerve.generation import WindowStrategy
+from nerve.generation import cache as response_cache
 from nerve.models import Configuration, Mode, Workflow
 from nerve.runtime.agent import Agent
+from nerve.runtime.checkpoint import Checkpoint
 from nerve.runtime.flow import Flow
 
 cli = typer.Typer(
@@ -52,10 +54,18 @@ async def execute_flow(
     timeout: int | None = None,
     interactive: bool = False,
     trace: pathlib.Path | None = None,
+    cache: pathlib.Path | None = None,
+    checkpoint: pathlib.Path | None = None,
+    checkpoint_every: int = 1,
+    resume: pathlib.Path | None = None,
+    step_timeout: float | None = None,
 ) -> None:
     if trace:
         state.set_trace_file(trace)
 
+    if cache:
+        response_cache.enable(cache, DEFAULT_CACHE_MAX_SIZE)
+
     if interactive:
         state.set_mode(Mode.INTERACTIVE)
 
@@ -75,6 +85,7 @@ async def execute_flow(
             max_steps=max_steps,
             timeout=timeout,
             start_state=start_state,
+            step_timeout=step_timeout,
         )
 
     elif Configuration.is_agent_config(input_path):
@@ -84,10 +95,20 @@ async def execute_flow(
             max_steps=max_steps,
             timeout=timeout,
             start_state=start_state,
+            step_timeout=step_timeout,
         )
 
     else:
         logger.error(f"path '{input_path}' is not a valid workflow or agent configuration")
         raise typer.Abort()
 
+    if resume:
+        flow.restore(Checkpoint.load(resume))
+        # keep saving the progress to the same file, unless another one was specified
+        checkpoint = checkpoint or resume
+
+    if checkpoint:
+        flow.checkpoint_path = checkpoint
+        flow.checkpoint_every = checkpoint_every
+
     await flow.run()
@@ -1,29 +1,30 @@
 import asyncio
-import json
 import pathlib
 
 from loguru import logger
 
 from nerve.runtime import logging
 from nerve.runtime.events import Event
+from nerve.runtime.trace import read_events
 
 
 async def replay(
     trace_path: pathlib.Path,
     fast: bool,
+    speed: float = 1.0,
+    from_step: int | None = None,
+    until_step: int | None = None,
+    only: list[str] | None = None,
 ) -> None:
     logger.info(f"▶️  replaying {trace_path} ...")
 
-    with open(trace_path) as f:
-        prev: Event | None = None
+    prev: Event | None = None
 
-        for line in f:
-            event = Event(**json.loads(line))
+    for event in read_events(trace_path, from_step=from_step, until_step=until_step, only=only):
+        if prev and not fast:
+            delay = (event.timestamp - prev.timestamp) / speed
+            await asyncio.sleep(max(0.0, delay))
 
-            if prev and not fast:
-                delay = event.timestamp - prev.timestamp
-                await asyncio.sleep(delay)
+        logging.log_event_to_terminal(event)
 
-            logging.log_event_to_terminal(event)
-
-            prev = event
+        prev = event
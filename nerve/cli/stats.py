@@ -0,0 +1,190 @@
+import json
+import pathlib
+import typing as t
+
+from nerve.generation.latency import percentile
+from nerve.runtime.events import Event
+from nerve.runtime.logging import DictWrapper
+from nerve.runtime.trace import read_events
+
+# percentiles of the tool call latencies
+PERCENTILES = (50, 90, 99)
+# token usage fields summed per step and per actor
+USAGE_FIELDS = ("prompt_tokens", "completion_tokens", "cached_tokens", "total_tokens")
+
+
+def _get_usage(usage: t.Any) -> dict[str, t.Any]:
+    if usage is None:
+        return {}
+    elif hasattr(usage, "model_dump"):
+        return t.cast(dict[str, t.Any], usage.model_dump())
+    return t.cast(dict[str, t.Any], usage)
+
+
+def _actor_name(actor: t.Any) -> str | None:
+    # traces recorded by older versions embed the whole actor
+    if isinstance(actor, dict):
+        return t.cast(str | None, DictWrapper(actor).runtime.name)
+    return t.cast(str | None, actor)
+
+
+class TraceStats:
+    """Aggregates the tool, step and actor metrics of a trace, one event at a time."""
+
+    def __init__(self) -> None:
+        self.events = 0
+        self.actor: str | None = None
+        # tool name -> latencies
+        self.tool_latencies: dict[str, list[float]] = {}
+        self.tool_errors: dict[str, int] = {}
+        # step number -> metrics
+        self.steps: dict[int, dict[str, t.Any]] = {}
+        # actor name -> totals
+        self.actors: dict[str, dict[str, t.Any]] = {}
+        self._step_started_at: dict[int, float] = {}
+        self._step: int | None = None
+
+    def _get_actor(self, name: str | None) -> dict[str, t.Any]:
+        name = name or "-"
+        if name not in self.actors:
+            totals = {"steps": 0, "tool_calls": 0, "duration": 0.0, "generation": 0.0}
+            self.actors[name] = totals | dict.fromkeys(USAGE_FIELDS, 0)
+        return self.actors[name]
+
+    def add(self, event: Event) -> None:
+        self.events += 1
+        data = event.data or {}
+
+        if event.name == "task_started":
+            self.actor = _actor_name(data.get("actor"))
+
+        elif event.name == "step_started":
+            self._step = data.get("step")
+            if self._step is not None:
+                self._step_started_at[self._step] = event.timestamp
+                self.steps.setdefault(self._step, {"tool_calls": 0})
+
+        elif event.name == "tool_called":
+            name = data.get("name", "?")
+            started_at = data.get("started_at")
+            finished_at = data.get("finished_at")
+            if started_at is not None and finished_at is not None:
+                self.tool_latencies.setdefault(name, []).append(finished_at - started_at)
+            if data.get("error"):
+                self.tool_errors[name] = self.tool_errors.get(name, 0) + 1
+
+            # recorded by older versions without the step and actor of the call
+            step = data.get("step", self._step)
+            self._get_actor(_actor_name(data.get("actor", self.actor)))["tool_calls"] += 1
+            if step is not None and step in self.steps:
+                self.steps[step]["tool_calls"] += 1
+
+        elif event.name == "step_complete":
+            step = data.get("step", self._step)
+            if step is None:
+                return
+
+            # actors of parallel workflows step concurrently
+            actor_name = _actor_name(data.get("actor", self.actor))
+
+            usage = _get_usage(data.get("step_usage"))
+            started_at = self._step_started_at.pop(step, event.timestamp)
+            metrics = {
+                "step": step,
+                "actor": actor_name,
+                "duration": event.timestamp - started_at,
+                # time spent waiting for the model, as opposed to running tools
+                "generation": usage.get("total_duration", 0.0),
+                "tool_calls": 0,
+            } | {field: usage.get(field, 0) for field in USAGE_FIELDS}
+
+            # tool calls of the step are reported before it completes
+            if step in self.steps:
+                metrics["tool_calls"] = self.steps[step]["tool_calls"]
+            self.steps[step] = metrics
+
+            actor = self._get_actor(actor_name)
+            actor["steps"] += 1
+            for field in ("duration", "generation", *USAGE_FIELDS):
+                actor[field] += metrics[field]
+
+    def tools(self) -> list[dict[str, t.Any]]:
+        tools = []
+        for name, latencies in sorted(self.tool_latencies.items()):
+            ordered = sorted(latencies)
+            tools.append(
+                {
+                    "name": name,
+                    "calls": len(ordered),
+                    "errors": self.tool_errors.get(name, 0),
+                    "total": sum(ordered),
+                    "mean": sum(ordered) / len(ordered),
+                    "max": ordered[-1],
+                }
+                | {f"p{p}": percentile(ordered, p) for p in PERCENTILES}
+            )
+        return tools
+
+    def completed_steps(self) -> list[dict[str, t.Any]]:
+        return [metrics for _, metrics in sorted(self.steps.items()) if "duration" in metrics]
+
+    def slowest_steps(self, top: int) -> list[dict[str, t.Any]]:
+        return sorted(self.completed_steps(), key=lambda metrics: metrics["duration"], reverse=True)[:top]
+
+    def to_dict(self, top: int = 5) -> dict[str, t.Any]:
+        return {
+            "events": self.events,
+            "tools": self.tools(),
+            "steps": self.completed_steps(),
+            "actors": [{"name": name} | totals for name, totals in self.actors.items()],
+            "slowest_steps": self.slowest_steps(top),
+        }
+
+
+def collect(trace_path: pathlib.Path) -> TraceStats:
+    """Stream the events of a trace into a TraceStats."""
+
+    stats = TraceStats()
+    for event in read_events(trace_path):
+        stats.add(event)
+    return stats
+
+
+def _format_value(value: t.Any) -> str:
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return "-" if value is None else str(value)
+
+
+def _format_table(title: str, rows: list[dict[str, t.Any]], columns: list[str]) -> str:
+    cells = [columns] + [[_format_value(row.get(column)) for column in columns] for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(columns))]
+    lines = [title, ""] + [
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths, strict=True)).rstrip() for row in cells
+    ]
+    return "\n".join(lines)
+
+
+def format_tables(stats: TraceStats, top: int = 5) -> str:
+    percentiles = [f"p{p}" for p in PERCENTILES]
+    step_columns = ["step", "actor", "duration", "generation", "tool_calls", *USAGE_FIELDS]
+
+    tables = [
+        _format_table("tools", stats.tools(), ["name", "calls", "errors", "total", "mean", *percentiles, "max"]),
+        _format_table("steps", stats.completed_steps(), step_columns),
+        _format_table(
+            "actors",
+            [{"name": name} | totals for name, totals in stats.actors.items()],
+            ["name", "steps", "tool_calls", "duration", "generation", *USAGE_FIELDS],
+        ),
+        _format_table("slowest steps", stats.slowest_steps(top), step_columns),
+    ]
+    return "\n\n".join(tables)
+
+
+def print_stats(trace_path: pathlib.Path, as_json: bool, top: int) -> None:
+    stats = collect(trace_path)
+    if as_json:
+        print(json.dumps(stats.to_dict(top), indent=2))
+    else:
+        print(format_tables(stats, top))
@@ -0,0 +1,144 @@
+import pathlib
+
+from nerve.cli.stats import TraceStats, collect, format_tables
+from nerve.runtime.events import Event
+from nerve.runtime.trace import TraceWriter
+
+
+def _usage(tokens: int, generation: float) -> dict[str, int | float]:
+    return {
+        "prompt_tokens": tokens,
+        "completion_tokens": 1,
+        "total_tokens": tokens + 1,
+        "time_to_first_token": generation,
+        "total_duration": generation,
+    }
+
+
+def _events() -> list[Event]:
+    return [
+        Event("task_started", {"actor": "first"}, timestamp=0.0),
+        Event("step_started", {"step": 1}, timestamp=0.0),
+        Event("tool_called", {"name": "shell", "started_at": 1.0, "finished_at": 3.0}, timestamp=3.0),
+        Event("tool_called", {"name": "shell", "started_at": 3.0, "finished_at": 4.0, "error": "boom"}, timestamp=4.0),
+        Event("step_complete", {"step": 1, "step_usage": _usage(10, 0.5)}, timestamp=5.0),
+        Event("task_started", {"actor": "second"}, timestamp=5.0),
+        Event("step_started", {"step": 2}, timestamp=5.0),
+        Event("tool_called", {"name": "wait", "started_at": 5.0, "finished_at": 5.5}, timestamp=5.5),
+        Event("step_complete", {"step": 2, "step_usage": _usage(20, 0.25)}, timestamp=6.0),
+    ]
+
+
+def test_trace_stats() -> None:
+    stats = TraceStats()
+    for event in _events():
+        stats.add(event)
+
+    result = stats.to_dict(top=1)
+
+    assert result["events"] == 9
+    shell = result["tools"][0]
+    assert (shell["name"], shell["calls"], shell["errors"], shell["total"]) == ("shell", 2, 1, 3.0)
+    assert (shell["p50"], shell["p99"], shell["max"]) == (1.0, 2.0, 2.0)
+
+    assert [(step["step"], step["actor"], step["tool_calls"]) for step in result["steps"]] == [
+        (1, "first", 2),
+        (2, "second", 1),
+    ]
+    assert result["steps"][0]["duration"] == 5.0
+    assert result["steps"][0]["generation"] == 0.5
+
+    assert result["actors"][1] == {
+        "name": "second",
+        "steps": 1,
+        "tool_calls": 1,
+        "duration": 1.0,
+        "generation": 0.25,
+        "prompt_tokens": 20,
+        "completion_tokens": 1,
+        "cached_tokens": 0,
+        "total_tokens": 21,
+    }
+    assert [step["step"] for step in result["slowest_steps"]] == [1]
+
+
+def test_ollama_generation_time() -> None:
+    stats = TraceStats()
+    ollama_usage = {
+        "prompt_tokens": 10,
+        "completion_tokens": 5,
+        "total_tokens": 15,
+        "load_duration": 0.5,
+        "prompt_eval_duration": 0.25,
+        "eval_duration": 1.0,
+    }
+
+    for step, usage in enumerate(
+        (
+            # not streamed, the response was received after the server processing
+            ollama_usage | {"time_to_first_token": 2.0, "total_duration": 2.0},
+            # streamed
+            ollama_usage | {"time_to_first_token": 0.8, "total_duration": 1.8},
+        ),
+        start=1,
+    ):
+        stats.add(Event("step_started", {"step": step}, timestamp=0.0))
+        stats.add(Event("step_complete", {"step": step, "step_usage": usage}, timestamp=3.0))
+
+    assert [step["generation"] for step in stats.to_dict()["steps"]] == [2.0, 1.8]
+
+
+def test_parallel_tool_calls() -> None:
+    stats = TraceStats()
+    # the actors of a parallel workflow step concurrently
+    for event in (
+        Event("task_started", {"actor": "first"}, timestamp=0.0),
+        Event("step_started", {"step": 0, "actor": "first"}, timestamp=0.0),
+        Event("task_started", {"actor": "second"}, timestamp=0.0),
+        Event("step_started", {"step": 1, "actor": "second"}, timestamp=0.0),
+        Event("tool_called", {"step": 0, "actor": "first", "name": "shell"}, timestamp=1.0),
+        Event("tool_called", {"step": 0, "actor": "first", "name": "shell"}, timestamp=1.0),
+        Event("step_complete", {"step": 1, "actor": "second", "step_usage": _usage(10, 0.5)}, timestamp=2.0),
+        Event("step_complete", {"step": 0, "actor": "first", "step_usage": _usage(10, 0.5)}, timestamp=2.0),
+    ):
+        stats.add(event)
+
+    result = stats.to_dict()
+
+    assert [(step["step"], step["actor"], step["tool_calls"]) for step in result["steps"]] == [
+        (0, "first", 2),
+        (1, "second", 0),
+    ]
+    assert {actor["name"]: actor["tool_calls"] for actor in result["actors"]} == {"first": 2, "second": 0}
+
+
+def test_baseline_trace() -> None:
+    stats = TraceStats()
+    # older versions embed the whole actor and don't report the step usage
+    actor = {"runtime": {"name": "first", "working_dir": "."}, "generator": "openai/gpt-4o"}
+    for event in (
+        Event("task_started", {"actor": actor}, timestamp=0.0),
+        Event("step_started", {"step": 1, "token_usage": {}}, timestamp=0.0),
+        Event("tool_called", {"name": "shell", "started_at": 1.0, "finished_at": 2.0}, timestamp=2.0),
+        Event("step_complete", {"step": 1, "token_usage": {}}, timestamp=3.0),
+    ):
+        stats.add(event)
+
+    result = stats.to_dict()
+
+    assert [(step["step"], step["actor"], step["tool_calls"]) for step in result["steps"]] == [(1, "first", 1)]
+    assert result["actors"][0]["name"] == "first"
+
+
+def test_collect_from_trace(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "trace.jsonl"
+    writer = TraceWriter(path)
+    for event in _events():
+        writer.write(event)
+    writer.close()
+
+    stats = collect(path)
+
+    assert stats.events == 9
+    tables = format_tables(stats)
+    assert "shell" in tables and "second" in tables
@@ -1,4 +1,7 @@
 import asyncio
+import copy
+import inspect
+import json
 import os
 import typing as t
 from abc import ABC, abstractmethod
@@ -6,13 +9,18 @@ from abc import ABC, abstractmethod
 from loguru import logger
 from pydantic import BaseModel
 
+from nerve.generation.message import History, Message
 from nerve.runtime import state
-from nerve.tools.protocol import get_tool_response, get_tool_schema
+from nerve.tools.process import run_in_thread
+from nerve.tools.protocol import get_timeout, get_tool_response, get_tool_schema, is_serial
+
+# default max number of tool calls from the same response executed concurrently
+DEFAULT_TOOL_CONCURRENCY: int = 8
 
 
 class WindowStrategy(ABC):
     @abstractmethod
-    async def get_window(self, history: list[dict[str, t.Any]]) -> list[dict[str, t.Any]]:
+    async def get_window(self, history: list[Message]) -> list[Message]:
         pass
 
     @abstractmethod
@@ -24,6 +32,24 @@ class Usage(BaseModel):
     prompt_tokens: int
     completion_tokens: int
     total_tokens: int
+    # prompt tokens served from the provider prompt cache
+    cached_tokens: int = 0
+    # time spent loading the model, in seconds (reported by ollama)
+    load_duration: float = 0.0
+    # time spent processing the prompt, in seconds (reported by ollama)
+    prompt_eval_duration: float = 0.0
+    # time spent generating the response, in seconds
+    eval_duration: float = 0.0
+    # time until the first token was received when streaming, until the whole response otherwise, in seconds
+    time_to_first_token: float = 0.0
+    # time until the whole response was received, in seconds
+    total_duration: float = 0.0
+
+    def add(self, other: "Usage") -> None:
+        """Accumulate the token counts and timings of another usage into this one."""
+
+        for field in type(self).model_fields:
+            setattr(self, field, getattr(self, field) + getattr(other, field))
 
 
 class Engine(ABC):
@@ -38,8 +64,11 @@ class Engine(ABC):
 
         self._parse_generator_params()
 
-        self.history: list[dict[str, t.Any]] = []
+        self.history = History()
         self.window_strategy = window_strategy
+        # position of the engine among the copies created by fork (e.g. "0.2" for the third copy of the first one)
+        self.fork_id: str | None = None
+        self._forks = 0
 
         self.tools = {fn.__name__: fn for fn in (tools or [])}
         self.tools_schemas = []
@@ -48,6 +77,29 @@ class Engine(ABC):
                 raise ValueError(f"Tool {tool_name} has no docstring")
             self.tools_schemas.append(get_tool_schema(tool_fn))
 
+        # last result of _get_extended_tooling_schema and the extra tools it was built for
+        self._extended_tooling_key: tuple[tuple[str, t.Callable[..., t.Any]], ...] = ()
+        self._extended_tooling_schema: list[dict[str, t.Any]] | None = None
+
+    def fork(self) -> "Engine":
+        """Create a copy of the engine sharing its tools and configuration, with an empty history."""
+
+        engine = copy.copy(self)
+        engine.history = History()
+        engine.fork_id = f"{self.fork_id}.{self._forks}" if self.fork_id is not None else str(self._forks)
+        engine._forks = 0
+        self._forks += 1
+        return engine
+
+    @property
+    def history(self) -> list[Message]:
+        return self._history
+
+    @history.setter
+    def history(self, history: list[Message]) -> None:
+        # the window strategies can keep state about a history by weakly referencing it
+        self._history = history if isinstance(history, History) else History(history)
+
     def _parse_generator_params(self) -> None:
         if "?" in self.generator_id:
             # split generator_id by '?' and parse the right part as query parameters
@@ -77,7 +129,51 @@ class Engine(ABC):
         else:
             self.api_base = None
 
+        # set per-request timeout (in seconds) from parameters or environment variable
+        timeout = self._pop_option("timeout", "GENERATOR_TIMEOUT")
+        self.timeout: float | None = float(timeout) if timeout is not None else None
+
+        # enable streaming mode from parameters or environment variable
+        self.stream = self._pop_flag("stream", "GENERATOR_STREAM")
+
+        # keep a stable prompt prefix so that it can be cached by the provider, from parameters or environment variable
+        self.prompt_cache = self._pop_flag("prompt_cache", "GENERATOR_PROMPT_CACHE")
+
+        # max number of tool calls from the same response executed concurrently
+        tool_concurrency = self._pop_option("tool_concurrency", "GENERATOR_TOOL_CONCURRENCY")
+        self.tool_concurrency = int(tool_concurrency) if tool_concurrency is not None else DEFAULT_TOOL_CONCURRENCY
+
+        # deadline of the tool calls (in seconds) not setting their own
+        tool_timeout = self._pop_option("tool_timeout", "GENERATOR_TOOL_TIMEOUT")
+        self.tool_timeout: float | None = float(tool_timeout) if tool_timeout is not None else None
+
+        # latency percentile of the recent requests after which a duplicate request is sent
+        hedge = self._pop_option("hedge", "GENERATOR_HEDGE")
+        self.hedge = float(hedge) if hedge is not None else None
+
+        # client side limits of requests and (estimated) tokens per minute, shared by every engine using the generator
+        rpm = self._pop_option("rpm", "GENERATOR_RPM")
+        self.rpm = float(rpm) if rpm is not None else None
+        tpm = self._pop_option("tpm", "GENERATOR_TPM")
+        self.tpm = float(tpm) if tpm is not None else None
+
+    def _pop_option(self, name: str, env_var: str) -> t.Any | None:
+        """Remove a nerve specific option from the generator parameters, falling back to the environment."""
+
+        if name in self.generator_params:
+            return self.generator_params.pop(name)
+
+        return os.environ.get(env_var)
+
+    def _pop_flag(self, name: str, env_var: str) -> bool:
+        return str(self._pop_option(name, env_var) or "").lower() in ("1", "true", "yes")
+
     def _get_extended_tooling_schema(self, extra_tools: dict[str, t.Callable[..., t.Any]]) -> list[dict[str, t.Any]]:
+        # extra tools rarely change between steps, reuse the last schema list if they didn't
+        extra_tools_key = tuple(extra_tools.items())
+        if self._extended_tooling_schema is not None and extra_tools_key == self._extended_tooling_key:
+            return self._extended_tooling_schema
+
         tools_schemas = self.tools_schemas.copy()
         extra_schemas = []
 
@@ -93,6 +189,9 @@ class Engine(ABC):
         logger.trace(tools_schemas)
         logger.debug(f"{len(tools_schemas)} tools")
 
+        self._extended_tooling_key = extra_tools_key
+        self._extended_tooling_schema = tools_schemas
+
         return tools_schemas
 
     def _get_text_response(self, content: str) -> dict[str, t.Any]:
@@ -124,27 +223,64 @@ class Engine(ABC):
             "content": f"The tool {tool_name} is not available.",
         }
 
+    def _is_serial_tool(self, tool_name: str, extra_tools: dict[str, t.Callable[..., t.Any]]) -> bool:
+        tool_fn = self.tools.get(tool_name, extra_tools.get(tool_name, None))
+        return tool_fn is not None and is_serial(tool_fn)
+
+    async def _call_tool(
+        self,
+        tool_call_id: str,
+        tool_name: str,
+        arguments: t.Any,
+        extra_tools: dict[str, t.Callable[..., t.Any]],
+    ) -> list[dict[str, t.Any]]:
+        # resolve tool
+        tool_fn = self.tools.get(tool_name, extra_tools.get(tool_name, None))
+        if tool_fn is None:
+            # unknown tool
+            return [self._get_unknown_tool_response(tool_call_id, tool_name)]
+
+        tool_args = json.loads(arguments) if isinstance(arguments, str) else arguments
+        # execute tool and collect response
+        return await self._get_tool_response(tool_call_id, tool_name, tool_fn, tool_args)
+
+    async def _run_tool(self, tool_fn: t.Callable[..., t.Any], tool_args: dict[str, t.Any]) -> t.Any:
+        if inspect.iscoroutinefunction(inspect.unwrap(tool_fn)):
+            tool_response = tool_fn(**tool_args)
+        else:
+            # run blocking tools in a thread so they don't stall the event loop (and can overlap with a
+            # streaming generation), if cancelled the thread keeps running but the process can still exit
+            tool_response = await run_in_thread(tool_fn, **tool_args)
+
+        # check if the tool function returned a coroutine
+        if asyncio.iscoroutine(tool_response):
+            tool_response = await tool_response
+
+        return tool_response
+
     async def _get_tool_response(
         self, tool_call_id: str, tool_name: str, tool_fn: t.Callable[..., t.Any], tool_args: dict[str, t.Any]
     ) -> list[dict[str, t.Any]]:
         logger.debug(f"calling tool: {tool_name} with args: {tool_args}")
+        tool_timeout = get_timeout(tool_fn) or self.tool_timeout
         try:
-            tool_response = tool_fn(**tool_args)
-            # check if the tool function returned a coroutine
-            if asyncio.iscoroutine(tool_response):
-                tool_response = await tool_response
+            tool_response = await asyncio.wait_for(self._run_tool(tool_fn, tool_args), tool_timeout)
 
         except Exception as e:
+            error = str(e)
+            if tool_timeout is not None and isinstance(e, (TimeoutError, asyncio.TimeoutError)):  # noqa: UP041
+                error = f"timed out after {tool_timeout} seconds"
+
             state.on_event(
                 "tool_error",
                 {
                     "generator": self.generator_id,
                     "tool_name": tool_name,
                     "args": tool_args,
-                    "error": e,
+                    "error": error,
                 },
             )
-            tool_response = f"ERROR while executing tool {tool_name}: {e}"
+            tool_response = f"ERROR while executing tool {tool_name}: {error}"
 
         generated_response = get_tool_response(tool_response)
         if isinstance(generated_response, str):
@@ -191,5 +327,15 @@ class Engine(ABC):
         system_prompt: str | None,
         user_prompt: str,
         extra_tools: dict[str, t.Callable[..., t.Any]] | None = None,
+        context: str | None = None,
     ) -> Usage:
+        """
+        Perform one generation step.
+
+        Args:
+            system_prompt: The system prompt.
+            user_prompt: The user prompt (the task).
+            extra_tools: Tools registered at runtime.
+            context: Volatile information appended after the conversation history (used when prompt_cache is set).
+        """
         pass
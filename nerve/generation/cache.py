@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import json
+import pathlib
+import sqlite3
+import threading
+import time
+import typing as t
+
+from loguru import logger
+
+# default max size of the cache, in bytes
+DEFAULT_MAX_SIZE: int = 256 * 1024 * 1024
+
+
+def _json_default(o: t.Any) -> t.Any:
+    if hasattr(o, "model_dump"):
+        return o.model_dump()
+    elif hasattr(o, "__dict__"):
+        return o.__dict__
+    return str(o)
+
+
+class ResponseCache:
+    """
+    A persistent cache of generator responses backed by SQLite, evicting the least recently used
+    entries once the total size exceeds max_size bytes. Identical requests running at the same
+    time are coalesced into a single upstream request.
+    """
+
+    def __init__(self, path: pathlib.Path, max_size: int = DEFAULT_MAX_SIZE) -> None:
+        self.path = path
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "  key TEXT PRIMARY KEY,"
+            "  value TEXT NOT NULL,"
+            "  size INTEGER NOT NULL,"
+            "  accessed_at REAL NOT NULL"
+            ")"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._db.commit()
+        # requests in flight by key
+        self._inflight: dict[str, asyncio.Future[dict[str, t.Any]]] = {}
+
+    @staticmethod
+    def key(
+        generator_id: str,
+        generator_params: dict[str, t.Any],
+        messages: list[dict[str, t.Any]],
+        tools: list[dict[str, t.Any]] | None,
+    ) -> str:
+        """Compute a stable key for a request."""
+
+        raw = json.dumps(
+            {
+                "generator": generator_id,
+                "params": generator_params,
+                "messages": messages,
+                "tools": tools or [],
+            },
+            sort_keys=True,
+            separators=(",", ":"),
+            default=_json_default,
+        )
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key: str) -> dict[str, t.Any] | None:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+
+            self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+
+        return t.cast(dict[str, t.Any], json.loads(row[0]))
+
+    def put(self, key: str, value: dict[str, t.Any]) -> None:
+        data = json.dumps(value, default=_json_default)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, data, len(data), time.time()),
+            )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self) -> None:
+        total_size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total_size <= self.max_size:
+            return
+
+        evicted = 0
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY accessed_at ASC").fetchall():
+            if total_size <= self.max_size:
+                break
+
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total_size -= size
+            evicted += 1
+
+        logger.debug(f"response cache: evicted {evicted} entries")
+
+    async def get_or_generate(
+        self, key: str, generate: t.Callable[[], t.Awaitable[dict[str, t.Any]]]
+    ) -> tuple[bool, dict[str, t.Any]]:
+        """
+        Return the cached response for key, or the result of generate() after storing it.
+        The first element of the returned tuple is True if the response was not generated by this call.
+        """
+
+        while True:
+            cached = await asyncio.to_thread(self.get, key)
+            if cached is not None:
+                return True, cached
+
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+
+            # an identical request is already running, wait for its response (without cancelling it if
+            # this call is cancelled)
+            await asyncio.wait([inflight])
+            if not inflight.cancelled():
+                return True, inflight.result()
+
+            # the caller that started it was cancelled, run the request in its place
+            logger.debug("response cache: coalesced request cancelled, retrying")
+
+        future: asyncio.Future[dict[str, t.Any]] = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            response = await generate()
+            await asyncio.to_thread(self.put, key, response)
+            future.set_result(response)
+            return False, response
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # retrieve the exception so it's not reported as never retrieved if nobody is waiting
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+# the active response cache, if enabled
+_cache: ResponseCache | None = None
+
+
+def enable(path: pathlib.Path, max_size: int = DEFAULT_MAX_SIZE) -> ResponseCache:
+    """Enable caching of generator responses to a local file."""
+
+    global _cache
+
+    _cache = ResponseCache(path.absolute(), max_size)
+    logger.info(f"💾 caching responses to {_cache.path}")
+    return _cache
+
+
+def disable() -> None:
+    """Disable caching of generator responses."""
+
+    global _cache
+
+    if _cache is not None:
+        _cache.close()
+        _cache = None
+
+
+def get() -> ResponseCache | None:
+    """Get the active response cache, if enabled."""
+
+    return _cache
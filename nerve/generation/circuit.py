@@ -0,0 +1,91 @@
+import asyncio
+import os
+import time
+
+# consecutive failures after which a generator is considered unhealthy
+DEFAULT_FAILURE_THRESHOLD: int = int(os.getenv("NERVE_CIRCUIT_FAILURES", "3"))
+# seconds an unhealthy generator receives no traffic for
+DEFAULT_COOL_DOWN: float = float(os.getenv("NERVE_CIRCUIT_COOL_DOWN", "30"))
+
+# http status codes worth retrying with another generator
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+class CircuitBreaker:
+    """
+    Tracks the health of a generator. After failure_threshold consecutive failures the circuit opens
+    and no request should be sent for cool_down seconds, after which a single trial request is allowed:
+    if it succeeds the circuit closes, otherwise it opens again.
+    """
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD, cool_down: float = DEFAULT_COOL_DOWN):
+        self.failure_threshold = failure_threshold
+        self.cool_down = cool_down
+        self.failures = 0
+        self.opened_at: float | None = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def remaining(self) -> float:
+        """Seconds until a trial request is allowed, 0 if it is already allowed."""
+
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.cool_down - time.monotonic())
+
+    def allow(self) -> bool:
+        """Return True if a request can be sent."""
+
+        if self.opened_at is None:
+            return True
+
+        if self.remaining() > 0:
+            return False
+
+        # half open, let a single trial request through and wait another cool-down before the next one
+        self.opened_at = time.monotonic()
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Return True if the error is a transient provider failure (rate limits, server errors, timeouts)."""
+
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):  # noqa: UP041
+        return True
+
+    status_code = getattr(error, "status_code", None)
+    if isinstance(status_code, int):
+        return status_code in RETRYABLE_STATUS_CODES or status_code >= 500
+
+    # litellm and httpx connection and timeout errors
+    return type(error).__name__ in ("APIConnectionError", "Timeout", "ConnectError", "ReadTimeout", "ConnectTimeout")
+
+
+# circuit breakers by generator, shared by every engine of the process
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get(generator_id: str) -> CircuitBreaker:
+    """Get the circuit breaker of a generator."""
+
+    breaker = _breakers.get(generator_id)
+    if breaker is None:
+        breaker = _breakers[generator_id] = CircuitBreaker()
+    return breaker
+
+
+def reset() -> None:
+    """Forget the health of every generator."""
+
+    _breakers.clear()
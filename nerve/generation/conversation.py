@@ -1,23 +1,62 @@
+import asyncio
+import json
+import os
 import typing as t
+import weakref
 
 from loguru import logger
 
 from nerve.generation import WindowStrategy
+from nerve.generation.message import Message
+from nerve.runtime import state
+
+# generator used by default to summarize the messages falling out of the window
+DEFAULT_SUMMARY_GENERATOR: str = os.getenv("NERVE_SUMMARY_GENERATOR", "openai/gpt-4o-mini")
+
+SUMMARY_PROMPT: str = """You maintain a concise summary of a conversation between an agent and its tools.
+Update the current summary with the new messages, keeping every fact, result, decision and open question
+that could be useful to continue the task. Reply only with the updated summary.
+
+## Current Summary
+
+{summary}
+
+## New Messages
+
+{messages}"""
 
 
 class FullHistoryStrategy(WindowStrategy):
-    async def get_window(self, history: list[dict[str, t.Any]]) -> list[dict[str, t.Any]]:
+    async def get_window(self, history: list[Message]) -> list[Message]:
         return history
 
     def __str__(self) -> str:
         return "<full history>"
 
 
+def _include_tool_call(history: list[Message], idx_actual: int) -> int:
+    """Move the start of a window backwards so that it doesn't begin with responses to a tool call left out of it."""
+
+    logger.debug(f"idx_actual={idx_actual}")
+    while idx_actual > 0:
+        item = history[idx_actual]
+
+        logger.debug(f"  item={item}")
+        # if the item is not a tool response, it means it is a tool call
+        # and everything we have after it is a response for it, so we're done.
+        if not isinstance(item, (Message, dict)) or item.get("role") != "tool":
+            break
+        # keep going backwards until we find a tool call
+        idx_actual -= 1
+
+    return idx_actual
+
+
 class SlidingWindowStrategy(WindowStrategy):
     def __init__(self, window_size: int = 10) -> None:
         self.window_size = window_size
 
-    async def get_window(self, history: list[dict[str, t.Any]]) -> list[dict[str, t.Any]]:
+    async def get_window(self, history: list[Message]) -> list[Message]:
         history_size = len(history)
         if history_size <= self.window_size:
             return history
@@ -36,19 +75,7 @@ class SlidingWindowStrategy(WindowStrategy):
         #   to a preceeding message with 'tool_calls'.
         #
         # So we start from there and go backwards until we include everything we need.
-        idx_actual = history_size - self.window_size
-        logger.debug(f"idx_actual={idx_actual}")
-        while idx_actual > 0:
-            item = history[idx_actual]
-
-            logger.debug(f"  item={item}")
-            # if the item is not a tool response (as dictionary), it means
-            # it is a tool call and everything we have after it is a response
-            # for it, so we're done.
-            if not isinstance(item, dict) or item.get("role") != "tool":
-                break
-            # keep going backwards until we find a tool call
-            idx_actual -= 1
+        idx_actual = _include_tool_call(history, history_size - self.window_size)
 
         window = history[idx_actual:]
 
@@ -63,10 +90,194 @@ class SlidingWindowStrategy(WindowStrategy):
         return f"<sliding window of size {self.window_size}>"
 
 
+def estimate_tokens(text: str) -> int:
+    """Rough, tokenizer independent estimation of the number of tokens in a text (~4 characters per token)."""
+
+    return (len(text) + 3) // 4
+
+
+def _get_content_text(content: t.Any) -> str:
+    if isinstance(content, list):
+        # multi part content, only count the text (images are billed differently by each provider)
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+
+    return str(content or "")
+
+
+def _get_message_text(message: t.Any) -> str:
+    if isinstance(message, Message):
+        text = _get_content_text(message.content)
+        for tool_call in message.tool_calls or ():
+            text += f" {tool_call.name} {tool_call.arguments}"
+        return text
+
+    if not isinstance(message, dict):
+        return str(message)
+
+    text = _get_content_text(message.get("content"))
+    for tool_call in message.get("tool_calls") or []:
+        function = tool_call.get("function") if isinstance(tool_call, dict) else getattr(tool_call, "function", None)
+        if isinstance(function, dict):
+            text += f" {function.get('name', '')} {json.dumps(function.get('arguments', ''))}"
+        elif function is not None:
+            text += f" {function.name} {function.arguments}"
+
+    return text
+
+
+class TokenBudgetStrategy(WindowStrategy):
+    """
+    Keep the most recent messages fitting in a budget of tokens, measured with a pluggable tokenizer
+    (a function returning the number of tokens of a text, a rough estimation by default).
+    """
+
+    def __init__(self, max_tokens: int, tokenizer: t.Callable[[str], int] = estimate_tokens) -> None:
+        self.max_tokens = max_tokens
+        self.tokenizer = tokenizer
+        # token counts of the messages, by id (the message is kept to make sure the id is not reused)
+        self._counts: dict[int, tuple[t.Any, int]] = {}
+
+    def _count(self, message: t.Any, counts: dict[int, tuple[t.Any, int]]) -> int:
+        cached = self._counts.get(id(message))
+        if cached is not None and cached[0] is message:
+            count = cached[1]
+        else:
+            count = self.tokenizer(_get_message_text(message))
+
+        counts[id(message)] = (message, count)
+        return count
+
+    async def get_window(self, history: list[Message]) -> list[Message]:
+        # only keep the counts of the messages we look at, older ones won't be part of a window again
+        counts: dict[int, tuple[t.Any, int]] = {}
+        total = 0
+        idx_actual = len(history)
+
+        while idx_actual > 0:
+            tokens = self._count(history[idx_actual - 1], counts)
+            # always include at least the last message
+            if total + tokens > self.max_tokens and idx_actual < len(history):
+                break
+
+            total += tokens
+            idx_actual -= 1
+
+        self._counts = counts
+
+        if idx_actual == 0:
+            return history
+
+        # see SlidingWindowStrategy, tool responses need their tool call
+        idx_actual = _include_tool_call(history, idx_actual)
+        window = history[idx_actual:]
+
+        logger.debug(f"max_tokens={self.max_tokens}, tokens={total}, window_size_actual={len(window)}")
+
+        return window
+
+    def __str__(self) -> str:
+        return f"<token budget window of {self.max_tokens} tokens>"
+
+
+class _Summary:
+    def __init__(self) -> None:
+        # the running summary
+        self.text = ""
+        # number of messages from the beginning of the history folded into the summary
+        self.folded = 0
+        # the background summarization task
+        self.task: asyncio.Task[None] | None = None
+
+
+class SummarizingWindowStrategy(WindowStrategy):
+    """
+    Wraps another window strategy, folding the messages that fall out of its window into a running summary
+    that is sent as a single leading message. The summary is updated incrementally in the background
+    (only with the newly dropped messages) by a configurable, ideally cheaper, generator.
+
+    The summaries are kept until their history is garbage collected, histories must therefore support weak
+    references (see History).
+    """
+
+    def __init__(self, window: WindowStrategy, generator: str = DEFAULT_SUMMARY_GENERATOR) -> None:
+        self.window = window
+        self.generator = generator
+        # running summaries by history id (the same strategy can be shared by multiple agents)
+        self._summaries: dict[int, _Summary] = {}
+        self._engine: t.Any | None = None
+
+    def _get_engine(self) -> t.Any:
+        if self._engine is None:
+            # import here to avoid circular import
+            from nerve.generation.litellm import LiteLLMEngine
+
+            self._engine = LiteLLMEngine(self.generator, FullHistoryStrategy())
+
+        return self._engine
+
+    async def _fold(self, summary: _Summary, history: list[Message], upto: int) -> None:
+        messages = "\n\n".join(
+            f"[{message.get('role', 'unknown') if isinstance(message, (Message, dict)) else 'unknown'}] {_get_message_text(message)}"
+            for message in history[summary.folded : upto]
+        )
+        prompt = SUMMARY_PROMPT.format(summary=summary.text or "(empty)", messages=messages)
+
+        try:
+            usage, message = await self._get_engine()._generate([{"role": "user", "content": prompt}], None)
+        except Exception as e:
+            logger.error(f"error summarizing conversation: {e}")
+            return
+
+        summary.text = str(message.content or "").strip()
+        summary.folded = upto
+
+        state.on_event(
+            "conversation_summarized",
+            {
+                "generator": self.generator,
+                "messages": summary.folded,
+                "usage": usage,
+            },
+        )
+
+    async def get_window(self, history: list[Message]) -> list[Message]:
+        window = await self.window.get_window(history)
+        dropped = len(history) - len(window)
+
+        summary = self._summaries.get(id(history))
+        if summary is None:
+            summary = self._summaries[id(history)] = _Summary()
+            # forget the summary (before the id can be reused) once the history is released
+            weakref.finalize(history, self._summaries.pop, id(history), None)
+
+        if dropped > summary.folded and (summary.task is None or summary.task.done()):
+            # fold the new dropped messages in the background, the next steps will use the updated summary
+            summary.task = asyncio.create_task(self._fold(summary, history, dropped))
+
+        if not summary.text:
+            return window
+
+        return [Message(role="user", content=f"Summary of the earlier conversation:\n\n{summary.text}")] + window
+
+    def __str__(self) -> str:
+        return f"<summarizing {self.window} with {self.generator}>"
+
+
 def strategy_from_string(strategy: str) -> WindowStrategy:
+    if strategy.startswith("summary:"):
+        # summary:<window>[@<generator>]
+        window, _, generator = strategy.removeprefix("summary:").partition("@")
+        return SummarizingWindowStrategy(strategy_from_string(window), generator or DEFAULT_SUMMARY_GENERATOR)
+
     if strategy == "full":
         return FullHistoryStrategy()
     elif strategy.isdigit():
         return SlidingWindowStrategy(int(strategy))
+    elif strategy[:-1].isdigit() and strategy[-1].lower() == "k":
+        # token budget, in thousands of tokens
+        return TokenBudgetStrategy(int(strategy[:-1]) * 1000)
+    elif strategy[:-1].isdigit() and strategy[-1].lower() == "t":
+        # token budget, in tokens
+        return TokenBudgetStrategy(int(strategy[:-1]))
     else:
         raise ValueError(f"Invalid conversation strategy: {strategy}")
@@ -0,0 +1,100 @@
+import asyncio
+import typing as t
+
+from loguru import logger
+
+from nerve.runtime import state
+
+# executes a single tool call given its id, name and raw arguments, returning the response messages
+ToolCallHandler = t.Callable[[str, str, t.Any], t.Awaitable[list[dict[str, t.Any]]]]
+
+
+class ToolCallDispatcher:
+    """
+    Schedules tool calls as soon as they are available (while the model is still generating when streaming)
+    and collects their response messages in the same order the model requested them.
+
+    Up to max_concurrency calls run at the same time. A call to a serial tool acts as a barrier: it starts
+    once every call submitted before it is done, and no call submitted after it starts before it is done.
+    Once the active task is done, calls that did not start yet are skipped.
+    """
+
+    def __init__(
+        self,
+        handler: ToolCallHandler,
+        max_concurrency: int = 1,
+        is_serial: t.Callable[[str], bool] | None = None,
+    ) -> None:
+        self._handler = handler
+        self._is_serial = is_serial or (lambda _: False)
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self._tasks: list[asyncio.Task[list[dict[str, t.Any]]]] = []
+        # the last serial call, every call submitted after it waits for it
+        self._barrier: asyncio.Task[list[dict[str, t.Any]]] | None = None
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def submit(self, tool_call_id: str, tool_name: str, arguments: t.Any) -> None:
+        """Schedule a tool call."""
+
+        # as with sequential execution, the first call always runs
+        skip_if_done = bool(self._tasks)
+
+        if self._is_serial(tool_name):
+            # wait for everything submitted so far
+            self._barrier = asyncio.create_task(
+                self._run(list(self._tasks), tool_call_id, tool_name, arguments, skip_if_done, exclusive=True)
+            )
+            self._tasks.append(self._barrier)
+        else:
+            wait_for = [self._barrier] if self._barrier else []
+            self._tasks.append(
+                asyncio.create_task(
+                    self._run(wait_for, tool_call_id, tool_name, arguments, skip_if_done, exclusive=False)
+                )
+            )
+
+    async def _run(
+        self,
+        wait_for: list[asyncio.Task[list[dict[str, t.Any]]]],
+        tool_call_id: str,
+        tool_name: str,
+        arguments: t.Any,
+        skip_if_done: bool,
+        exclusive: bool,
+    ) -> list[dict[str, t.Any]]:
+        if wait_for:
+            # wait without propagating errors, collect() will
+            await asyncio.wait(wait_for)
+
+        if exclusive:
+            return await self._call(tool_call_id, tool_name, arguments, skip_if_done)
+
+        async with self._semaphore:
+            return await self._call(tool_call_id, tool_name, arguments, skip_if_done)
+
+    async def _call(
+        self, tool_call_id: str, tool_name: str, arguments: t.Any, skip_if_done: bool
+    ) -> list[dict[str, t.Any]]:
+        if skip_if_done and state.is_active_task_done():
+            # break early from multiple tool calls
+            logger.debug(f"task done, skipping tool call {tool_name}")
+            return []
+
+        return await self._handler(tool_call_id, tool_name, arguments)
+
+    async def collect(self) -> list[dict[str, t.Any]]:
+        """Wait for every submitted tool call and return their responses in submission order."""
+
+        responses: list[dict[str, t.Any]] = []
+        for task_responses in await asyncio.gather(*self._tasks):
+            responses.extend(task_responses)
+
+        return responses
+
+    def cancel(self) -> None:
+        """Cancel any pending tool call."""
+
+        for task in self._tasks:
+            task.cancel()
@@ -0,0 +1,54 @@
+import collections
+import math
+
+# number of recent requests the latency percentiles are computed on
+DEFAULT_WINDOW: int = 100
+# minimum number of requests before percentiles are reported
+MIN_SAMPLES: int = 5
+
+
+class LatencyTracker:
+    """Keeps the latencies of the most recent requests to a generator."""
+
+    def __init__(self, window: int = DEFAULT_WINDOW) -> None:
+        self._samples: collections.deque[float] = collections.deque(maxlen=window)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, latency: float) -> None:
+        self._samples.append(latency)
+
+    def percentile(self, p: float) -> float | None:
+        """Return the p-th percentile (0-100) of the recent latencies, or None if there are not enough samples."""
+
+        if len(self._samples) < MIN_SAMPLES:
+            return None
+
+        return percentile(sorted(self._samples), p)
+
+
+def percentile(ordered: list[float], p: float) -> float:
+    """Return the p-th percentile (0-100) of a non empty sorted list, using the nearest rank."""
+
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+# latency trackers by generator, shared by every engine of the process
+_trackers: dict[str, LatencyTracker] = {}
+
+
+def get(generator_id: str) -> LatencyTracker:
+    """Get the latency tracker of a generator."""
+
+    tracker = _trackers.get(generator_id)
+    if tracker is None:
+        tracker = _trackers[generator_id] = LatencyTracker()
+    return tracker
+
+
+def reset() -> None:
+    """Forget the latencies of every generator."""
+
+    _trackers.clear()
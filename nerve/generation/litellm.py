@@ -1,22 +1,35 @@
+import asyncio
 import json
+import time
 import typing as t
 import uuid
 
 import litellm
 from loguru import logger
 
-from nerve.generation import Engine, Usage, WindowStrategy
+from nerve.generation import Engine, Usage, WindowStrategy, cache, circuit, latency, ratelimit
+from nerve.generation.conversation import estimate_tokens
+from nerve.generation.dispatcher import ToolCallDispatcher
+from nerve.generation.message import Message, ToolCall, to_wire
 from nerve.runtime import state
+from nerve.runtime.events import actor_name
 
 
 class LiteLLMEngine(Engine):
     def __init__(
         self,
-        generator_id: str,
+        generator_id: str | list[str],
         window_strategy: WindowStrategy,
         tools: list[t.Callable[..., t.Any]] | None = None,
     ):
-        super().__init__(generator_id, window_strategy, tools)
+        # an ordered list of generators can be used, failing over to the next one when a generator is unavailable
+        generators = [generator_id] if isinstance(generator_id, str) else list(generator_id)
+        if not generators:
+            raise ValueError("no generator specified")
+
+        super().__init__(generators[0], window_strategy, tools)
+
+        self.fallbacks = [LiteLLMEngine(generator, window_strategy, tools) for generator in generators[1:]]
 
         # until this is not fixed, ollama needs special treatment: https://github.com/BerriAI/litellm/issues/6353
         self.is_ollama = "ollama" in self.generator_id
@@ -30,13 +43,225 @@ class LiteLLMEngine(Engine):
             import ollama
 
             self.ollama_model = self.generator_id.split("/")[-1]
-            self.ollama_client = ollama.AsyncClient(host=self.api_base)
+            self.ollama_client = ollama.AsyncClient(host=self.api_base, timeout=self.timeout)
 
             logger.debug(f"using ollama client for model {self.ollama_model}")
 
     async def _generate(
+        self,
+        conversation: list[dict[str, t.Any]],
+        tooling: list[dict[str, t.Any]] | None,
+        on_tool_call: t.Callable[[str, str, t.Any], None] | None = None,
+    ) -> tuple[Usage, Message]:
+        if not self.fallbacks:
+            return await self._generate_cached(conversation, tooling, on_tool_call)
+
+        dispatched = False
+
+        def on_tool_call_tracked(tool_call_id: str, tool_name: str, arguments: t.Any) -> None:
+            nonlocal dispatched
+            dispatched = True
+            if on_tool_call:
+                on_tool_call(tool_call_id, tool_name, arguments)
+
+        chain = [self, *self.fallbacks]
+        last_error: Exception | None = None
+        for attempt in range(2):
+            for engine in chain:
+                breaker = circuit.get(engine.generator_id)
+                if not breaker.allow():
+                    logger.debug(f"circuit open for {engine.generator_id}, skipping")
+                    continue
+
+                try:
+                    result = await engine._generate_cached(conversation, tooling, on_tool_call_tracked)
+                except Exception as e:
+                    # once tool calls are running, the response can't be generated again by another generator
+                    if dispatched or not circuit.is_retryable(e):
+                        raise
+
+                    breaker.record_failure()
+                    state.on_event(
+                        "generator_failed",
+                        {
+                            "generator": engine.generator_id,
+                            "error": str(e),
+                            "circuit_open": breaker.is_open,
+                        },
+                    )
+                    logger.debug(f"generator {engine.generator_id} failed: {e}")
+                    last_error = e
+                    continue
+
+                breaker.record_success()
+                return result
+
+            if attempt == 0 and last_error is None:
+                # every circuit is open, wait for the first one to allow a trial request
+                cool_down = min(circuit.get(engine.generator_id).remaining() for engine in chain)
+                logger.warning(f"all generators are unavailable, waiting {cool_down:.1f}s")
+                await asyncio.sleep(cool_down)
+            else:
+                break
+
+        raise last_error or RuntimeError("all generators are unavailable")
+
+    async def _generate_cached(
+        self,
+        conversation: list[dict[str, t.Any]],
+        tooling: list[dict[str, t.Any]] | None,
+        on_tool_call: t.Callable[[str, str, t.Any], None] | None = None,
+    ) -> tuple[Usage, Message]:
+        response_cache = cache.get()
+        if response_cache is None:
+            return await self._generate_hedged(conversation, tooling, on_tool_call)
+
+        async def generate() -> dict[str, t.Any]:
+            usage, message = await self._generate_hedged(conversation, tooling, on_tool_call)
+            return {"usage": usage.model_dump(), "message": message.to_dict()}
+
+        key = response_cache.key(
+            self.generator_id, self.generator_params | {"api_base": self.api_base}, conversation, tooling
+        )
+        cached, response = await response_cache.get_or_generate(key, generate)
+        if cached:
+            state.on_event("response_cached", {"generator": self.generator_id, "key": key})
+            # nothing was spent for this response
+            usage = Usage(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+        else:
+            usage = Usage(**response["usage"])
+
+        return usage, Message.from_dict(response["message"])
+
+    def _get_usage(self, usage: t.Any) -> Usage:
+        # litellm reports the prompt tokens read from the provider cache (including anthropic's
+        # cache_read_input_tokens) as prompt_tokens_details.cached_tokens
+        details = getattr(usage, "prompt_tokens_details", None)
+        return Usage(
+            prompt_tokens=usage.prompt_tokens,
+            completion_tokens=usage.completion_tokens,
+            total_tokens=usage.total_tokens,
+            cached_tokens=getattr(details, "cached_tokens", None) or 0,
+        )
+
+    def _get_hedge_delay(self) -> float | None:
+        if self.hedge is None or self.stream:
+            # tool calls of a streamed response are executed while it is received, it can't be duplicated
+            return None
+
+        return latency.get(self.generator_id).percentile(self.hedge)
+
+    def _get_hedge_engine(self) -> "LiteLLMEngine":
+        # prefer the first healthy fallback generator, if any
+        for engine in self.fallbacks[:1]:
+            if not engine.stream and not circuit.get(engine.generator_id).is_open:
+                return engine
+
+        return self
+
+    async def _generate_hedged(
+        self,
+        conversation: list[dict[str, t.Any]],
+        tooling: list[dict[str, t.Any]] | None,
+        on_tool_call: t.Callable[[str, str, t.Any], None] | None = None,
+    ) -> tuple[Usage, Message]:
+        delay = self._get_hedge_delay()
+        if delay is None:
+            return await self._generate_uncached(conversation, tooling, on_tool_call)
+
+        primary = asyncio.create_task(self._generate_uncached(conversation, tooling, on_tool_call))
+        hedge: asyncio.Task[tuple[Usage, Message]] | None = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result()
+
+            # the primary request is slower than usual, send a duplicate and take the first response
+            hedge_engine = self._get_hedge_engine()
+            state.on_event(
+                "request_hedged",
+                {
+                    "generator": self.generator_id,
+                    "hedge_generator": hedge_engine.generator_id,
+                    "delay": delay,
+                },
+            )
+            hedge = asyncio.create_task(hedge_engine._generate_uncached(conversation, tooling, on_tool_call))
+
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+
+            # both failed
+            return primary.result()
+        finally:
+            primary.cancel()
+            if hedge is not None:
+                hedge.cancel()
+
+    async def _wait_rate_limit(
         self, conversation: list[dict[str, t.Any]], tooling: list[dict[str, t.Any]] | None
-    ) -> tuple[Usage, t.Any]:
+    ) -> tuple[ratelimit.RateLimiter | None, int]:
+        if self.rpm is None and self.tpm is None:
+            return None, 0
+
+        limiter = ratelimit.get(self.generator_id, self.rpm, self.tpm)
+        tokens = estimate_tokens(json.dumps(conversation, default=str))
+        if tooling:
+            tokens += estimate_tokens(json.dumps(tooling))
+
+        wait = limiter.reserve(tokens)
+        if wait > 0:
+            state.on_event(
+                "rate_limited",
+                {
+                    "generator": self.generator_id,
+                    "wait": wait,
+                    "estimated_tokens": tokens,
+                },
+            )
+            await asyncio.sleep(wait)
+
+        return limiter, tokens
+
+    async def _generate_uncached(
+        self,
+        conversation: list[dict[str, t.Any]],
+        tooling: list[dict[str, t.Any]] | None,
+        on_tool_call: t.Callable[[str, str, t.Any], None] | None = None,
+    ) -> tuple[Usage, Message]:
+        limiter, estimated_tokens = await self._wait_rate_limit(conversation, tooling)
+
+        if self.stream:
+            request = self._request_stream(conversation, tooling, on_tool_call or (lambda *_: None))
+        else:
+            request = self._request(conversation, tooling)
+
+        try:
+            # the request is awaited (never blocking the event loop) and bounded by the configured
+            # timeout, cancelling the task that is running this step will abort the in-flight request
+            started_at = time.perf_counter()
+            usage, message = await asyncio.wait_for(request, timeout=self.timeout)
+            usage.total_duration = time.perf_counter() - started_at
+            if not self.stream:
+                # the whole response is received at once
+                usage.time_to_first_token = usage.total_duration
+
+            latency.get(self.generator_id).record(usage.total_duration)
+            if limiter is not None and usage.total_tokens:
+                # the estimation only covered the prompt
+                limiter.adjust_tokens(usage.total_tokens - estimated_tokens)
+
+            return usage, message
+        except asyncio.TimeoutError as e:  # noqa: UP041 (not an alias of TimeoutError on python 3.10)
+            raise TimeoutError(f"generation with {self.generator_id} timed out after {self.timeout} seconds") from e
+
+    async def _request(
+        self, conversation: list[dict[str, t.Any]], tooling: list[dict[str, t.Any]] | None
+    ) -> tuple[Usage, Message]:
         if self.is_ollama:
             # https://github.com/BerriAI/litellm/issues/6353
             response = await self.ollama_client.chat(
@@ -45,57 +270,267 @@ class LiteLLMEngine(Engine):
                 tools=tooling,
                 **self.generator_params,
             )
-            return Usage(
-                prompt_tokens=0,
-                completion_tokens=0,
-                total_tokens=0,
-            ), response.message
+            return self._get_ollama_usage(response), Message.from_provider(response.message)
         else:
             try:
                 # litellm.set_verbose = True
-                response = litellm.completion(
+                response = await litellm.acompletion(
                     model=self.generator_id,
                     messages=conversation,
                     tools=tooling,
                     tool_choice="auto" if tooling else None,
                     api_base=self.api_base,
+                    timeout=self.timeout,
                     **self.generator_params,
                 )
 
-                return Usage(
-                    prompt_tokens=response.usage.prompt_tokens,
-                    completion_tokens=response.usage.completion_tokens,
-                    total_tokens=response.usage.total_tokens,
-                ), response.choices[0].message
+                return self._get_usage(response.usage), Message.from_provider(response.choices[0].message)
             except litellm.AuthenticationError as e:  # type: ignore
                 logger.error(e)
                 exit(1)
 
+    def _get_ollama_usage(self, response: t.Any) -> Usage:
+        # ollama reports durations in nanoseconds
+        prompt_tokens = response.prompt_eval_count or 0
+        completion_tokens = response.eval_count or 0
+        return Usage(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+            load_duration=(response.load_duration or 0) / 1e9,
+            prompt_eval_duration=(response.prompt_eval_duration or 0) / 1e9,
+            eval_duration=(response.eval_duration or 0) / 1e9,
+        )
+
+    def _on_text_delta(self, delta: str) -> None:
+        state.on_event(
+            "text_delta",
+            {
+                "generator": self.generator_id,
+                "delta": delta,
+            },
+        )
+
+    def _on_tool_call_ready(
+        self, on_tool_call: t.Callable[[str, str, t.Any], None], tool_call_id: str, tool_name: str, arguments: t.Any
+    ) -> None:
+        state.on_event(
+            "tool_call_ready",
+            {
+                "generator": self.generator_id,
+                "tool_call_id": tool_call_id,
+                "tool_name": tool_name,
+                "args": arguments,
+            },
+        )
+        on_tool_call(tool_call_id, tool_name, arguments)
+
+    async def _request_stream(
+        self,
+        conversation: list[dict[str, t.Any]],
+        tooling: list[dict[str, t.Any]] | None,
+        on_tool_call: t.Callable[[str, str, t.Any], None],
+    ) -> tuple[Usage, Message]:
+        usage = Usage(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+        content: list[str] = []
+        started_at = time.perf_counter()
+        first_token_at: float | None = None
+
+        if self.is_ollama:
+            ollama_calls: list[ToolCall] = []
+            async for chunk in await self.ollama_client.chat(
+                model=self.ollama_model,
+                messages=conversation,
+                tools=tooling,
+                stream=True,
+                **self.generator_params,
+            ):
+                if first_token_at is None and (chunk.message.content or chunk.message.tool_calls):
+                    first_token_at = time.perf_counter()
+
+                if chunk.done:
+                    # the last chunk carries the counters for the whole response
+                    usage = self._get_ollama_usage(chunk)
+
+                if chunk.message.content:
+                    content.append(chunk.message.content)
+                    self._on_text_delta(chunk.message.content)
+
+                # ollama sends each tool call in one piece
+                for tool_call in chunk.message.tool_calls or []:
+                    ollama_call = ToolCall(str(uuid.uuid4()), tool_call.function.name, tool_call.function.arguments)
+                    ollama_calls.append(ollama_call)
+                    self._on_tool_call_ready(on_tool_call, ollama_call.id, ollama_call.name, ollama_call.arguments)
+
+            usage.time_to_first_token = (first_token_at or time.perf_counter()) - started_at
+            return usage, Message(role="assistant", content="".join(content), tool_calls=tuple(ollama_calls))
+
+        try:
+            response = await litellm.acompletion(
+                model=self.generator_id,
+                messages=conversation,
+                tools=tooling,
+                tool_choice="auto" if tooling else None,
+                api_base=self.api_base,
+                timeout=self.timeout,
+                stream=True,
+                stream_options={"include_usage": True},
+                **self.generator_params,
+            )
+        except litellm.AuthenticationError as e:  # type: ignore
+            logger.error(e)
+            exit(1)
+
+        # tool calls being received, by index
+        partial_calls: dict[int, dict[str, t.Any]] = {}
+
+        def dispatch_if_ready(call: dict[str, t.Any], done: bool) -> None:
+            if call["dispatched"]:
+                return
+
+            if not done:
+                # a prefix of a JSON object is never a valid JSON object, so once the
+                # arguments parse the model is done with them
+                try:
+                    json.loads(call["arguments"] or "-")
+                except json.JSONDecodeError:
+                    return
+
+            call["dispatched"] = True
+            self._on_tool_call_ready(on_tool_call, call["id"], call["name"], call["arguments"] or "{}")
+
+        async for chunk in response:
+            chunk_usage = getattr(chunk, "usage", None)
+            if chunk_usage:
+                usage = self._get_usage(chunk_usage)
+
+            if not chunk.choices:
+                continue
+
+            delta = chunk.choices[0].delta
+            if first_token_at is None and (delta.content or delta.tool_calls):
+                first_token_at = time.perf_counter()
+
+            if delta.content:
+                content.append(delta.content)
+                self._on_text_delta(delta.content)
+
+            for tool_call_delta in delta.tool_calls or []:
+                index = tool_call_delta.index or 0
+                if index not in partial_calls:
+                    # a new tool call started, every previous one is complete
+                    for previous in partial_calls.values():
+                        dispatch_if_ready(previous, done=True)
+
+                    partial_calls[index] = {
+                        "id": tool_call_delta.id or str(uuid.uuid4()),
+                        "name": "",
+                        "arguments": "",
+                        "dispatched": False,
+                    }
+
+                partial = partial_calls[index]
+                if tool_call_delta.function.name:
+                    partial["name"] += tool_call_delta.function.name
+                if tool_call_delta.function.arguments:
+                    partial["arguments"] += tool_call_delta.function.arguments
+                    if "}" in tool_call_delta.function.arguments:
+                        dispatch_if_ready(partial, done=False)
+
+        for partial in partial_calls.values():
+            dispatch_if_ready(partial, done=True)
+
+        finished_at = time.perf_counter()
+        usage.time_to_first_token = (first_token_at or finished_at) - started_at
+        usage.eval_duration = finished_at - (first_token_at or finished_at)
+
+        tool_calls = tuple(
+            ToolCall(partial["id"], partial["name"], partial["arguments"] or "{}")
+            for _, partial in sorted(partial_calls.items())
+        )
+
+        return usage, Message(role="assistant", content="".join(content), tool_calls=tool_calls)
+
+    def _add_cache_breakpoints(self, conversation: list[dict[str, t.Any]]) -> None:
+        """
+        Mark the end of the system prompt and of the conversation history as cache breakpoints for
+        providers requiring it (anthropic models), others cache the longest stable prefix automatically.
+        """
+        if "anthropic" not in self.generator_id and "claude" not in self.generator_id:
+            return
+
+        # the system prompt and the last message of the (stable) history
+        breakpoints = [0, len(conversation) - 1]
+        for idx in sorted(set(breakpoints)):
+            message = conversation[idx]
+            if isinstance(message.get("content"), str) and message["content"]:
+                conversation[idx] = message | {
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": message["content"],
+                            "cache_control": {"type": "ephemeral"},
+                        }
+                    ]
+                }
+
     async def step(
         self,
         system_prompt: str | None,
         user_prompt: str,
         extra_tools: dict[str, t.Callable[..., t.Any]] | None = None,
+        context: str | None = None,
     ) -> Usage:
         # system prompt and user prompt always included
         conversation = [{"role": "system", "content": system_prompt}] if system_prompt else []
         conversation.append({"role": "user", "content": user_prompt})
-        conversation.extend(await self.window_strategy.get_window(self.history))
+        # history messages are only converted to the wire format here
+        conversation.extend(to_wire(message) for message in await self.window_strategy.get_window(self.history))
+
+        if self.prompt_cache:
+            self._add_cache_breakpoints(conversation)
+
+        if context:
+            # volatile information goes last so that it doesn't invalidate the cached prefix
+            conversation.append({"role": "user", "content": context})
 
         # build json schema for available tools
         extra_tools = extra_tools or {}
         tooling = self._get_extended_tooling_schema(extra_tools) or None
+        # tool calls are executed concurrently by the dispatcher, in streaming mode as soon as they are received
+        dispatcher = ToolCallDispatcher(
+            lambda tool_call_id, tool_name, arguments: self._call_tool(tool_call_id, tool_name, arguments, extra_tools),
+            max_concurrency=self.tool_concurrency,
+            is_serial=lambda tool_name: self._is_serial_tool(tool_name, extra_tools),
+        )
         try:
             # get message
-            usage, message = await self._generate(conversation, tooling)
+            usage, message = await self._generate(conversation, tooling, dispatcher.submit)
+        except asyncio.CancelledError:
+            logger.debug(f"generation with {self.generator_id} cancelled")
+            dispatcher.cancel()
+            raise
         except Exception as e:
             logger.error(e)
+            dispatcher.cancel()
             return Usage(
                 prompt_tokens=0,
                 completion_tokens=0,
                 total_tokens=0,
             )
 
+        # recorded so that the run can be replayed without the generator (see ReplayEngine)
+        state.on_event(
+            "assistant_message",
+            {
+                "generator": self.generator_id,
+                "actor": actor_name(state.get_current_actor()),
+                # copies of the same agent (map elements) step concurrently
+                "fork": self.fork_id,
+                "message": message.to_dict(),
+            },
+        )
+
         responses: list[dict[str, t.Any]] = []
         if tooling and not message.tool_calls:
             # no tool calls
@@ -103,31 +538,17 @@ class LiteLLMEngine(Engine):
 
         elif message.tool_calls:
             logger.debug(message.tool_calls)
-            # for each tool call
-            for tool_call in message.tool_calls:
-                # resolve tool
-                tool_call_id = tool_call.id if hasattr(tool_call, "id") else str(uuid.uuid4())
-                tool_name = tool_call.function.name or ""
-                tool_fn = self.tools.get(tool_name, extra_tools.get(tool_name, None))
-                if tool_fn is None:
-                    # unknown tool
-                    responses.append(self._get_unknown_tool_response(tool_call_id, tool_name))
-                else:
-                    tool_call_args = (
-                        json.loads(tool_call.function.arguments)
-                        if isinstance(tool_call.function.arguments, str)
-                        else tool_call.function.arguments
-                    )
-                    # execute tool and collect response
-                    responses.extend(await self._get_tool_response(tool_call_id, tool_name, tool_fn, tool_call_args))
+            if not dispatcher:
+                # not dispatched while streaming, schedule each tool call
+                for tool_call in message.tool_calls:
+                    dispatcher.submit(tool_call.id, tool_call.name, tool_call.arguments)
 
-                if state.is_active_task_done():
-                    # break early from multiple tool calls
-                    logger.debug(f"task {self.generator_id} complete")
-                    break
+            responses = await dispatcher.collect()
+            if state.is_active_task_done():
+                logger.debug(f"task {self.generator_id} complete")
 
         # add tool call + per-call response messages
-        self.history.append(message.__dict__)
-        self.history.extend(responses)
+        self.history.append(message)
+        self.history.extend(Message.from_dict(response) for response in responses)
 
         return usage
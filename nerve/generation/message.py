@@ -0,0 +1,153 @@
+import sys
+import typing as t
+import uuid
+
+
+class ToolCall:
+    """A tool call requested by the model."""
+
+    __slots__ = ("id", "name", "arguments")
+
+    def __init__(self, id: str, name: str, arguments: t.Any) -> None:
+        self.id = id
+        self.name = sys.intern(name)
+        # raw arguments as received from the provider (a JSON string, or a dictionary for ollama)
+        self.arguments = arguments
+
+    def to_dict(self) -> dict[str, t.Any]:
+        return {"id": self.id, "name": self.name, "arguments": self.arguments}
+
+    def to_wire(self) -> dict[str, t.Any]:
+        return {
+            "id": self.id,
+            "type": "function",
+            "function": {"name": self.name, "arguments": self.arguments},
+        }
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, ToolCall) and self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        return f"ToolCall({self.name}, {self.arguments!r})"
+
+
+class Message:
+    """
+    Compact representation of a message of the conversation history, only converted to the
+    provider wire format when building a request. Empty fields and provider specific extras
+    are not stored.
+    """
+
+    __slots__ = ("role", "content", "tool_calls", "tool_call_id", "name")
+
+    def __init__(
+        self,
+        role: str,
+        content: t.Any = None,
+        tool_calls: tuple[ToolCall, ...] | None = None,
+        tool_call_id: str | None = None,
+        name: str | None = None,
+    ) -> None:
+        # roles and tool names repeat for every message, share a single copy of each
+        self.role = sys.intern(role)
+        self.tool_calls = tool_calls or None
+        # assistant messages that only carry tool calls are sent with a null content, any
+        # other empty content (e.g. the response of a tool returning an image) is kept as is
+        self.content = None if content == "" and self.tool_calls else content
+        self.tool_call_id = tool_call_id or None
+        self.name = sys.intern(name) if name else None
+
+    @classmethod
+    def from_provider(cls, message: t.Any) -> "Message":
+        """Create a message from an assistant message as returned by litellm or ollama."""
+
+        return cls(
+            role="assistant",
+            content=message.content,
+            tool_calls=tuple(
+                ToolCall(
+                    # ollama doesn't assign ids to tool calls
+                    getattr(tool_call, "id", None) or str(uuid.uuid4()),
+                    tool_call.function.name or "",
+                    tool_call.function.arguments,
+                )
+                for tool_call in message.tool_calls or []
+            ),
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict[str, t.Any]) -> "Message":
+        """Create a message from its wire format or the output of to_dict."""
+
+        tool_calls: list[ToolCall] = []
+        for call in data.get("tool_calls") or []:
+            if "function" in call:
+                tool_calls.append(
+                    ToolCall(
+                        call.get("id") or str(uuid.uuid4()), call["function"]["name"], call["function"]["arguments"]
+                    )
+                )
+            else:
+                tool_calls.append(ToolCall(call["id"], call["name"], call["arguments"]))
+
+        return cls(
+            role=data.get("role", "assistant"),
+            content=data.get("content"),
+            tool_calls=tuple(tool_calls),
+            tool_call_id=data.get("tool_call_id"),
+            name=data.get("name"),
+        )
+
+    def to_dict(self) -> dict[str, t.Any]:
+        """Compact serializable representation, without empty fields."""
+
+        data: dict[str, t.Any] = {"role": self.role}
+        if self.content is not None:
+            data["content"] = self.content
+        if self.tool_calls:
+            data["tool_calls"] = [tool_call.to_dict() for tool_call in self.tool_calls]
+        if self.tool_call_id:
+            data["tool_call_id"] = self.tool_call_id
+        if self.name:
+            data["name"] = self.name
+        return data
+
+    def to_wire(self) -> dict[str, t.Any]:
+        """Convert to the format expected by the providers."""
+
+        # content is always sent, some providers reject assistant messages without it
+        wire: dict[str, t.Any] = {"role": self.role, "content": self.content}
+        if self.tool_calls:
+            wire["tool_calls"] = [tool_call.to_wire() for tool_call in self.tool_calls]
+        if self.tool_call_id:
+            wire["tool_call_id"] = self.tool_call_id
+        if self.name:
+            wire["name"] = self.name
+        return wire
+
+    def get(self, key: str, default: t.Any = None) -> t.Any:
+        """Dictionary like access to the fields of the message."""
+
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        return default if value is None else value
+
+    def __getitem__(self, key: str) -> t.Any:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Message) and self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        return f"Message({self.to_dict()!r})"
+
+
+class History(list[Message]):
+    """The conversation history of an engine, unlike a plain list it can be weakly referenced."""
+
+
+def to_wire(message: Message | dict[str, t.Any]) -> dict[str, t.Any]:
+    """Convert a message of the history to the provider wire format."""
+
+    return message.to_wire() if isinstance(message, Message) else message
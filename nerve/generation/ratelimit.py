@@ -0,0 +1,85 @@
+import time
+
+
+class TokenBucket:
+    """
+    A token bucket refilled at a constant rate up to its capacity. Amounts are reserved immediately (the
+    level can go below zero) and the caller waits for the deficit to be refilled, so that concurrent
+    callers are served in order without locking.
+    """
+
+    def __init__(self, capacity: float, per_second: float) -> None:
+        self.capacity = capacity
+        self.per_second = per_second
+        self.level = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.per_second)
+        self.updated_at = now
+
+    def reserve(self, amount: float) -> float:
+        """Take amount from the bucket and return how many seconds to wait before using it."""
+
+        self._refill()
+        self.level -= amount
+        return 0.0 if self.level >= 0 else -self.level / self.per_second
+
+    def adjust(self, amount: float) -> None:
+        """Take (or give back, if negative) an amount without waiting for it, to correct a previous estimation."""
+
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+class RateLimiter:
+    """Limits the requests per minute and the (estimated) tokens per minute sent to a generator."""
+
+    def __init__(self, rpm: float | None = None, tpm: float | None = None) -> None:
+        self.requests: TokenBucket | None = None
+        self.tokens: TokenBucket | None = None
+        self.configure(rpm, tpm)
+
+    def configure(self, rpm: float | None, tpm: float | None) -> None:
+        if rpm and (self.requests is None or self.requests.capacity != rpm):
+            self.requests = TokenBucket(rpm, rpm / 60)
+        if tpm and (self.tokens is None or self.tokens.capacity != tpm):
+            self.tokens = TokenBucket(tpm, tpm / 60)
+
+    def reserve(self, tokens: int) -> float:
+        """Reserve a request of the given number of tokens, returning how many seconds to wait before sending it."""
+
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(tokens))
+        return wait
+
+    def adjust_tokens(self, tokens: int) -> None:
+        """Account for the difference between the actual and the estimated tokens of a request."""
+
+        if self.tokens is not None:
+            self.tokens.adjust(tokens)
+
+
+# rate limiters by generator, shared by every engine of the process
+_limiters: dict[str, RateLimiter] = {}
+
+
+def get(generator_id: str, rpm: float | None = None, tpm: float | None = None) -> RateLimiter:
+    """Get the rate limiter of a generator, updating its limits if specified."""
+
+    limiter = _limiters.get(generator_id)
+    if limiter is None:
+        limiter = _limiters[generator_id] = RateLimiter(rpm, tpm)
+    else:
+        limiter.configure(rpm, tpm)
+    return limiter
+
+
+def reset() -> None:
+    """Forget the rate limiters of every generator."""
+
+    _limiters.clear()
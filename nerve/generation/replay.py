@@ -0,0 +1,65 @@
+import collections
+import pathlib
+import typing as t
+
+from loguru import logger
+
+from nerve.generation import Engine, Usage, WindowStrategy
+from nerve.generation.litellm import LiteLLMEngine
+from nerve.generation.message import Message
+from nerve.runtime import state
+from nerve.runtime.events import actor_name
+from nerve.runtime.trace import read_events
+
+# generator prefix of the replay engine, followed by the path of the trace
+REPLAY_PREFIX = "replay://"
+
+
+def is_replay(generator_id: str | list[str]) -> bool:
+    return isinstance(generator_id, str) and generator_id.startswith(REPLAY_PREFIX)
+
+
+class ReplayEngine(LiteLLMEngine):
+    """
+    Returns the assistant messages recorded in a trace (by the assistant_message events) instead of
+    contacting a generator. The conversation, tool schemas and tool calls are handled exactly as for
+    the recorded run, so that an agent can be executed offline to measure the runtime overhead.
+    """
+
+    def __init__(
+        self,
+        generator_id: str,
+        window_strategy: WindowStrategy,
+        tools: list[t.Callable[..., t.Any]] | None = None,
+    ):
+        # no generator to check or connect to
+        Engine.__init__(self, generator_id, window_strategy, tools)
+
+        self.fallbacks = []
+        self.is_ollama = False
+        self.trace_path = pathlib.Path(self.generator_id.removeprefix(REPLAY_PREFIX))
+
+        # recorded messages by actor and copy of the engine, in order. Copies are created in the same
+        # order when the run is replayed, so each one gets the messages of the copy it replaces.
+        self.messages: dict[tuple[str | None, str | None], collections.deque[Message]] = collections.defaultdict(
+            collections.deque
+        )
+        for event in read_events(self.trace_path, only=["assistant_message"]):
+            data = event.data or {}
+            self.messages[(data.get("actor"), data.get("fork"))].append(Message.from_dict(data["message"]))
+
+        logger.debug(f"loaded {sum(len(m) for m in self.messages.values())} messages from {self.trace_path}")
+
+    async def _generate(
+        self,
+        conversation: list[dict[str, t.Any]],
+        tooling: list[dict[str, t.Any]] | None,
+        on_tool_call: t.Callable[[str, str, t.Any], None] | None = None,
+    ) -> tuple[Usage, Message]:
+        messages = self.messages[(actor_name(state.get_current_actor()), self.fork_id)]
+        if not messages:
+            state.set_task_failed(f"no more recorded messages in {self.trace_path}")
+            raise RuntimeError(f"no more recorded messages in {self.trace_path}")
+
+        # nothing was spent for this response
+        return Usage(prompt_tokens=0, completion_tokens=0, total_tokens=0), messages.popleft()
@@ -0,0 +1,103 @@
+import asyncio
+import pathlib
+import tempfile
+import typing as t
+import unittest
+
+from nerve.generation.cache import ResponseCache
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.temp_dir.name) / "cache.db"
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_key_is_stable(self) -> None:
+        messages = [{"role": "user", "content": "hi"}]
+        key = ResponseCache.key("openai/gpt-4o", {"temperature": 0.1, "top_p": 1}, messages, None)
+
+        self.assertEqual(key, ResponseCache.key("openai/gpt-4o", {"top_p": 1, "temperature": 0.1}, messages, []))
+        self.assertNotEqual(key, ResponseCache.key("openai/gpt-4o-mini", {"temperature": 0.1}, messages, None))
+
+    def test_get_or_generate_stores_response(self) -> None:
+        cache = ResponseCache(self.path)
+        calls = 0
+
+        async def generate() -> dict[str, int]:
+            nonlocal calls
+            calls += 1
+            return {"value": calls}
+
+        first = asyncio.run(cache.get_or_generate("key", generate))
+        second = asyncio.run(cache.get_or_generate("key", generate))
+        cache.close()
+
+        self.assertEqual(first, (False, {"value": 1}))
+        self.assertEqual(second, (True, {"value": 1}))
+        self.assertEqual(calls, 1)
+
+        # persisted across instances
+        self.assertEqual(ResponseCache(self.path).get("key"), {"value": 1})
+
+    def test_concurrent_requests_are_coalesced(self) -> None:
+        cache = ResponseCache(self.path)
+        calls = 0
+
+        async def generate() -> dict[str, int]:
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return {"value": calls}
+
+        async def run() -> list[tuple[bool, dict[str, t.Any]]]:
+            return await asyncio.gather(*[cache.get_or_generate("key", generate) for _ in range(5)])
+
+        results = asyncio.run(run())
+
+        self.assertEqual(calls, 1)
+        self.assertEqual([response for _, response in results], [{"value": 1}] * 5)
+        self.assertEqual(sum(1 for cached, _ in results if not cached), 1)
+
+    def test_waiters_take_over_cancelled_request(self) -> None:
+        cache = ResponseCache(self.path)
+        calls = 0
+
+        async def generate() -> dict[str, int]:
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return {"value": calls}
+
+        async def run() -> tuple[list[tuple[bool, dict[str, int]]], bool]:
+            leader = asyncio.create_task(cache.get_or_generate("key", generate))
+            await asyncio.sleep(0.01)
+            waiters = [asyncio.create_task(cache.get_or_generate("key", generate)) for _ in range(3)]
+            await asyncio.sleep(0.01)
+
+            leader.cancel()
+            await asyncio.wait([leader])
+            return await asyncio.gather(*waiters), leader.cancelled()
+
+        results, leader_cancelled = asyncio.run(run())
+
+        # only the leader is cancelled, one of the waiters runs the request for the others
+        self.assertTrue(leader_cancelled)
+        self.assertEqual(calls, 2)
+        self.assertEqual([response for _, response in results], [{"value": 2}] * 3)
+        self.assertEqual(sum(1 for cached, _ in results if not cached), 1)
+
+    def test_least_recently_used_entries_are_evicted(self) -> None:
+        cache = ResponseCache(self.path, max_size=50)
+
+        cache.put("a", {"data": "a" * 10})
+        cache.put("b", {"data": "b" * 10})
+        # access a, so that b is the least recently used
+        cache.get("a")
+        cache.put("c", {"data": "c" * 10})
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
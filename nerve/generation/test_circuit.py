@@ -0,0 +1,67 @@
+import unittest
+from unittest.mock import patch
+
+from nerve.generation.circuit import CircuitBreaker, is_retryable
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code: int) -> None:
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_after_consecutive_failures(self) -> None:
+        breaker = CircuitBreaker(failure_threshold=2, cool_down=10)
+
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+
+        self.assertTrue(breaker.is_open)
+        self.assertFalse(breaker.allow())
+
+    def test_success_resets_failures(self) -> None:
+        breaker = CircuitBreaker(failure_threshold=2, cool_down=10)
+
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+
+        self.assertFalse(breaker.is_open)
+
+    @patch("nerve.generation.circuit.time.monotonic")
+    def test_single_trial_after_cool_down(self, mock_monotonic: unittest.mock.MagicMock) -> None:
+        breaker = CircuitBreaker(failure_threshold=1, cool_down=10)
+        mock_monotonic.return_value = 100.0
+        breaker.record_failure()
+
+        mock_monotonic.return_value = 105.0
+        self.assertFalse(breaker.allow())
+        self.assertEqual(breaker.remaining(), 5.0)
+
+        mock_monotonic.return_value = 111.0
+        self.assertTrue(breaker.allow())
+        # only one trial request
+        self.assertFalse(breaker.allow())
+
+        # the trial failed
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        mock_monotonic.return_value = 122.0
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.is_open)
+
+
+class TestIsRetryable(unittest.TestCase):
+    def test_retryable_errors(self) -> None:
+        self.assertTrue(is_retryable(TimeoutError()))
+        self.assertTrue(is_retryable(_StatusError(429)))
+        self.assertTrue(is_retryable(_StatusError(503)))
+
+    def test_non_retryable_errors(self) -> None:
+        self.assertFalse(is_retryable(_StatusError(400)))
+        self.assertFalse(is_retryable(ValueError("invalid")))
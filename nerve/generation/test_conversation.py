@@ -1,19 +1,24 @@
 import asyncio
+import gc
 import typing as t
 import unittest
-from unittest.mock import patch
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
 
 from nerve.generation.conversation import (
     FullHistoryStrategy,
     SlidingWindowStrategy,
+    SummarizingWindowStrategy,
+    TokenBudgetStrategy,
     strategy_from_string,
 )
+from nerve.generation.message import History, Message, ToolCall
 
 
 class TestFullHistoryStrategy(unittest.TestCase):
     def test_get_window_returns_full_history(self) -> None:
         strategy = FullHistoryStrategy()
-        history = [{"role": "user", "content": "Hello"}, {"role": "assistant", "content": "Hi"}]
+        history = [Message(role="user", content="Hello"), Message(role="assistant", content="Hi")]
 
         result = asyncio.run(strategy.get_window(history))
 
@@ -24,7 +29,7 @@ class TestFullHistoryStrategy(unittest.TestCase):
 class TestSlidingWindowStrategy(unittest.TestCase):
     def test_get_window_returns_full_history_when_smaller_than_window(self) -> None:
         strategy = SlidingWindowStrategy(window_size=5)
-        history = [{"role": "user", "content": "Hello"}, {"role": "assistant", "content": "Hi"}]
+        history = [Message(role="user", content="Hello"), Message(role="assistant", content="Hi")]
 
         result = asyncio.run(strategy.get_window(history))
 
@@ -33,10 +38,10 @@ class TestSlidingWindowStrategy(unittest.TestCase):
     def test_get_window_returns_window_sized_history(self) -> None:
         strategy = SlidingWindowStrategy(window_size=2)
         history = [
-            {"role": "user", "content": "First"},
-            {"role": "user", "content": "Second"},
-            {"role": "user", "content": "Third"},
-            {"role": "user", "content": "Fourth"},
+            Message(role="user", content="First"),
+            Message(role="user", content="Second"),
+            Message(role="user", content="Third"),
+            Message(role="user", content="Fourth"),
         ]
 
         result = asyncio.run(strategy.get_window(history))
@@ -48,9 +53,9 @@ class TestSlidingWindowStrategy(unittest.TestCase):
     def test_get_window_logs_messages(self, mock_debug: unittest.mock.Mock) -> None:
         strategy = SlidingWindowStrategy(window_size=2)
         history = [
-            {"role": "user", "content": "First"},
-            {"role": "assistant", "content": "First response"},
-            {"role": "user", "content": "Second"},
+            Message(role="user", content="First"),
+            Message(role="assistant", content="First response"),
+            Message(role="user", content="Second"),
         ]
 
         asyncio.run(strategy.get_window(history))
@@ -78,6 +83,117 @@ class TestSlidingWindowStrategy(unittest.TestCase):
         self.assertEqual(str(strategy), "<sliding window of size 10>")
 
 
+class TestTokenBudgetStrategy(unittest.TestCase):
+    def test_get_window_returns_full_history_when_within_budget(self) -> None:
+        strategy = TokenBudgetStrategy(max_tokens=100)
+        history = [Message(role="user", content="Hello"), Message(role="assistant", content="Hi")]
+
+        result = asyncio.run(strategy.get_window(history))
+
+        self.assertEqual(result, history)
+
+    def test_get_window_trims_by_tokens(self) -> None:
+        strategy = TokenBudgetStrategy(max_tokens=10, tokenizer=len)
+        history = [
+            Message(role="user", content="x" * 50),
+            Message(role="user", content="abcd"),
+            Message(role="user", content="efgh"),
+        ]
+
+        result = asyncio.run(strategy.get_window(history))
+
+        self.assertEqual(result, history[1:])
+
+    def test_get_window_always_includes_last_message(self) -> None:
+        strategy = TokenBudgetStrategy(max_tokens=10, tokenizer=len)
+        history = [Message(role="user", content="short"), Message(role="tool", content="x" * 50, tool_call_id="1")]
+        history.insert(1, Message(role="assistant", content="", tool_calls=(ToolCall("1", "tool", "{}"),)))
+
+        result = asyncio.run(strategy.get_window(history))
+
+        # the tool response is kept along with its tool call
+        self.assertEqual(result, history[1:])
+
+    def test_token_counts_are_memoized(self) -> None:
+        counted: list[str] = []
+
+        def tokenizer(text: str) -> int:
+            counted.append(text)
+            return len(text)
+
+        strategy = TokenBudgetStrategy(max_tokens=100, tokenizer=tokenizer)
+        history = [Message(role="user", content="Hello"), Message(role="assistant", content="Hi")]
+
+        asyncio.run(strategy.get_window(history))
+        history.append(Message(role="user", content="Again"))
+        asyncio.run(strategy.get_window(history))
+
+        self.assertEqual(counted, ["Hi", "Hello", "Again"])
+
+    def test_str_representation(self) -> None:
+        self.assertEqual(str(TokenBudgetStrategy(16000)), "<token budget window of 16000 tokens>")
+
+
+class TestSummarizingWindowStrategy(unittest.TestCase):
+    def test_dropped_messages_are_folded_incrementally(self) -> None:
+        engine = MagicMock()
+        engine._generate = AsyncMock(
+            side_effect=[
+                (MagicMock(), SimpleNamespace(content="summary 1")),
+                (MagicMock(), SimpleNamespace(content="summary 2")),
+            ]
+        )
+        strategy = SummarizingWindowStrategy(SlidingWindowStrategy(window_size=2), generator="test/cheap")
+        strategy._engine = engine
+        history = History(Message(role="user", content=f"message {i}") for i in range(4))
+
+        async def run() -> list[list[Message]]:
+            windows = [await strategy.get_window(history)]
+            # let the background summarization complete
+            await asyncio.sleep(0)
+            windows.append(await strategy.get_window(history))
+            history.append(Message(role="user", content="message 4"))
+            windows.append(await strategy.get_window(history))
+            await asyncio.sleep(0)
+            windows.append(await strategy.get_window(history))
+            return windows
+
+        windows = asyncio.run(run())
+
+        # no summary yet
+        self.assertEqual(windows[0], history[2:4])
+        self.assertEqual(windows[1][0]["content"], "Summary of the earlier conversation:\n\nsummary 1")
+        self.assertEqual(windows[1][1:], history[2:4])
+        self.assertEqual(windows[3][0]["content"], "Summary of the earlier conversation:\n\nsummary 2")
+        self.assertEqual(windows[3][1:], history[3:])
+
+        # the second summarization only received the newly dropped message
+        second_prompt = engine._generate.call_args_list[1].args[0][0]["content"]
+        self.assertIn("summary 1", second_prompt)
+        self.assertIn("message 2", second_prompt)
+        self.assertNotIn("message 1", second_prompt)
+
+    def test_summaries_are_released_with_their_history(self) -> None:
+        engine = MagicMock()
+        engine._generate = AsyncMock(return_value=(MagicMock(), SimpleNamespace(content="summary")))
+        strategy = SummarizingWindowStrategy(SlidingWindowStrategy(window_size=1), generator="test/cheap")
+        strategy._engine = engine
+
+        async def run() -> None:
+            # histories of forked engines and map items
+            for i in range(10):
+                history = History(Message(role="user", content=f"message {i}-{j}") for j in range(3))
+                await strategy.get_window(history)
+                await asyncio.sleep(0)
+                self.assertEqual(len(strategy._summaries), 1)
+
+                del history
+                gc.collect()
+                self.assertEqual(strategy._summaries, {})
+
+        asyncio.run(run())
+
+
 class TestStrategyFromString(unittest.TestCase):
     def test_full_strategy(self) -> None:
         strategy = strategy_from_string("full")
@@ -88,6 +204,20 @@ class TestStrategyFromString(unittest.TestCase):
         self.assertIsInstance(strategy, SlidingWindowStrategy)
         self.assertEqual(t.cast(SlidingWindowStrategy, strategy).window_size, 5)
 
+    def test_token_budget_strategy(self) -> None:
+        strategy = strategy_from_string("16k")
+        self.assertIsInstance(strategy, TokenBudgetStrategy)
+        self.assertEqual(t.cast(TokenBudgetStrategy, strategy).max_tokens, 16000)
+
+        strategy = strategy_from_string("500t")
+        self.assertEqual(t.cast(TokenBudgetStrategy, strategy).max_tokens, 500)
+
+    def test_summarizing_strategy(self) -> None:
+        strategy = t.cast(SummarizingWindowStrategy, strategy_from_string("summary:16k@ollama/llama3:8b"))
+        self.assertIsInstance(strategy, SummarizingWindowStrategy)
+        self.assertIsInstance(strategy.window, TokenBudgetStrategy)
+        self.assertEqual(strategy.generator, "ollama/llama3:8b")
+
     def test_invalid_strategy(self) -> None:
         with self.assertRaises(ValueError):
             strategy_from_string("invalid")
@@ -0,0 +1,78 @@
+import asyncio
+import typing as t
+import unittest
+
+from nerve.generation.dispatcher import ToolCallDispatcher
+from nerve.runtime import state
+
+
+class TestToolCallDispatcher(unittest.TestCase):
+    def setUp(self) -> None:
+        state.reset()
+
+    def tearDown(self) -> None:
+        state.reset()
+
+    def _run(self, dispatcher_factory: t.Callable[[], ToolCallDispatcher], calls: list[str]) -> list[t.Any]:
+        async def run() -> list[t.Any]:
+            dispatcher = dispatcher_factory()
+            for idx, name in enumerate(calls):
+                dispatcher.submit(f"call_{idx}", name, {})
+            return await dispatcher.collect()
+
+        return asyncio.run(run())
+
+    def test_calls_run_concurrently_and_keep_order(self) -> None:
+        running = 0
+        max_running = 0
+
+        async def handler(tool_call_id: str, tool_name: str, arguments: t.Any) -> list[dict[str, t.Any]]:
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            # later calls finish first
+            await asyncio.sleep(0.05 - int(tool_call_id.split("_")[1]) * 0.01)
+            running -= 1
+            return [{"tool_call_id": tool_call_id, "role": "tool", "content": tool_name}]
+
+        responses = self._run(lambda: ToolCallDispatcher(handler, max_concurrency=3), ["a", "b", "c", "d", "e"])
+
+        self.assertEqual([r["tool_call_id"] for r in responses], [f"call_{i}" for i in range(5)])
+        self.assertEqual(max_running, 3)
+
+    def test_serial_tools_are_barriers(self) -> None:
+        log: list[str] = []
+
+        async def handler(tool_call_id: str, tool_name: str, arguments: t.Any) -> list[dict[str, t.Any]]:
+            log.append(f"start:{tool_name}")
+            await asyncio.sleep(0.01)
+            log.append(f"end:{tool_name}")
+            return [{"tool_call_id": tool_call_id, "role": "tool", "content": tool_name}]
+
+        self._run(
+            lambda: ToolCallDispatcher(handler, max_concurrency=8, is_serial=lambda name: name == "serial"),
+            ["a", "b", "serial", "c"],
+        )
+
+        serial_start = log.index("start:serial")
+        self.assertIn("end:a", log[:serial_start])
+        self.assertIn("end:b", log[:serial_start])
+        self.assertEqual(log[serial_start + 1], "end:serial")
+        self.assertEqual(log[-2:], ["start:c", "end:c"])
+
+    def test_calls_after_task_completion_are_skipped(self) -> None:
+        called: list[str] = []
+
+        async def handler(tool_call_id: str, tool_name: str, arguments: t.Any) -> list[dict[str, t.Any]]:
+            called.append(tool_name)
+            if tool_name == "complete":
+                state.set_task_complete()
+            return [{"tool_call_id": tool_call_id, "role": "tool", "content": tool_name}]
+
+        responses = self._run(
+            lambda: ToolCallDispatcher(handler, max_concurrency=8, is_serial=lambda name: name == "complete"),
+            ["a", "complete", "b", "c"],
+        )
+
+        self.assertEqual(called, ["a", "complete"])
+        self.assertEqual([r["content"] for r in responses], ["a", "complete"])
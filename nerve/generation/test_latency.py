@@ -0,0 +1,28 @@
+import unittest
+
+from nerve.generation.latency import LatencyTracker
+
+
+class TestLatencyTracker(unittest.TestCase):
+    def test_no_percentile_without_enough_samples(self) -> None:
+        tracker = LatencyTracker()
+        tracker.record(1.0)
+
+        self.assertIsNone(tracker.percentile(95))
+
+    def test_percentile(self) -> None:
+        tracker = LatencyTracker()
+        for i in range(1, 101):
+            tracker.record(float(i))
+
+        self.assertEqual(tracker.percentile(50), 50.0)
+        self.assertEqual(tracker.percentile(95), 95.0)
+        self.assertEqual(tracker.percentile(100), 100.0)
+
+    def test_only_recent_samples_are_kept(self) -> None:
+        tracker = LatencyTracker(window=5)
+        for latency in [100.0] * 5 + [1.0] * 5:
+            tracker.record(latency)
+
+        self.assertEqual(len(tracker), 5)
+        self.assertEqual(tracker.percentile(99), 1.0)
@@ -0,0 +1,313 @@
+import asyncio
+import typing as t
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from nerve.generation import circuit, latency, ratelimit
+from nerve.generation.conversation import FullHistoryStrategy
+from nerve.generation.litellm import LiteLLMEngine
+from nerve.generation.message import Message
+from nerve.tools.protocol import timeout
+
+
+def _completion_response(content: str, cached_tokens: int = 0) -> MagicMock:
+    response = MagicMock()
+    response.usage.prompt_tokens = 10
+    response.usage.completion_tokens = 5
+    response.usage.total_tokens = 15
+    response.usage.prompt_tokens_details.cached_tokens = cached_tokens
+    response.choices[0].message.content = content
+    response.choices[0].message.tool_calls = None
+    return response
+
+
+def _stream_chunk(
+    content: str | None = None, tool_call: tuple[int, str | None, str | None, str | None] | None = None
+) -> SimpleNamespace:
+    tool_calls = None
+    if tool_call:
+        index, tool_call_id, name, arguments = tool_call
+        tool_calls = [
+            SimpleNamespace(index=index, id=tool_call_id, function=SimpleNamespace(name=name, arguments=arguments))
+        ]
+
+    return SimpleNamespace(
+        usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=content, tool_calls=tool_calls))]
+    )
+
+
+class TestLiteLLMEngine(unittest.TestCase):
+    def test_timeout_parsed_from_generator_params(self) -> None:
+        engine = LiteLLMEngine("openai/gpt-4o?timeout=2.5&temperature=0.1", FullHistoryStrategy())
+
+        self.assertEqual(engine.generator_id, "openai/gpt-4o")
+        self.assertEqual(engine.timeout, 2.5)
+        self.assertEqual(engine.generator_params, {"temperature": 0.1})
+
+    def test_fork_shares_tools_with_empty_history(self) -> None:
+        engine = LiteLLMEngine("openai/gpt-4o?timeout=2.5", FullHistoryStrategy())
+        engine.history.append(Message(role="user", content="hi"))
+
+        fork = engine.fork()
+
+        self.assertEqual(fork.history, [])
+        self.assertEqual(len(engine.history), 1)
+        self.assertIs(fork.tools, engine.tools)
+        self.assertEqual(fork.timeout, 2.5)
+
+    def test_tool_timeout(self) -> None:
+        async def slow_tool() -> str:
+            """A slow tool."""
+            await asyncio.sleep(10)
+            return "done"
+
+        @timeout(0.05)
+        async def slower_tool() -> str:
+            """An even slower tool."""
+            await asyncio.sleep(20)
+            return "done"
+
+        # from the generator parameters
+        engine = LiteLLMEngine("openai/gpt-4o?tool_timeout=0.05", FullHistoryStrategy(), [slow_tool])
+        self.assertEqual(engine.tool_timeout, 0.05)
+        responses = asyncio.run(engine._call_tool("call_1", "slow_tool", "{}", {}))
+        self.assertIn("timed out after 0.05 seconds", responses[0]["content"])
+
+        # set on the tool
+        engine = LiteLLMEngine("openai/gpt-4o", FullHistoryStrategy(), [slower_tool])
+        responses = asyncio.run(engine._call_tool("call_1", "slower_tool", "{}", {}))
+        self.assertIn("timed out after 0.05 seconds", responses[0]["content"])
+
+    @patch("nerve.generation.litellm.litellm.acompletion", new_callable=AsyncMock)
+    def test_generate_uses_async_completion(self, mock_acompletion: AsyncMock) -> None:
+        mock_acompletion.return_value = _completion_response("hello")
+        engine = LiteLLMEngine("openai/gpt-4o?timeout=5", FullHistoryStrategy())
+
+        usage, message = asyncio.run(engine._generate([{"role": "user", "content": "hi"}], None))
+
+        self.assertEqual(usage.total_tokens, 15)
+        self.assertEqual(message.content, "hello")
+        self.assertEqual(mock_acompletion.call_args.kwargs["timeout"], 5)
+
+    @patch("nerve.generation.litellm.litellm.acompletion")
+    def test_generate_times_out(self, mock_acompletion: MagicMock) -> None:
+        async def never_returns(*args: object, **kwargs: object) -> None:
+            await asyncio.sleep(10)
+
+        mock_acompletion.side_effect = never_returns
+        engine = LiteLLMEngine("openai/gpt-4o?timeout=0.05", FullHistoryStrategy())
+
+        with self.assertRaises(TimeoutError):
+            asyncio.run(engine._generate([{"role": "user", "content": "hi"}], None))
+
+    @patch("nerve.generation.litellm.litellm.acompletion")
+    def test_step_does_not_block_event_loop(self, mock_acompletion: MagicMock) -> None:
+        async def slow_completion(*args: object, **kwargs: object) -> MagicMock:
+            await asyncio.sleep(0.1)
+            return _completion_response("done")
+
+        mock_acompletion.side_effect = slow_completion
+        engine = LiteLLMEngine("openai/gpt-4o", FullHistoryStrategy())
+        ticks = 0
+
+        async def ticker() -> None:
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        async def run() -> None:
+            task = asyncio.create_task(ticker())
+            await engine.step(None, "hi")
+            task.cancel()
+
+        asyncio.run(run())
+
+        self.assertGreater(ticks, 1)
+
+    @patch("nerve.generation.litellm.litellm.acompletion")
+    def test_stream_dispatches_tool_calls_before_generation_ends(self, mock_acompletion: MagicMock) -> None:
+        calls: list[str] = []
+
+        def first(value: str) -> str:
+            """First tool."""
+            calls.append(f"first:{value}")
+            return "one"
+
+        def second(value: str) -> str:
+            """Second tool."""
+            calls.append(f"second:{value}")
+            return "two"
+
+        async def stream() -> t.AsyncIterator[SimpleNamespace]:
+            yield _stream_chunk(content="thinking")
+            yield _stream_chunk(tool_call=(0, "call_1", "first", '{"value": '))
+            yield _stream_chunk(tool_call=(0, None, None, '"a"}'))
+            # give the dispatcher a chance to run the first tool while still streaming
+            await asyncio.sleep(0.1)
+            calls.append("generation:end")
+            yield _stream_chunk(tool_call=(1, "call_2", "second", '{"value": "b"}'))
+            yield SimpleNamespace(
+                usage=SimpleNamespace(prompt_tokens=3, completion_tokens=2, total_tokens=5), choices=[]
+            )
+
+        async def completion(*args: t.Any, **kwargs: t.Any) -> t.AsyncIterator[SimpleNamespace]:
+            self.assertTrue(kwargs["stream"])
+            return stream()
+
+        mock_acompletion.side_effect = completion
+        engine = LiteLLMEngine("openai/gpt-4o?stream=true", FullHistoryStrategy(), [first, second])
+
+        usage = asyncio.run(engine.step(None, "hi"))
+
+        self.assertEqual(calls, ["first:a", "generation:end", "second:b"])
+        self.assertEqual(usage.total_tokens, 5)
+        self.assertEqual([call.id for call in engine.history[0]["tool_calls"]], ["call_1", "call_2"])
+        self.assertEqual([msg["tool_call_id"] for msg in engine.history[1:]], ["call_1", "call_2"])
+        self.assertEqual([msg["content"] for msg in engine.history[1:]], ["one", "two"])
+
+    @patch("nerve.generation.litellm.litellm.acompletion", new_callable=AsyncMock)
+    def test_prompt_cache_layout(self, mock_acompletion: AsyncMock) -> None:
+        mock_acompletion.return_value = _completion_response("hello", cached_tokens=8)
+        engine = LiteLLMEngine("anthropic/claude-3-7-sonnet-20250219?prompt_cache=true", FullHistoryStrategy())
+        engine.history = [Message(role="assistant", content="previous")]
+
+        usage = asyncio.run(engine.step("system", "task", context="## Thoughts\n\nvolatile"))
+
+        messages = mock_acompletion.call_args.kwargs["messages"]
+        self.assertEqual(usage.cached_tokens, 8)
+        self.assertEqual([m["role"] for m in messages], ["system", "user", "assistant", "user"])
+        # stable prefix marked as cacheable
+        self.assertEqual(messages[0]["content"][0]["cache_control"], {"type": "ephemeral"})
+        self.assertEqual(messages[2]["content"][0]["text"], "previous")
+        self.assertEqual(messages[2]["content"][0]["cache_control"], {"type": "ephemeral"})
+        # volatile context last
+        self.assertEqual(messages[3]["content"], "## Thoughts\n\nvolatile")
+        # history is not modified
+        self.assertEqual(engine.history[0], Message(role="assistant", content="previous"))
+
+    def test_ollama_usage(self) -> None:
+        engine = LiteLLMEngine("ollama/llama3", FullHistoryStrategy())
+        engine.ollama_client.chat = AsyncMock(  # type: ignore
+            return_value=SimpleNamespace(
+                prompt_eval_count=12,
+                eval_count=8,
+                load_duration=1_000_000_000,
+                prompt_eval_duration=250_000_000,
+                eval_duration=500_000_000,
+                message=SimpleNamespace(content="hello", tool_calls=None),
+            )
+        )
+
+        usage, message = asyncio.run(engine._generate([{"role": "user", "content": "hi"}], None))
+
+        self.assertEqual((usage.prompt_tokens, usage.completion_tokens, usage.total_tokens), (12, 8, 20))
+        self.assertEqual((usage.load_duration, usage.prompt_eval_duration, usage.eval_duration), (1.0, 0.25, 0.5))
+        self.assertGreater(usage.time_to_first_token, 0)
+        self.assertEqual(message.content, "hello")
+
+    @patch("nerve.generation.litellm.litellm.acompletion")
+    def test_stream_time_to_first_token(self, mock_acompletion: MagicMock) -> None:
+        async def stream() -> t.AsyncIterator[SimpleNamespace]:
+            await asyncio.sleep(0.05)
+            yield _stream_chunk(content="hel")
+            await asyncio.sleep(0.05)
+            yield _stream_chunk(content="lo")
+
+        mock_acompletion.side_effect = AsyncMock(return_value=stream())
+        engine = LiteLLMEngine("openai/gpt-4o?stream=true", FullHistoryStrategy())
+
+        usage, message = asyncio.run(engine._generate([{"role": "user", "content": "hi"}], None))
+
+        self.assertEqual(message.content, "hello")
+        self.assertGreaterEqual(usage.time_to_first_token, 0.04)
+        self.assertGreaterEqual(usage.eval_duration, 0.04)
+
+    @patch("nerve.generation.litellm.litellm.acompletion", new_callable=AsyncMock)
+    def test_fallback_on_unavailable_generator(self, mock_acompletion: AsyncMock) -> None:
+        class ServiceUnavailable(Exception):
+            status_code = 503
+
+        async def completion(model: str, **kwargs: t.Any) -> MagicMock:
+            if model == "openai/gpt-4o":
+                raise ServiceUnavailable("overloaded")
+            return _completion_response("from fallback")
+
+        mock_acompletion.side_effect = completion
+        circuit.reset()
+        engine = LiteLLMEngine(["openai/gpt-4o", "anthropic/claude-3-5-sonnet-20240620"], FullHistoryStrategy())
+
+        circuit.get("openai/gpt-4o").failure_threshold = 1
+
+        for _ in range(2):
+            usage, message = asyncio.run(engine._generate([{"role": "user", "content": "hi"}], None))
+            self.assertEqual(message.content, "from fallback")
+
+        # the primary generator was skipped once its circuit opened
+        models = [call.kwargs["model"] for call in mock_acompletion.call_args_list]
+        self.assertEqual(models.count("openai/gpt-4o"), 1)
+        circuit.reset()
+
+    @patch("nerve.generation.litellm.litellm.acompletion", new_callable=AsyncMock)
+    def test_fallback_not_used_for_invalid_requests(self, mock_acompletion: AsyncMock) -> None:
+        mock_acompletion.side_effect = ValueError("invalid request")
+        circuit.reset()
+        engine = LiteLLMEngine(["openai/gpt-4o", "anthropic/claude-3-5-sonnet-20240620"], FullHistoryStrategy())
+
+        with self.assertRaises(ValueError):
+            asyncio.run(engine._generate([{"role": "user", "content": "hi"}], None))
+
+        self.assertEqual(mock_acompletion.call_count, 1)
+
+    @patch("nerve.generation.litellm.litellm.acompletion")
+    def test_hedged_request_first_response_wins(self, mock_acompletion: MagicMock) -> None:
+        calls = 0
+
+        async def completion(*args: object, **kwargs: object) -> MagicMock:
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                # the primary request stalls
+                await asyncio.sleep(10)
+            return _completion_response(f"response {calls}")
+
+        mock_acompletion.side_effect = completion
+        latency.reset()
+        for _ in range(10):
+            latency.get("openai/gpt-4o").record(0.01)
+
+        engine = LiteLLMEngine("openai/gpt-4o?hedge=95", FullHistoryStrategy())
+
+        async def run() -> tuple[t.Any, t.Any, float]:
+            started_at = asyncio.get_running_loop().time()
+            usage, message = await engine._generate([{"role": "user", "content": "hi"}], None)
+            return usage, message, asyncio.get_running_loop().time() - started_at
+
+        usage, message, elapsed = asyncio.run(run())
+        latency.reset()
+
+        self.assertEqual(message.content, "response 2")
+        self.assertLess(elapsed, 1)
+        self.assertEqual(mock_acompletion.call_count, 2)
+
+    @patch("nerve.generation.litellm.state.on_event")
+    @patch("nerve.generation.litellm.asyncio.sleep", new_callable=AsyncMock)
+    @patch("nerve.generation.litellm.litellm.acompletion", new_callable=AsyncMock)
+    def test_rate_limit_waits_before_sending(
+        self, mock_acompletion: AsyncMock, mock_sleep: AsyncMock, mock_on_event: MagicMock
+    ) -> None:
+        mock_acompletion.return_value = _completion_response("hello")
+        ratelimit.reset()
+        engine = LiteLLMEngine("openai/gpt-4o?rpm=1", FullHistoryStrategy())
+
+        for _ in range(2):
+            asyncio.run(engine._generate([{"role": "user", "content": "hi"}], None))
+        ratelimit.reset()
+
+        # the second request waited for the bucket to refill
+        mock_sleep.assert_awaited_once()
+        self.assertAlmostEqual(mock_sleep.call_args.args[0], 60, delta=1)
+        events = [call.args[0] for call in mock_on_event.call_args_list]
+        self.assertEqual(events.count("rate_limited"), 1)
+        self.assertEqual(mock_acompletion.call_count, 2)
@@ -0,0 +1,64 @@
+import unittest
+from types import SimpleNamespace
+
+from nerve.generation.message import Message, ToolCall, to_wire
+
+
+class TestMessage(unittest.TestCase):
+    def test_from_provider_drops_empty_fields(self) -> None:
+        provider_message = SimpleNamespace(
+            role="assistant",
+            content=None,
+            tool_calls=[SimpleNamespace(id="call_1", function=SimpleNamespace(name="ls", arguments='{"path": "."}'))],
+            function_call=None,
+            provider_specific_fields={},
+        )
+
+        message = Message.from_provider(provider_message)
+
+        self.assertEqual(
+            message.to_dict(),
+            {"role": "assistant", "tool_calls": [{"id": "call_1", "name": "ls", "arguments": '{"path": "."}'}]},
+        )
+        self.assertFalse(hasattr(message, "__dict__"))
+
+    def test_roles_are_interned(self) -> None:
+        role = "".join(["assis", "tant"])
+        self.assertIs(Message(role=role).role, Message(role="assistant").role)
+
+    def test_to_wire(self) -> None:
+        message = Message(role="assistant", content="", tool_calls=(ToolCall("call_1", "ls", "{}"),))
+
+        self.assertEqual(
+            to_wire(message),
+            {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{"id": "call_1", "type": "function", "function": {"name": "ls", "arguments": "{}"}}],
+            },
+        )
+        self.assertEqual(
+            Message(role="tool", content="ok", tool_call_id="call_1", name="ls").to_wire(),
+            {"role": "tool", "content": "ok", "tool_call_id": "call_1", "name": "ls"},
+        )
+
+    def test_empty_tool_content_round_trip(self) -> None:
+        message = Message.from_dict({"role": "tool", "tool_call_id": "1", "name": "x", "content": ""})
+
+        self.assertEqual(message.to_wire()["content"], "")
+        self.assertEqual(message.to_dict()["content"], "")
+
+    def test_dict_round_trip(self) -> None:
+        message = Message(role="assistant", content="hi", tool_calls=(ToolCall("call_1", "ls", "{}"),))
+
+        self.assertEqual(Message.from_dict(message.to_dict()), message)
+        self.assertEqual(Message.from_dict(message.to_wire()), message)
+
+    def test_dictionary_access(self) -> None:
+        message = Message(role="tool", content="ok", tool_call_id="call_1")
+
+        self.assertEqual(message.get("role"), "tool")
+        self.assertEqual(message["content"], "ok")
+        self.assertEqual(message.get("name", "unknown"), "unknown")
+        with self.assertRaises(KeyError):
+            message["missing"]
@@ -0,0 +1,53 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from nerve.generation import ratelimit
+from nerve.generation.ratelimit import RateLimiter, TokenBucket
+
+
+class TestTokenBucket(unittest.TestCase):
+    @patch("nerve.generation.ratelimit.time.monotonic")
+    def test_reservations_wait_for_refill(self, mock_monotonic: MagicMock) -> None:
+        mock_monotonic.return_value = 0.0
+        bucket = TokenBucket(capacity=2, per_second=1)
+
+        self.assertEqual(bucket.reserve(1), 0.0)
+        self.assertEqual(bucket.reserve(1), 0.0)
+        # queued after the previous reservations
+        self.assertEqual(bucket.reserve(1), 1.0)
+        self.assertEqual(bucket.reserve(1), 2.0)
+
+        mock_monotonic.return_value = 10.0
+        # refilled up to the capacity
+        self.assertEqual(bucket.reserve(2), 0.0)
+
+    @patch("nerve.generation.ratelimit.time.monotonic")
+    def test_adjust(self, mock_monotonic: MagicMock) -> None:
+        mock_monotonic.return_value = 0.0
+        bucket = TokenBucket(capacity=100, per_second=10)
+
+        bucket.reserve(50)
+        bucket.adjust(100)
+
+        self.assertEqual(bucket.reserve(10), 6.0)
+
+
+class TestRateLimiter(unittest.TestCase):
+    def tearDown(self) -> None:
+        ratelimit.reset()
+
+    @patch("nerve.generation.ratelimit.time.monotonic")
+    def test_requests_and_tokens_limits(self, mock_monotonic: MagicMock) -> None:
+        mock_monotonic.return_value = 0.0
+        limiter = RateLimiter(rpm=60, tpm=600)
+
+        self.assertEqual(limiter.reserve(300), 0.0)
+        # 600 tokens per minute are refilled at 10 per second
+        self.assertEqual(limiter.reserve(400), 10.0)
+
+    def test_shared_by_generator(self) -> None:
+        limiter = ratelimit.get("openai/gpt-4o", rpm=10)
+
+        self.assertIs(ratelimit.get("openai/gpt-4o"), limiter)
+        self.assertIsNot(ratelimit.get("openai/gpt-4o-mini"), limiter)
+        self.assertIsNone(limiter.tokens)
@@ -0,0 +1,112 @@
+import asyncio
+import pathlib
+import tempfile
+import typing as t
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import nerve.runtime.state as state
+from nerve.generation.conversation import FullHistoryStrategy
+from nerve.generation.litellm import LiteLLMEngine
+from nerve.generation.replay import ReplayEngine, is_replay
+
+
+def _tool_call_response(name: str = "nerve") -> MagicMock:
+    tool_call = MagicMock()
+    tool_call.id = "call_1"
+    tool_call.function.name = "greet"
+    tool_call.function.arguments = f'{{"name": "{name}"}}'
+
+    response = MagicMock()
+    response.usage.prompt_tokens = 10
+    response.usage.completion_tokens = 5
+    response.usage.total_tokens = 15
+    response.usage.prompt_tokens_details.cached_tokens = 0
+    response.choices[0].message.content = None
+    response.choices[0].message.tool_calls = [tool_call]
+    return response
+
+
+class TestReplayEngine(unittest.TestCase):
+    def setUp(self) -> None:
+        self.calls: list[str] = []
+
+        def greet(name: str) -> str:
+            """Greet someone."""
+            self.calls.append(name)
+            return f"hello {name}"
+
+        self.greet = greet
+        self.trace_path = pathlib.Path(tempfile.mkdtemp()) / "trace.jsonl"
+
+    def _record(self) -> None:
+        with state.run_context() as run_state:
+            state.set_trace_file(self.trace_path)
+            engine = LiteLLMEngine("openai/gpt-4o", FullHistoryStrategy(), [self.greet])
+            with patch("nerve.generation.litellm.litellm.acompletion", new_callable=AsyncMock) as mock_acompletion:
+                mock_acompletion.return_value = _tool_call_response()
+                asyncio.run(engine.step("system", "task"))
+
+        assert run_state.trace_writer is not None
+        run_state.trace_writer.close()
+
+    def test_is_replay(self) -> None:
+        self.assertTrue(is_replay("replay://trace.jsonl"))
+        self.assertFalse(is_replay("openai/gpt-4o"))
+        self.assertFalse(is_replay(["replay://trace.jsonl"]))
+
+    def test_replays_recorded_messages(self) -> None:
+        self._record()
+        self.assertEqual(self.calls, ["nerve"])
+
+        with state.run_context():
+            engine = ReplayEngine(f"replay://{self.trace_path}", FullHistoryStrategy(), [self.greet])
+            usage = asyncio.run(engine.step("system", "task"))
+
+        # the tool is executed again, without contacting the generator
+        self.assertEqual(self.calls, ["nerve", "nerve"])
+        self.assertEqual(usage.total_tokens, 0)
+        self.assertEqual([call.name for call in engine.history[0].tool_calls or ()], ["greet"])
+        self.assertEqual(engine.history[1].content, "hello nerve")
+
+    def test_fails_task_when_exhausted(self) -> None:
+        self._record()
+
+        with state.run_context():
+            engine = ReplayEngine(f"replay://{self.trace_path}", FullHistoryStrategy(), [self.greet])
+            asyncio.run(engine.step("system", "task"))
+            asyncio.run(engine.step("system", "task"))
+
+            self.assertTrue(state.is_active_task_done())
+            self.assertEqual(len(engine.history), 2)
+
+    def test_replays_concurrent_forks(self) -> None:
+        async def run_forks(engine: LiteLLMEngine) -> list[LiteLLMEngine]:
+            forks = [engine.fork(), engine.fork()]
+            await asyncio.gather(
+                *(fork.step("system", f"greet {name}") for fork, name in zip(forks, ["first", "second"], strict=True))
+            )
+            return t.cast(list[LiteLLMEngine], forks)
+
+        async def complete(**kwargs: t.Any) -> MagicMock:
+            name = kwargs["messages"][-1]["content"].split()[-1]
+            # the first copy responds last
+            await asyncio.sleep(0.05 if name == "first" else 0.0)
+            return _tool_call_response(name)
+
+        with state.run_context() as run_state:
+            state.set_trace_file(self.trace_path)
+            engine = LiteLLMEngine("openai/gpt-4o", FullHistoryStrategy(), [self.greet])
+            with patch("nerve.generation.litellm.litellm.acompletion", side_effect=complete):
+                asyncio.run(run_forks(engine))
+
+        assert run_state.trace_writer is not None
+        run_state.trace_writer.close()
+        self.assertEqual(self.calls, ["second", "first"])
+
+        with state.run_context():
+            replay = ReplayEngine(f"replay://{self.trace_path}", FullHistoryStrategy(), [self.greet])
+            forks = asyncio.run(run_forks(replay))
+
+        # each copy gets the messages recorded for the copy it replaces
+        self.assertEqual([fork.history[1].content for fork in forks], ["hello first", "hello second"])
@@ -2,7 +2,7 @@ import pathlib
 import typing as t
 from enum import Enum
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from pydantic_yaml import parse_yaml_raw_as
 
 
@@ -51,6 +51,10 @@ class Tool(BaseModel):
     description: str = ""
     arguments: list[Argument] = []
     complete_task: bool = False
+    # if true the tool never runs concurrently with other tool calls
+    serial: bool = False
+    # max seconds a call can take before being cancelled
+    timeout: float | None = None
     mime: str | None = None
     tool: str | None = None
 
@@ -107,7 +111,8 @@ class Configuration(BaseModel):
 
 class Workflow(BaseModel):
     """
-    A workflow is a collection of agents that are executed sequentially.
+    A workflow is a collection of agents that are executed sequentially, or concurrently when their
+    dependencies are declared with depends_on.
     """
 
     class Actor(BaseModel):
@@ -115,11 +120,64 @@ class Workflow(BaseModel):
         An actor is an agent that is part of the workflow.
         """
 
-        generator: str
+        # a generator, or an ordered list of generators to fail over to
+        generator: str | list[str]
+        # actors (declared before this one) that must complete before this one starts,
+        # if not set the actor depends on the previous one
+        depends_on: list[str] | None = None
+        # run the actor once per element of this list variable, concurrently
+        map: str | None = None
+        # variable holding the element in each run
+        item: str = "item"
+        # variable set by each run to collect, if not set all the variables set by the run are collected
+        result: str | None = None
+        # list variable the results are collected in, in the order of the elements (<map>_results by default)
+        output: str | None = None
+        # max number of runs executing concurrently (max_parallel of the workflow by default)
+        concurrency: int | None = None
+
+        def get_output(self) -> str:
+            return self.output or f"{self.map}_results"
 
     name: str
     description: str
     flow: dict[str, Actor]
+    # max number of actors running concurrently
+    max_parallel: int = 4
+
+    @model_validator(mode="after")
+    def check_dependencies(self) -> "Workflow":
+        declared: set[str] = set()
+        for name, actor in self.flow.items():
+            for dependency in actor.depends_on or []:
+                if dependency not in declared:
+                    raise ValueError(f"actor {name} depends on {dependency}, which is not declared before it")
+            declared.add(name)
+
+        if self.max_parallel < 1:
+            raise ValueError("max_parallel must be at least 1")
+
+        for name, actor in self.flow.items():
+            if actor.concurrency is not None and actor.concurrency < 1:
+                raise ValueError(f"concurrency of actor {name} must be at least 1")
+
+        return self
+
+    @property
+    def is_parallel(self) -> bool:
+        return any(actor.depends_on is not None for actor in self.flow.values())
+
+    def get_dependencies(self) -> list[list[int]]:
+        """Get the indexes of the actors each actor depends on."""
+
+        names = list(self.flow.keys())
+        dependencies: list[list[int]] = []
+        for idx, actor in enumerate(self.flow.values()):
+            if actor.depends_on is None:
+                dependencies.append([idx - 1] if idx > 0 else [])
+            else:
+                dependencies.append([names.index(dependency) for dependency in actor.depends_on])
+        return dependencies
 
     @staticmethod
     def is_workflow(input_path: pathlib.Path) -> bool:
@@ -8,10 +8,10 @@ from nerve.tools import compiler
 
 
 class Runtime:
-    def __init__(self, name: str, generator: str, working_dir: pathlib.Path):
+    def __init__(self, name: str, generator: str | list[str], working_dir: pathlib.Path):
         # task unique identifier
         self.name = name
-        # which model will handle this task
+        # which model will handle this task (or an ordered list of models to fail over to)
         self.generator = generator
         # the working directory for the task
         self.working_dir = working_dir
@@ -25,7 +25,7 @@ class Runtime:
         cls,
         working_dir: pathlib.Path,
         name: str,
-        generator: str,
+        generator: str | list[str],
         using: list[str],
         jail: dict[str, list[str]],
         tools: list[Tool | t.Callable[..., t.Any]],
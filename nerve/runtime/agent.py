@@ -1,3 +1,4 @@
+import copy
 import pathlib
 
 import click
@@ -7,6 +8,7 @@ import nerve.runtime.state as state
 from nerve.generation import Engine, Usage, WindowStrategy
 from nerve.generation.conversation import FullHistoryStrategy
 from nerve.generation.litellm import LiteLLMEngine
+from nerve.generation.replay import ReplayEngine, is_replay
 from nerve.models import Configuration, Tool
 from nerve.runtime import Runtime
 from nerve.memory.config import MemoryConfig
@@ -30,7 +32,15 @@ class Agent:
         # conversation window strategy
         self.conv_window_strategy = conv_window_strategy
 
-        state.on_event("agent_created", {"agent": self})
+        state.on_event(
+            "agent_created",
+            {
+                "name": runtime.name,
+                "generator": runtime.generator,
+                "version": configuration.version,
+                "tools": len(runtime.tools),
+            },
+        )
 
         # Memory integration
         self.memory_integration = None
@@ -52,7 +62,7 @@ class Agent:
     @classmethod
     def create(
         cls,
-        generator: str,
+        generator: str | list[str],
         configuration: Configuration,
         start_state: dict[str, str] | None = None,
         window_strategy: WindowStrategy = FullHistoryStrategy(),
@@ -63,7 +73,8 @@ class Agent:
         Create an agent from a generator and configuration.
 
         Args:
-            generator: The generator string to use.
+            generator: The generator string to use, or an ordered list of generators to fail over to
+                (replay://<trace> to replay the responses recorded in a trace).
             configuration: The configuration to use.
             start_state: Initial variables for the agent.
             window_strategy: How to handle conversation history.
@@ -92,17 +103,19 @@ class Agent:
             tools=configuration.tools,
         )
 
+        engine_class: type[LiteLLMEngine] = ReplayEngine if is_replay(generator) else LiteLLMEngine
+
         return cls(
             runtime=runtime,
             configuration=configuration,
-            generation_engine=LiteLLMEngine(generator, window_strategy, runtime.tools),
+            generation_engine=engine_class(generator, window_strategy, runtime.tools),
             conv_window_strategy=window_strategy,
         )
 
     @classmethod
     def create_from_file(
         cls,
-        generator: str,
+        generator: str | list[str],
         config_file_path: pathlib.Path,
         window_strategy: WindowStrategy = FullHistoryStrategy(),
         start_state: dict[str, str] | None = None,
@@ -123,16 +136,41 @@ class Agent:
             stem if stem not in ("task", "agent") else working_dir.stem,
         )
 
-    def _get_system_prompt(self) -> str | None:
+    def fork(self) -> "Agent":
+        """
+        Create a copy of the agent sharing its runtime, tools and configuration, with its own conversation
+        history (used to run the same task over multiple inputs concurrently).
+        """
+
+        agent = copy.copy(self)
+        agent.generation_engine = self.generation_engine.fork()
+        return agent
+
+    def _get_system_prompt(self, with_knowledge: bool = True) -> str | None:
         if not self.configuration.agent:
             return None
 
         raw = self.configuration.agent
 
+        if with_knowledge:
+            raw += self._get_knowledge()
+
+        return state.interpolate(raw)
+
+    def _get_knowledge(self) -> str:
+        raw = ""
         for name, value in state.get_knowledge().items():
             raw += f"\n\n## {name.capitalize()}\n\n{value}"
 
-        return state.interpolate(raw)
+        return raw
+
+    def _get_context(self) -> str | None:
+        # when the engine keeps a stable prompt prefix, the knowledge is sent after the conversation history
+        if not self.generation_engine.prompt_cache:
+            return None
+
+        knowledge = self._get_knowledge().strip()
+        return state.interpolate(knowledge) if knowledge else None
 
     def _get_prompt(self) -> str:
         if not self.configuration.task:
@@ -162,8 +200,9 @@ class Agent:
                 for key, value in memory_knowledge.items():
                     state.write_knowledge(key, value)
 
-            # Re-get the system prompt with the new knowledge
-            system_prompt = self._get_system_prompt()
+            # Re-get the system prompt with the new knowledge (or without it, for a stable prefix)
+            system_prompt = self._get_system_prompt(with_knowledge=not self.generation_engine.prompt_cache)
+            context = self._get_context()
 
             state.on_event(
                 "agent_step",
@@ -172,10 +211,11 @@ class Agent:
                     "generator": self.runtime.generator,
                     "system_prompt": system_prompt,
                     "prompt": prompt,
+                    "context": context,
                 },
             )
 
-            usage = await self.generation_engine.step(system_prompt, prompt, extra_tools)
+            usage = await self.generation_engine.step(system_prompt, prompt, extra_tools, context)
 
              # Store conversation in memory
             if self.memory_integration:
@@ -185,9 +225,9 @@ class Agent:
                 
                 if self.generation_engine.history:
                     for msg in reversed(self.generation_engine.history):
-                        if isinstance(msg, dict) and msg.get("role") == "assistant":
-                            last_assistant_message = msg.get("content", "")
-                            tool_calls = msg.get("tool_calls", [])
+                        if msg.role == "assistant":
+                            last_assistant_message = msg.content or ""
+                            tool_calls = [tool_call.to_dict() for tool_call in msg.tool_calls or ()]
                             break
                 
                 if last_assistant_message:
@@ -204,7 +244,7 @@ class Agent:
                 "error",
                 {
                     "agent_name": self.runtime.name,
-                    "error": e,
+                    "error": str(e),
                 },
             )
             import traceback
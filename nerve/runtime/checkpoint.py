@@ -0,0 +1,48 @@
+import json
+import os
+import pathlib
+import typing as t
+
+from pydantic import BaseModel
+
+from nerve.generation import Usage
+from nerve.runtime.trace import CustomJSONEncoder
+
+# version of the checkpoint format
+CHECKPOINT_VERSION: int = 1
+
+
+class Checkpoint(BaseModel):
+    """The progress of a flow after a completed step, from which it can be resumed."""
+
+    version: int = CHECKPOINT_VERSION
+    # index of the active actor
+    actor_idx: int
+    # next step to run
+    step: int
+    # steps run by the elements of map actors (see Flow.map_steps)
+    map_steps: int = 0
+    # total token usage so far
+    token_usage: Usage
+    variables: dict[str, t.Any] = {}
+    knowledge: dict[str, t.Any] = {}
+    # conversation history of each actor, in order
+    histories: list[list[dict[str, t.Any]]] = []
+
+    def save(self, path: pathlib.Path) -> None:
+        """Write the checkpoint to a file, atomically replacing the previous one."""
+
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.model_dump(), f, cls=CustomJSONEncoder)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: pathlib.Path) -> "Checkpoint":
+        checkpoint = cls.model_validate_json(path.read_text())
+        if checkpoint.version != CHECKPOINT_VERSION:
+            raise ValueError(f"unsupported checkpoint version {checkpoint.version} in {path}")
+        return checkpoint
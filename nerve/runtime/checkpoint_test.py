@@ -0,0 +1,72 @@
+import pathlib
+from unittest.mock import MagicMock
+
+import pytest
+
+import nerve.runtime.state as state
+from nerve.generation import Usage
+from nerve.generation.message import Message, ToolCall
+from nerve.runtime.checkpoint import Checkpoint
+from nerve.runtime.flow import Flow
+
+
+def _actor(name: str) -> MagicMock:
+    actor = MagicMock()
+    actor.runtime.name = name
+    actor.generation_engine.history = []
+    return actor
+
+
+def test_checkpoint_save_and_load(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "checkpoint.json"
+    checkpoint = Checkpoint(
+        actor_idx=1,
+        step=42,
+        token_usage=Usage(prompt_tokens=10, completion_tokens=5, total_tokens=15),
+        variables={"url": "cnn.com"},
+        knowledge={"notes": "something"},
+        histories=[[], [{"role": "user", "content": "hi"}]],
+    )
+    checkpoint.save(path)
+
+    assert Checkpoint.load(path) == checkpoint
+    assert not path.with_name("checkpoint.json.tmp").exists()
+
+
+def test_flow_checkpoint_and_restore(tmp_path: pathlib.Path) -> None:
+    with state.run_context():
+        flow = Flow(actors=[_actor("first"), _actor("second")])
+        flow.curr_actor_idx = 1
+        flow.curr_step = 7
+        flow.token_usage = Usage(prompt_tokens=100, completion_tokens=10, total_tokens=110)
+        flow.actors[1].generation_engine.history = [
+            Message(role="assistant", tool_calls=(ToolCall("call_1", "shell", '{"command": "ls"}'),)),
+            Message(role="tool", content="file.txt", tool_call_id="call_1", name="shell"),
+        ]
+        state.update_variables({"url": "cnn.com"})
+        state.write_knowledge("notes", "something")
+
+        flow.checkpoint().save(tmp_path / "checkpoint.json")
+
+    with state.run_context():
+        flow = Flow(actors=[_actor("first"), _actor("second")])
+        flow.restore(Checkpoint.load(tmp_path / "checkpoint.json"))
+
+        assert (flow.curr_actor_idx, flow.curr_step, flow.curr_actor) == (1, 7, None)
+        assert flow.token_usage.total_tokens == 110
+        assert state.get_variable("url") == "cnn.com"
+        assert state.get_knowledge() == {"notes": "something"}
+        assert flow.actors[0].generation_engine.history == []
+        history = flow.actors[1].generation_engine.history
+        assert [call.name for call in history[0].tool_calls or ()] == ["shell"]
+        assert history[1] == Message(role="tool", content="file.txt", tool_call_id="call_1", name="shell")
+        assert state.get_events(name="flow_resumed")[0].data == {"step": 7, "actor": "second"}
+
+
+def test_restore_different_flow(tmp_path: pathlib.Path) -> None:
+    with state.run_context():
+        flow = Flow(actors=[_actor("first")])
+        checkpoint = Checkpoint(actor_idx=0, step=1, token_usage=flow.token_usage, histories=[[], []])
+
+        with pytest.raises(ValueError):
+            flow.restore(checkpoint)
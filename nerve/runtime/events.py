@@ -1,10 +1,126 @@
+import collections
+import os
+import threading
 import time
 import typing as t
 
-from pydantic import BaseModel, Field
+# max number of events kept in memory (0 for no limit)
+DEFAULT_MAX_EVENTS: int = int(os.getenv("NERVE_EVENTS_MAX_COUNT", 10000))
+# max (estimated) size in bytes of the events kept in memory (0 for no limit)
+DEFAULT_MAX_EVENTS_SIZE: int = int(os.getenv("NERVE_EVENTS_MAX_SIZE", 0))
 
 
-class Event(BaseModel):
-    timestamp: float = Field(default_factory=time.time)
-    name: str
-    data: t.Any | None = None
+class Event:
+    """
+    An event of a run. Payloads only reference other entities by name (not the objects themselves),
+    and are serialized only when needed (for instance by the trace writer).
+    """
+
+    __slots__ = ("timestamp", "name", "data")
+
+    def __init__(self, name: str, data: dict[str, t.Any] | None = None, timestamp: float | None = None) -> None:
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.name = name
+        self.data = data
+
+    def to_dict(self) -> dict[str, t.Any]:
+        return {"timestamp": self.timestamp, "name": self.name, "data": self.data}
+
+    @classmethod
+    def from_dict(cls, data: dict[str, t.Any]) -> "Event":
+        return cls(name=data["name"], data=data.get("data"), timestamp=data.get("timestamp"))
+
+    def __repr__(self) -> str:
+        return f"Event({self.name}, {self.data!r})"
+
+
+def actor_name(actor: t.Any) -> str | None:
+    """Reference an actor in an event payload by its name."""
+
+    runtime = getattr(actor, "runtime", None)
+    return getattr(runtime, "name", None) if runtime is not None else None
+
+
+def estimate_size(value: t.Any, depth: int = 0) -> int:
+    """Cheap estimation of the size of a value once serialized, in bytes."""
+
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    elif isinstance(value, dict) and depth < 4:
+        return sum(len(str(k)) + estimate_size(v, depth + 1) for k, v in value.items())
+    elif isinstance(value, (list, tuple)) and depth < 4:
+        return sum(estimate_size(v, depth + 1) for v in value)
+
+    # numbers, references to other objects, etc
+    return 16
+
+
+class EventLog:
+    """
+    The most recent events of a run, older events are dropped once max_events events (or
+    an estimated size of max_size bytes) are exceeded. Use the trace to keep every event.
+    """
+
+    def __init__(self, max_events: int = DEFAULT_MAX_EVENTS, max_size: int = DEFAULT_MAX_EVENTS_SIZE) -> None:
+        self.max_events = max_events
+        self.max_size = max_size
+        # number of events dropped so far
+        self.dropped = 0
+        self._events: collections.deque[tuple[Event, int]] = collections.deque(maxlen=max_events or None)
+        self._size = 0
+        # events are appended from the event loop and from the threads running blocking tools
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def __iter__(self) -> t.Iterator[Event]:
+        return (event for event, _ in list(self._events))
+
+    @property
+    def size(self) -> int:
+        """Estimated size of the events in the log, in bytes."""
+
+        return self._size
+
+    def append(self, event: Event) -> None:
+        size = estimate_size(event.name) + estimate_size(event.data) + 16 if self.max_size else 0
+
+        with self._lock:
+            if self.max_events and len(self._events) == self.max_events:
+                # the deque drops the oldest event
+                self._size -= self._events[0][1]
+                self.dropped += 1
+
+            self._events.append((event, size))
+            self._size += size
+
+            while self.max_size and self._size > self.max_size and len(self._events) > 1:
+                _, dropped_size = self._events.popleft()
+                self._size -= dropped_size
+                self.dropped += 1
+
+    def recent(self, limit: int | None = None, name: str | None = None, since: float | None = None) -> list[Event]:
+        """
+        Return the most recent events in chronological order, optionally only the last limit ones,
+        the ones with the given name and the ones registered after the since timestamp.
+        """
+
+        events: list[Event] = []
+        for event, _ in reversed(list(self._events)):
+            if since is not None and event.timestamp <= since:
+                break
+            if name is not None and event.name != name:
+                continue
+
+            events.append(event)
+            if limit is not None and len(events) >= limit:
+                break
+
+        events.reverse()
+        return events
+
+    def clear(self) -> None:
+        with self._lock:
+            self._events.clear()
+            self._size = 0
@@ -0,0 +1,69 @@
+import threading
+from types import SimpleNamespace
+
+from nerve.runtime.events import Event, EventLog, actor_name, estimate_size
+
+
+def test_count_retention() -> None:
+    log = EventLog(max_events=3)
+    for i in range(5):
+        log.append(Event(name="test_event", data={"i": i}))
+
+    assert len(log) == 3
+    assert log.dropped == 2
+    assert [(event.data or {})["i"] for event in log] == [2, 3, 4]
+
+
+def test_size_retention() -> None:
+    log = EventLog(max_events=0, max_size=300)
+    for i in range(5):
+        log.append(Event(name="test_event", data={"content": "x" * 100, "i": i}))
+
+    assert log.size <= 300
+    assert [(event.data or {})["i"] for event in log] == [3, 4]
+    assert log.dropped == 3
+
+
+def test_recent() -> None:
+    log = EventLog()
+    for i in range(6):
+        log.append(Event(timestamp=float(i), name="even" if i % 2 == 0 else "odd", data={"i": i}))
+
+    assert [(event.data or {})["i"] for event in log.recent(limit=2)] == [4, 5]
+    assert [(event.data or {})["i"] for event in log.recent(name="even")] == [0, 2, 4]
+    assert [(event.data or {})["i"] for event in log.recent(since=3.0)] == [4, 5]
+    assert [(event.data or {})["i"] for event in log.recent(limit=1, name="odd")] == [5]
+
+
+def test_concurrent_append() -> None:
+    log = EventLog(max_events=100, max_size=10000)
+
+    def append() -> None:
+        for i in range(1000):
+            log.append(Event(name="test_event", data={"i": i}))
+            log.recent(limit=10)
+
+    threads = [threading.Thread(target=append) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(log) + log.dropped == 4000
+    assert log.size == sum(estimate_size(event.name) + estimate_size(event.data) + 16 for event in log)
+
+
+def test_event_records() -> None:
+    event = Event(name="task_complete", data={"actor": "agent", "reason": None}, timestamp=1.0)
+
+    assert not hasattr(event, "__dict__")
+    assert Event.from_dict(event.to_dict()).to_dict() == {
+        "timestamp": 1.0,
+        "name": "task_complete",
+        "data": {"actor": "agent", "reason": None},
+    }
+
+
+def test_actor_name() -> None:
+    assert actor_name(SimpleNamespace(runtime=SimpleNamespace(name="agent"))) == "agent"
+    assert actor_name(None) is None
@@ -1,16 +1,45 @@
+import asyncio
+import json
 import os
 import pathlib
 import time
+import typing as t
 
 from loguru import logger
 
 import nerve.runtime.state as state
 from nerve.generation import Usage, WindowStrategy
 from nerve.generation.conversation import FullHistoryStrategy
-from nerve.models import Workflow
+from nerve.generation.message import Message
+from nerve.models import Status, Workflow
 from nerve.runtime.agent import Agent
+from nerve.runtime.checkpoint import Checkpoint
+from nerve.runtime.events import actor_name as get_actor_name
 
-IS_ACTIVE: bool = False
+# max number of actors of a parallel workflow running concurrently
+DEFAULT_MAX_PARALLEL: int = 4
+# seconds to wait for the flow to stop once cancelled because of the timeout
+DEFAULT_CANCEL_GRACE: float = float(os.getenv("NERVE_CANCEL_GRACE", "5"))
+
+
+def _get_items(name: str, value: t.Any) -> list[t.Any]:
+    """Get the elements of a list variable, which can also be a JSON list or a string with one element per line."""
+
+    if value is None:
+        raise ValueError(f"variable {name} is not set")
+    elif isinstance(value, (list, tuple)):
+        return list(value)
+    elif isinstance(value, str):
+        try:
+            parsed = json.loads(value)
+            if isinstance(parsed, list):
+                return parsed
+        except json.JSONDecodeError:
+            pass
+
+        return [line.strip() for line in value.splitlines() if line.strip()]
+
+    raise ValueError(f"variable {name} is not a list")
 
 
 class Flow:
@@ -20,13 +49,16 @@ class Flow:
         workflow: Workflow | None = None,
         max_steps: int = 500,
         timeout: int | None = None,
+        dependencies: list[list[int]] | None = None,
+        max_parallel: int = DEFAULT_MAX_PARALLEL,
+        step_timeout: float | None = None,
     ):
-        global IS_ACTIVE
-
-        if IS_ACTIVE:
+        # only one flow can run in the same run state, use state.run_context to run multiple flows
+        run_state = state.current()
+        if run_state.flow is not None:
             raise RuntimeError("A flow is already running")
 
-        IS_ACTIVE = True
+        run_state.flow = self
 
         # all actors in the flow
         self.actors = actors
@@ -37,14 +69,30 @@ class Flow:
         self.curr_actor: Agent | None = None
         # current step from the beginning of the flow
         self.curr_step: int = 0
+        # steps run by the elements of map actors, not counted against max_steps as each one has its own budget
+        self.map_steps: int = 0
         # total token usage accumulated over each step
         self.token_usage: Usage = Usage(prompt_tokens=0, completion_tokens=0, total_tokens=0)
         # optional max steps to run
         self.max_steps: int = max_steps
         # optional timeout to run the flow
         self.timeout: int | None = timeout
+        # optional timeout of each step
+        self.step_timeout: float | None = step_timeout
         # start time of the flow
         self.started_at: float | None = None
+        # optional file to save the progress of the flow to, every checkpoint_every steps
+        self.checkpoint_path: pathlib.Path | None = None
+        self.checkpoint_every: int = 1
+        # indexes of the actors each actor depends on, if set the actors run concurrently as soon
+        # as their dependencies complete, otherwise they run one after another
+        self.dependencies = dependencies
+        # max number of actors running concurrently
+        self.max_parallel = max_parallel
+        # actors running once per element of a list variable, by index
+        self.maps: dict[int, Workflow.Actor] = {}
+        if workflow is not None:
+            self.maps = {idx: actor for idx, actor in enumerate(workflow.flow.values()) if actor.map}
 
     @classmethod
     def build(
@@ -53,11 +101,12 @@ class Flow:
         max_steps: int = 500,
         timeout: int | None = None,
         start_state: dict[str, str] | None = None,
+        step_timeout: float | None = None,
     ) -> "Flow":
         if start_state:
             state.update_variables(start_state)
 
-        return cls(actors=actors, max_steps=max_steps, timeout=timeout)
+        return cls(actors=actors, max_steps=max_steps, timeout=timeout, step_timeout=step_timeout)
 
     @classmethod
     def from_path(
@@ -67,6 +116,7 @@ class Flow:
         max_steps: int = 500,
         timeout: int | None = None,
         start_state: dict[str, str] | None = None,
+        step_timeout: float | None = None,
     ) -> "Flow":
         workflow = Workflow.from_path(input_path)
         root_path = input_path if input_path.is_dir() else input_path.parent
@@ -88,32 +138,35 @@ class Flow:
             workflow=workflow,
             max_steps=max_steps,
             timeout=timeout,
+            dependencies=workflow.get_dependencies() if workflow.is_parallel else None,
+            max_parallel=workflow.max_parallel,
+            step_timeout=step_timeout,
         )
 
     async def step(self) -> None:
         if self.started_at is None:
             self.started_at = time.time()
 
+        if self.curr_actor is None and self.curr_actor_idx in self.maps:
+            # all the runs of a map actor are a single step of the flow
+            await self._run_map(self.actors[self.curr_actor_idx], self.maps[self.curr_actor_idx])
+            self.curr_actor_idx += 1
+            state.reset()
+            if self.checkpoint_path is not None:
+                self.checkpoint().save(self.checkpoint_path)
+            return
+
         if self.curr_actor is None:
             self.curr_actor = self.actors[self.curr_actor_idx]
             state.on_task_started(self.curr_actor)
-            os.chdir(self.curr_actor.runtime.working_dir)
+            # tools resolve relative paths against it, the process working directory is shared by concurrent runs
+            state.set_working_dir(self.curr_actor.runtime.working_dir)
 
         if self.done():
             state.on_event("flow_complete", {"steps": self.curr_step})
             return
 
-        state.on_event("step_started", {"step": self.curr_step, "token_usage": self.token_usage})
-
-        step_usage = await self.curr_actor.step()
-        logger.debug(f"step usage: {step_usage}")
-
-        # increment total usage
-        self.token_usage.prompt_tokens += step_usage.prompt_tokens
-        self.token_usage.completion_tokens += step_usage.completion_tokens
-        self.token_usage.total_tokens += step_usage.total_tokens
-
-        state.on_event("step_complete", {"step": self.curr_step, "token_usage": self.token_usage})
+        await self._run_step(self.curr_actor)
 
         if state.is_active_task_done():
             logger.debug(f"task {self.curr_actor.runtime.name} complete")
@@ -121,16 +174,234 @@ class Flow:
             self.curr_actor = None
             state.reset()
 
+        if self.checkpoint_path is not None and self.curr_step % self.checkpoint_every == 0:
+            self.checkpoint().save(self.checkpoint_path)
+            logger.debug(f"checkpoint saved to {self.checkpoint_path}")
+
+    async def _run_step(self, actor: Agent) -> None:
+        # the step number is reserved before running it, as the actors of a parallel workflow step concurrently
+        step = self.curr_step
         self.curr_step += 1
+        state.set_current_step(step)
+
+        state.on_event(
+            "step_started",
+            {"step": step, "actor": get_actor_name(actor), "token_usage": self.token_usage.model_copy()},
+        )
+
+        try:
+            step_usage = await asyncio.wait_for(actor.step(), self.step_timeout)
+        except asyncio.TimeoutError:  # noqa: UP041
+            # the generation and the tool calls of the step have been cancelled
+            state.on_event("step_timeout", {"step": step, "actor": get_actor_name(actor), "timeout": self.step_timeout})
+            step_usage = Usage(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+
+        logger.debug(f"step usage: {step_usage}")
+
+        # increment total usage
+        self.token_usage.add(step_usage)
+
+        state.on_event(
+            "step_complete",
+            {
+                "step": step,
+                "actor": get_actor_name(actor),
+                "step_usage": step_usage,
+                "token_usage": self.token_usage.model_copy(),
+            },
+        )
+
+    async def _run_task(self, actor: Agent, max_steps: int | None = None) -> int:
+        """
+        Run the task of an actor until it's done and return the number of steps it took. With max_steps set
+        the task has its own step budget (the elements of a map actor), otherwise it uses the one of the flow.
+        """
+
+        state.on_task_started(actor)
+        state.set_working_dir(actor.runtime.working_dir)
+
+        steps = 0
+        while not state.is_active_task_done():
+            if max_steps is None:
+                if self._limit_reached():
+                    break
+            elif steps >= max_steps:
+                state.on_max_steps_reached()
+                break
+            elif self._timeout_reached():
+                break
+
+            await self._run_step(actor)
+            steps += 1
+            if max_steps is not None:
+                self.map_steps += 1
+
+        logger.debug(f"task {actor.runtime.name} complete")
+        return steps
+
+    async def _run_actor(self, actor_idx: int, branch: state.RunState) -> state.RunState:
+        with state.run_context(branch):
+            actor = self.actors[actor_idx]
+            if actor_idx in self.maps:
+                await self._run_map(actor, self.maps[actor_idx])
+            else:
+                await self._run_task(actor)
+
+        return branch
+
+    async def _run_map(self, actor: Agent, spec: Workflow.Actor) -> None:
+        """Run the task of an actor once per element of a list variable, collecting the results in order."""
+
+        assert spec.map is not None
+
+        items = _get_items(spec.map, state.get_variable(spec.map))
+        run_state = state.current()
+        semaphore = asyncio.Semaphore(spec.concurrency or self.max_parallel)
+
+        state.on_event("map_started", {"actor": get_actor_name(actor), "variable": spec.map, "items": len(items)})
+
+        # elements whose task failed, or that didn't run at all
+        failed: list[int] = []
+        skipped: list[int] = []
+
+        async def run_item(idx: int, item: t.Any) -> t.Any:
+            async with semaphore:
+                branch = run_state.fork()
+                with state.run_context(branch):
+                    state.update_variables({spec.item: item})
+                    # each run has its own conversation and step budget, the tools and configuration are shared
+                    steps = await self._run_task(actor.fork(), max_steps=self.max_steps)
+
+                if steps == 0:
+                    skipped.append(idx)
+                elif branch.task_status == Status.FAILED:
+                    failed.append(idx)
+
+                if spec.result:
+                    return branch.variables.get(spec.result)
+
+                changed = branch.changed_variables()
+                changed.pop(spec.item, None)
+                return changed
+
+        results = await asyncio.gather(*(run_item(idx, item) for idx, item in enumerate(items)))
+
+        state.update_variables({spec.get_output(): results})
+        state.on_event(
+            "map_complete",
+            {
+                "actor": get_actor_name(actor),
+                "output": spec.get_output(),
+                "results": len(results),
+                "failed": sorted(failed),
+                "skipped": sorted(skipped),
+            },
+        )
+
+    async def _run_parallel(self) -> None:
+        """Run each actor in its own branch of the state as soon as its dependencies are complete."""
+
+        assert self.dependencies is not None
+
+        if self.checkpoint_path is not None:
+            logger.warning("checkpoints are not supported by parallel workflows")
+
+        run_state = state.current()
+        pending = [idx for idx in range(len(self.actors)) if idx >= self.curr_actor_idx]
+        completed = set(range(self.curr_actor_idx))
+        running: dict[asyncio.Task[state.RunState], int] = {}
+
+        try:
+            while pending or running:
+                for idx in list(pending):
+                    if len(running) >= self.max_parallel:
+                        break
+                    elif all(dependency in completed for dependency in self.dependencies[idx]):
+                        pending.remove(idx)
+                        running[asyncio.create_task(self._run_actor(idx, run_state.fork()))] = idx
+
+                finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                # branches are merged as they complete with their position in the workflow, so that the
+                # variables set by actors running at the same time are the ones of the last declared actor
+                for task in sorted(finished, key=lambda task: running[task]):
+                    idx = running.pop(task)
+                    run_state.merge(task.result(), order=idx)
+                    completed.add(idx)
+        finally:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+
+        self.curr_actor_idx = len(self.actors)
+
+    async def _run(self) -> None:
+        if self.dependencies is None:
+            while not self.done():
+                await self.step()
+        else:
+            await self._run_parallel()
+
+    def checkpoint(self) -> Checkpoint:
+        """Capture the progress of the flow after the last completed step."""
+
+        run_state = state.current()
+        return Checkpoint(
+            actor_idx=self.curr_actor_idx,
+            step=self.curr_step,
+            map_steps=self.map_steps,
+            token_usage=self.token_usage.model_copy(),
+            variables=dict(run_state.variables),
+            knowledge=dict(run_state.knowledge),
+            histories=[[message.to_dict() for message in actor.generation_engine.history] for actor in self.actors],
+        )
+
+    def restore(self, checkpoint: Checkpoint) -> None:
+        """Continue the flow from a checkpoint of the same agent or workflow."""
+
+        if len(checkpoint.histories) != len(self.actors):
+            raise ValueError(
+                f"checkpoint has {len(checkpoint.histories)} actors, flow has {len(self.actors)}: "
+                "was it saved by a different agent or workflow?"
+            )
+
+        self.curr_actor_idx = checkpoint.actor_idx
+        # the active task is started again
+        self.curr_actor = None
+        self.curr_step = checkpoint.step
+        self.map_steps = checkpoint.map_steps
+        self.token_usage = checkpoint.token_usage.model_copy()
+
+        state.update_variables(checkpoint.variables)
+        for key, value in checkpoint.knowledge.items():
+            state.write_knowledge(key, value)
+
+        for actor, history in zip(self.actors, checkpoint.histories, strict=True):
+            actor.generation_engine.history = [Message.from_dict(message) for message in history]
+
+        state.on_event(
+            "flow_resumed",
+            {
+                "step": self.curr_step,
+                "actor": get_actor_name(self.actors[self.curr_actor_idx])
+                if self.curr_actor_idx < len(self.actors)
+                else None,
+            },
+        )
 
     def done(self) -> bool:
         if self.curr_actor_idx >= len(self.actors):
             return True
 
-        if self.max_steps is not None and self.curr_step > self.max_steps:
+        return self._limit_reached()
+
+    def _limit_reached(self) -> bool:
+        if self.max_steps is not None and self.curr_step - self.map_steps > self.max_steps:
             state.on_max_steps_reached()
             return True
 
+        return self._timeout_reached()
+
+    def _timeout_reached(self) -> bool:
         if self.timeout is not None and self.started_at is not None and time.time() - self.started_at > self.timeout:
             state.on_timeout()
             return True
@@ -141,20 +412,42 @@ class Flow:
         state.on_event(
             "flow_started",
             {
-                "flow": self,
+                "max_steps": self.max_steps,
+                "timeout": self.timeout,
+                "actors": [get_actor_name(actor) for actor in self.actors],
+                "conversation": str(self.actors[0].conv_window_strategy) if self.actors else None,
                 "state": state.as_dict(),
             },
         )
 
-        while not self.done():
-            await self.step()
+        self.started_at = time.time()
+        # the timeout is also checked between steps, this also interrupts a step in progress
+        task = asyncio.create_task(self._run())
+        try:
+            finished, _ = await asyncio.wait([task], timeout=self.timeout)
+            if not finished:
+                logger.warning(f"timeout of {self.timeout}s reached, cancelling the flow")
+                task.cancel()
+                finished, _ = await asyncio.wait([task], timeout=DEFAULT_CANCEL_GRACE)
+                if not finished:
+                    logger.error(f"flow still running {DEFAULT_CANCEL_GRACE}s after being cancelled, abandoning it")
+                state.on_timeout()
+            else:
+                # propagate errors
+                task.result()
+        finally:
+            if not task.done():
+                # the run itself was cancelled
+                task.cancel()
+            # another flow can run in this state
+            state.current().flow = None
 
         state.on_event(
             "flow_complete",
             {
-                "workflow": self.workflow,
+                "workflow": self.workflow.name if self.workflow else None,
                 "steps": self.curr_step - 1,
-                "usage": self.token_usage,
+                "usage": self.token_usage.model_copy(),
                 "state": state.as_dict(),
             },
         )
@@ -1,7 +1,17 @@
+import asyncio
+import copy
+import pathlib
+import time
+import typing as t
 from unittest.mock import MagicMock
 
 import pytest
 
+import nerve.runtime.state as state
+from nerve.generation import Usage
+from nerve.generation.conversation import FullHistoryStrategy
+from nerve.generation.litellm import LiteLLMEngine
+from nerve.models import Workflow
 from nerve.runtime.flow import Flow
 
 
@@ -19,3 +29,247 @@ def test_flow_singleton() -> None:
 
     # Verify the error message
     assert "A flow is already running" in str(excinfo.value)
+
+
+class FakeActor:
+    def __init__(self, name: str, variables: dict[str, str], delay: float = 0.0) -> None:
+        self.runtime = MagicMock()
+        self.runtime.name = name
+        self.runtime.working_dir = pathlib.Path.cwd()
+        self.conv_window_strategy = "full"
+        self.variables = variables
+        self.delay = delay
+        self.started_with: dict[str, t.Any] = {}
+
+    async def step(self) -> Usage:
+        self.started_with = dict(state.current().variables)
+        await asyncio.sleep(self.delay)
+        state.update_variables(self.variables)
+        state.set_task_complete()
+        return Usage(prompt_tokens=1, completion_tokens=1, total_tokens=2)
+
+
+def test_workflow_dependencies() -> None:
+    workflow = Workflow(
+        name="test",
+        description="test",
+        flow={
+            "a": Workflow.Actor(generator="test", depends_on=[]),
+            "b": Workflow.Actor(generator="test", depends_on=[]),
+            "c": Workflow.Actor(generator="test", depends_on=["a", "b"]),
+            "d": Workflow.Actor(generator="test"),
+        },
+    )
+
+    assert workflow.is_parallel
+    assert workflow.get_dependencies() == [[], [], [0, 1], [2]]
+
+    with pytest.raises(ValueError):
+        Workflow(
+            name="test",
+            description="test",
+            flow={"a": Workflow.Actor(generator="test", depends_on=["b"]), "b": Workflow.Actor(generator="test")},
+        )
+
+
+def test_parallel_flow() -> None:
+    # a and b run concurrently, a completes last but b is declared last and wins the conflict
+    a = FakeActor("a", {"shared": "a", "from_a": "a"}, delay=0.05)
+    b = FakeActor("b", {"shared": "b"})
+    c = FakeActor("c", {"from_c": "c"})
+
+    with state.run_context():
+        flow = Flow(actors=[a, b, c], dependencies=[[], [], [0, 1]], max_parallel=2)  # type: ignore
+        started_at = time.monotonic()
+        asyncio.run(flow.run())
+
+        assert time.monotonic() - started_at < 0.1
+        assert c.started_with["from_a"] == "a"
+        assert state.current().variables == {"shared": "b", "from_a": "a", "from_c": "c"}
+        assert flow.curr_step == 3
+        assert flow.token_usage.total_tokens == 6
+
+
+def test_parallel_flow_limit() -> None:
+    actors = [FakeActor(name, {}, delay=0.05) for name in ("a", "b", "c")]
+
+    with state.run_context():
+        flow = Flow(actors=actors, dependencies=[[], [], []], max_parallel=1)  # type: ignore
+        started_at = time.monotonic()
+        asyncio.run(flow.run())
+
+        assert time.monotonic() - started_at >= 0.15
+
+
+def test_flow_keeps_process_working_dir(tmp_path: pathlib.Path) -> None:
+    actor = FakeActor("a", {})
+    actor.runtime.working_dir = tmp_path
+    cwd = pathlib.Path.cwd()
+
+    with state.run_context() as run_state:
+        flow = Flow(actors=[actor])  # type: ignore
+        asyncio.run(flow.run())
+
+    # shared by the concurrent runs, tools use the working directory of the run state
+    assert pathlib.Path.cwd() == cwd
+    assert run_state.working_dir == tmp_path
+
+
+class ItemActor(FakeActor):
+    def __init__(self) -> None:
+        super().__init__("scan", {}, delay=0.05)
+        self.forks: list[ItemActor] = []
+
+    def fork(self) -> "ItemActor":
+        fork = copy.copy(self)
+        self.forks.append(fork)
+        return fork
+
+    async def step(self) -> Usage:
+        host = state.get_variable("host")
+        self.variables = {"report": f"{host} is up", "scanned": host}
+        return await super().step()
+
+
+def _map_workflow(**map_options: t.Any) -> Workflow:
+    return Workflow(
+        name="test",
+        description="test",
+        flow={
+            "scan": Workflow.Actor(generator="test", map="hosts", item="host", **map_options),
+            "summary": Workflow.Actor(generator="test"),
+        },
+    )
+
+
+def test_map_actor() -> None:
+    actor = ItemActor()
+    summary = FakeActor("summary", {"summary": "done"})
+
+    with state.run_context():
+        state.update_variables({"hosts": "a.com\nb.com\n\nc.com\n"})
+        flow = Flow(
+            actors=[actor, summary],  # type: ignore
+            workflow=_map_workflow(result="report", output="reports", concurrency=3),
+        )
+        started_at = time.monotonic()
+        asyncio.run(flow.run())
+
+        assert time.monotonic() - started_at < 0.1
+        assert len(actor.forks) == 3
+        assert state.get_variable("reports") == ["a.com is up", "b.com is up", "c.com is up"]
+        assert summary.started_with["reports"] == ["a.com is up", "b.com is up", "c.com is up"]
+        # the variables of each run are not merged
+        assert state.get_variable("report") is None
+
+
+def test_map_actor_in_parallel_workflow() -> None:
+    with state.run_context():
+        state.update_variables({"hosts": '["a.com", "b.com"]'})
+        flow = Flow(
+            actors=[ItemActor(), FakeActor("summary", {})],  # type: ignore
+            workflow=_map_workflow(),
+            dependencies=[[], [0]],
+        )
+        asyncio.run(flow.run())
+
+        assert state.get_variable("hosts_results") == [
+            {"report": "a.com is up", "scanned": "a.com"},
+            {"report": "b.com is up", "scanned": "b.com"},
+        ]
+
+
+class MultiStepItemActor(ItemActor):
+    def __init__(self, steps: int) -> None:
+        super().__init__()
+        self.delay = 0.0
+        self.steps = steps
+        self.item_steps = 0
+
+    async def step(self) -> Usage:
+        self.item_steps += 1
+        if self.item_steps < self.steps:
+            return Usage(prompt_tokens=1, completion_tokens=1, total_tokens=2)
+        return await super().step()
+
+
+@pytest.mark.parametrize("item_steps", [2, 3])
+def test_map_items_have_their_own_step_budget(item_steps: int) -> None:
+    hosts = [f"{i}.com" for i in range(200)]
+    summary = FakeActor("summary", {"summary": "done"})
+
+    with state.run_context():
+        state.update_variables({"hosts": hosts})
+        flow = Flow(
+            actors=[MultiStepItemActor(item_steps), summary],  # type: ignore
+            workflow=_map_workflow(result="report", concurrency=50),
+            max_steps=2,
+        )
+        asyncio.run(flow.run())
+
+        complete = state.get_events(name="map_complete")[0].data or {}
+        if item_steps == 2:
+            # more steps than max_steps in total, but not for any element
+            assert state.get_variable("hosts_results") == [f"{host} is up" for host in hosts]
+            assert complete["failed"] == [] and complete["skipped"] == []
+        else:
+            assert state.get_variable("hosts_results") == [None] * len(hosts)
+            assert complete["failed"] == list(range(len(hosts)))
+
+        # the next actor still runs within the budget of the flow
+        assert summary.started_with
+        assert flow.map_steps == len(hosts) * min(item_steps, 2)
+
+
+class StuckActor(FakeActor):
+    async def step(self) -> Usage:
+        await asyncio.sleep(30)
+        return Usage(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+
+
+def test_flow_timeout_interrupts_step() -> None:
+    with state.run_context():
+        flow = Flow(actors=[StuckActor("stuck", {})], timeout=0.1)  # type: ignore
+        started_at = time.monotonic()
+        asyncio.run(flow.run())
+
+        assert time.monotonic() - started_at < 1
+        assert state.current().reason == "timeout reached"
+        assert state.get_events(name="flow_complete")
+
+
+def blocking_tool() -> str:
+    """Blocks the thread running it."""
+
+    time.sleep(3)
+    return "done"
+
+
+class BlockingToolActor(FakeActor):
+    def __init__(self) -> None:
+        super().__init__("blocking", {})
+        self.engine = LiteLLMEngine("openai/gpt-4o", FullHistoryStrategy(), [blocking_tool])
+
+    async def step(self) -> Usage:
+        await self.engine._call_tool("call_1", "blocking_tool", "{}", {})
+        return await super().step()
+
+
+def test_flow_timeout_with_blocking_tool() -> None:
+    with state.run_context():
+        flow = Flow(actors=[BlockingToolActor()], timeout=0.1)  # type: ignore
+        started_at = time.monotonic()
+        # asyncio.run also waits for the threads of the default executor before returning
+        asyncio.run(flow.run())
+
+        assert time.monotonic() - started_at < 1
+        assert state.current().reason == "timeout reached"
+
+
+def test_step_timeout() -> None:
+    with state.run_context():
+        flow = Flow(actors=[StuckActor("stuck", {})], max_steps=1, step_timeout=0.05)  # type: ignore
+        asyncio.run(flow.run())
+
+        assert [(event.data or {})["step"] for event in state.get_events(name="step_timeout")] == [0, 1]
+        assert state.current().reason == "max steps reached"
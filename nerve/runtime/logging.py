@@ -61,27 +61,60 @@ class DictWrapper:
         return str(self._data)
 
 
+def _actor_name(actor: t.Any) -> t.Any:
+    # traces recorded by older versions embed the whole actor
+    if isinstance(actor, dict):
+        return DictWrapper(actor).runtime.name
+    return actor
+
+
 def log_event_to_terminal(event: Event) -> None:
     data = event.data or {}
     if event.name == "flow_started":
-        if isinstance(data["flow"], dict):
-            data["flow"] = DictWrapper(data["flow"])
-
-        max_steps = data["flow"].max_steps
-        timeout = data["flow"].timeout
-        timeout = f"{timeout}s timeout" if timeout else "no timeout"
-        conv_window_strategy = data["flow"].actors[0].conv_window_strategy
-        logger.info(f"🚀 {max_steps} max steps | {timeout} | {conv_window_strategy}")
+        if "flow" in data:
+            # recorded by an older version, with the whole flow
+            flow = DictWrapper(data["flow"]) if isinstance(data["flow"], dict) else data["flow"]
+            data = {
+                "max_steps": flow.max_steps,
+                "timeout": flow.timeout,
+                "conversation": flow.actors[0].conv_window_strategy,
+            }
+
+        timeout = f"{data['timeout']}s timeout" if data["timeout"] else "no timeout"
+        logger.info(f"🚀 {data['max_steps']} max steps | {timeout} | {data['conversation']}")
+
+    elif event.name == "map_started":
+        logger.info(f"🔀 {data['actor']} running on {data['items']} elements of {data['variable']}")
+
+    elif event.name == "map_complete":
+        logger.info(f"🔀 {data['actor']} collected {data['results']} results in {data['output']}")
+        if data.get("failed"):
+            logger.warning(f"🔀 {data['actor']} failed on elements {data['failed']}")
+        if data.get("skipped"):
+            logger.warning(f"🔀 {data['actor']} did not run on elements {data['skipped']}")
+
+    elif event.name == "step_timeout":
+        logger.warning(f"⏱️  step {data['step']} of {data['actor']} cancelled after {data['timeout']}s")
+
+    elif event.name == "flow_resumed":
+        actor = f" ({data['actor']})" if data["actor"] else ""
+        logger.info(f"⏯️  resuming from step {data['step']}{actor}")
 
     elif event.name == "agent_created":
-        if isinstance(data["agent"], dict):
-            data["agent"] = DictWrapper(data["agent"])
-
-        generator = data["agent"].runtime.generator
-        name = data["agent"].runtime.name
-        version = data["agent"].configuration.version
-        tools = len(data["agent"].runtime.tools)
-        logger.info(f"🤖 {generator} | {name} v{version} with {tools} tools")
+        if "agent" in data:
+            # recorded by an older version, with the whole agent
+            agent = DictWrapper(data["agent"]) if isinstance(data["agent"], dict) else data["agent"]
+            data = {
+                "generator": agent.runtime.generator,
+                "name": agent.runtime.name,
+                "version": agent.configuration.version,
+                "tools": len(agent.runtime.tools),
+            }
+
+        generator = data["generator"]
+        if isinstance(generator, list):
+            generator = " → ".join(generator)
+        logger.info(f"🤖 {generator} | {data['name']} v{data['version']} with {data['tools']} tools")
 
     elif event.name == "before_tool_called":
         args_str = ", ".join([f"{k}={v}" for k, v in data["args"].items()])
@@ -103,14 +136,11 @@ def log_event_to_terminal(event: Event) -> None:
         logger.info(f"🛠️  {data['name']}({args_str}) -> {ret}{elapsed_time:.4f} seconds")
 
     elif event.name == "task_complete":
-        if isinstance(data["actor"], dict):
-            data["actor"] = DictWrapper(data["actor"])
-
         reason = f": {data['reason']}" if data["reason"] else ""
-        logger.info(f"✅ task {data['actor'].runtime.name} completed{reason}")
+        logger.info(f"✅ task {_actor_name(data['actor'])} completed{reason}")
 
     elif event.name == "task_failed":
-        logger.error(f"❌ task {data['actor'].runtime.name} failed: {data['reason']}")
+        logger.error(f"❌ task {_actor_name(data['actor'])} failed: {data['reason']}")
 
     elif event.name == "tool_created":
         logger.info(f"🧰 registered tool: {data['name']}")
@@ -124,6 +154,19 @@ def log_event_to_terminal(event: Event) -> None:
     elif event.name == "flow_complete":
         logger.info(f"⚙️  flow complete in {data['steps']} steps")
 
+    elif event.name == "generator_failed":
+        circuit = " (circuit open)" if data["circuit_open"] else ""
+        logger.warning(f"🔌 {data['generator']} failed{circuit}: {data['error']}")
+
+    elif event.name == "request_hedged":
+        logger.debug(f"⏱️  {data['generator']} slower than {data['delay']:.1f}s, hedging with {data['hedge_generator']}")
+
+    elif event.name == "rate_limited":
+        logger.info(f"🚦 {data['generator']} rate limit reached, waiting {data['wait']:.1f}s")
+
+    elif event.name == "conversation_summarized":
+        logger.info(f"📝 summarized {data['messages']} messages with {data['generator']}")
+
     elif event.name == "text_response":
         logger.info(f"💬 {data['response']}")
 
@@ -136,7 +179,17 @@ def log_event_to_terminal(event: Event) -> None:
         else:
             logger.info(f"📊 [step {data['step']}]")
 
-    elif event.name in ("task_started", "agent_step", "step_complete", "variable_change", "knowledge_change"):
+    elif event.name in (
+        "task_started",
+        "agent_step",
+        "step_complete",
+        "variable_change",
+        "knowledge_change",
+        "text_delta",
+        "tool_call_ready",
+        "response_cached",
+        "assistant_message",
+    ):
         pass
     else:
         logger.info(f"unknown event: {event}")
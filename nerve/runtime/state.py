@@ -1,6 +1,9 @@
-import json
+import contextlib
+import contextvars
+import functools
 import os
 import pathlib
+import threading
 import typing as t
 
 import click
@@ -8,93 +11,194 @@ import jinja2
 from loguru import logger
 
 from nerve.models import Mode, Status
-from nerve.runtime.events import Event
-
-# the current actor
-_current_actor: t.Any | None = None
-# event log
-_events: list[Event] = []
-# trace file
-_trace_file: pathlib.Path | None = None
-# working mode
-_mode: Mode = Mode.AUTOMATIC
-# the status of the active task
-_task_status: Status = Status.RUNNING
-# the reason for failed status
-_reason: str | None = None
-# variables
-_variables: dict[str, t.Any] = {}
-# similar to variables but used by tools
-_knowledge: dict[str, t.Any] = {}
-# extra tools defined at runtime
-_extra_tools: dict[str, t.Callable[..., t.Any]] = {}
-# listeners for events
+from nerve.runtime.events import Event, EventLog, actor_name
+from nerve.runtime.trace import CustomJSONEncoder, TraceWriter  # noqa: F401
+
+
+class RunState:
+    """
+    The state of a single run (the current actor, variables, knowledge, events, ...).
+
+    The module level functions operate on the run state of the current context, so that independent runs
+    can execute concurrently in the same process, each in its own asyncio task (see run_context).
+    """
+
+    def __init__(self) -> None:
+        # the current actor
+        self.current_actor: t.Any | None = None
+        # the step of the flow being executed, if any
+        self.current_step: int | None = None
+        # the flow running in this state, if any
+        self.flow: t.Any | None = None
+        # the most recent events
+        self.events = EventLog()
+        # trace file and its writer
+        self.trace_file: pathlib.Path | None = None
+        self.trace_writer: TraceWriter | None = None
+        # working mode
+        self.mode: Mode = Mode.AUTOMATIC
+        # the working directory of the active task
+        self.working_dir: pathlib.Path | None = None
+        # the status of the active task
+        self.task_status: Status = Status.RUNNING
+        # the reason for failed status
+        self.reason: str | None = None
+        # variables
+        self.variables: dict[str, t.Any] = {}
+        # similar to variables but used by tools
+        self.knowledge: dict[str, t.Any] = {}
+        # guards the knowledge updates of tools running concurrently in worker threads
+        self.knowledge_lock = threading.RLock()
+        # extra tools defined at runtime
+        self.extra_tools: dict[str, t.Callable[..., t.Any]] = {}
+        # variables and knowledge at the time this state was forked
+        self._forked_variables: dict[str, t.Any] = {}
+        self._forked_knowledge: dict[str, t.Any] = {}
+        # position of the last branch that set each variable and piece of knowledge (see merge)
+        self._merge_order: dict[tuple[str, str], int] = {}
+
+    def fork(self) -> "RunState":
+        """
+        Create the state of a branch of this run (for actors running concurrently): it starts with a copy of
+        the variables, knowledge and extra tools, has its own task status, and records to the same events.
+        """
+
+        child = RunState()
+        child.events = self.events
+        child.trace_file = self.trace_file
+        child.trace_writer = self.trace_writer
+        child.mode = self.mode
+        child.working_dir = self.working_dir
+        child.variables = dict(self.variables)
+        child.knowledge = dict(self.knowledge)
+        child.extra_tools = dict(self.extra_tools)
+        child._forked_variables = dict(self.variables)
+        child._forked_knowledge = dict(self.knowledge)
+        return child
+
+    def changed_variables(self) -> dict[str, t.Any]:
+        """Get the variables set since this state was forked."""
+
+        return {
+            key: value
+            for key, value in self.variables.items()
+            if key not in self._forked_variables or self._forked_variables[key] is not value
+        }
+
+    def merge(self, child: "RunState", order: int | None = None) -> None:
+        """
+        Apply the variables, knowledge and extra tools set by a forked branch. Merging branches in a
+        fixed order makes the result deterministic, later branches override earlier ones. Branches can
+        also be merged as they complete with their position in that order: a value is then not applied
+        if a branch coming later in the order already set it.
+        """
+
+        for kind, values, forked, merged in (
+            ("variables", self.variables, child._forked_variables, child.variables),
+            ("knowledge", self.knowledge, child._forked_knowledge, child.knowledge),
+        ):
+            for key, value in merged.items():
+                if key in forked and forked[key] is value:
+                    continue
+
+                if order is not None:
+                    if self._merge_order.get((kind, key), order) > order:
+                        continue
+                    self._merge_order[(kind, key)] = order
+
+                values[key] = value
+
+        self.extra_tools.update(child.extra_tools)
+
+
+# the state used when no run state is set for the current context
+_default_state = RunState()
+# the run state of the current context
+_current_state: contextvars.ContextVar[RunState] = contextvars.ContextVar("run_state", default=_default_state)
+# listeners for events, shared by every run
 _listeners: list[t.Callable[[Event], None]] = []
 
 
+def current() -> RunState:
+    """Get the run state of the current context."""
+
+    return _current_state.get()
+
+
+@contextlib.contextmanager
+def run_context(run_state: RunState | None = None) -> t.Iterator[RunState]:
+    """
+    Use a new (or the given) run state for the current context. Each asyncio task has its own context,
+    so a flow created and executed within this block in a task is isolated from the ones in other tasks.
+    """
+
+    run_state = run_state or RunState()
+    token = _current_state.set(run_state)
+    try:
+        yield run_state
+    finally:
+        _current_state.reset(token)
+
+
 def add_event_listener(listener: t.Callable[[Event], None]) -> None:
     """Add a listener function for events."""
 
-    global _listeners
     _listeners.append(listener)
 
 
 def set_trace_file(trace_file: pathlib.Path) -> None:
     """Enable recording of events to a file."""
 
-    global _trace_file
+    run_state = current()
 
     if trace_file.exists():
         logger.error(f"trace file {trace_file} already exists")
         exit(1)
 
-    _trace_file = trace_file.absolute()
-    logger.info(f"🔍 tracing to {_trace_file}")
-
-
-class CustomJSONEncoder(json.JSONEncoder):
-    def default(self, o: t.Any) -> t.Any:
-        logger.debug("serializing", o)
-        if hasattr(o, "model_dump"):
-            return o.model_dump()
-        elif hasattr(o, "__dict__"):
-            return o.__dict__
-        elif hasattr(o, "__str__"):
-            return str(o)
+    run_state.trace_file = trace_file.absolute()
+    run_state.trace_writer = TraceWriter(run_state.trace_file)
+    logger.info(f"🔍 tracing to {run_state.trace_file}")
 
-        return super().default(o)
 
-
-def on_event(name: str, data: t.Any | None = None) -> None:
+def on_event(name: str, data: dict[str, t.Any] | None = None) -> None:
     """Register an event."""
 
-    global _events
+    run_state = current()
 
     event = Event(name=name, data=data)
-    _events.append(event)
+    run_state.events.append(event)
 
     for listener in _listeners:
         listener(event)
 
-    if _trace_file:
-        with open(_trace_file, "a+t") as f:
-            line = json.dumps(event.model_dump(), cls=CustomJSONEncoder)
-            f.write(f"{line}\n")
+    if run_state.trace_writer:
+        # encoded and written in the background
+        run_state.trace_writer.write(event)
+
+
+def get_events(limit: int | None = None, name: str | None = None, since: float | None = None) -> list[Event]:
+    """Get the most recent events of the current run (see EventLog.recent)."""
+
+    return current().events.recent(limit, name, since)
 
 
 def on_task_started(actor: t.Any) -> None:
     """Register a task start."""
 
-    global _current_actor
-    _current_actor = actor
-    on_event("task_started", {"actor": actor})
+    current().current_actor = actor
+    on_event("task_started", {"actor": actor_name(actor)})
 
 
 def get_current_actor() -> t.Any:
     """Get the current actor."""
 
-    global _current_actor
-    return _current_actor
+    return current().current_actor
+
+
+def set_current_step(step: int | None) -> None:
+    """Set the step of the flow being executed."""
+
+    current().current_step = step
 
 
 def on_before_tool_called(
@@ -122,9 +226,13 @@ def on_tool_called(
 ) -> None:
     """Register a tool call (after it is executed)."""
 
+    run_state = current()
     on_event(
         "tool_called",
         {
+            # actors of parallel workflows step concurrently, each in its own branch of the state
+            "step": run_state.current_step,
+            "actor": actor_name(run_state.current_actor),
             "started_at": started_at,
             "finished_at": finished_at,
             "name": name,
@@ -135,145 +243,159 @@ def on_tool_called(
     )
 
 
+def set_working_dir(working_dir: pathlib.Path) -> None:
+    """Set the working directory of the active task."""
+
+    current().working_dir = working_dir
+
+
+def get_working_dir() -> pathlib.Path | None:
+    """Get the working directory of the active task, if set."""
+
+    return current().working_dir
+
+
 def set_mode(new_mode: Mode) -> None:
     """Set the mode."""
 
-    global _mode
+    run_state = current()
 
-    if _mode != new_mode:
-        on_event("mode_change", {"from": _mode, "to": new_mode})
+    if run_state.mode != new_mode:
+        on_event("mode_change", {"from": run_state.mode, "to": new_mode})
 
-    _mode = new_mode
+    run_state.mode = new_mode
 
 
 def is_active_task_done() -> bool:
     """Check if the active task is done."""
 
-    return _task_status.is_done()
+    return current().task_status.is_done()
 
 
 def set_task_complete(the_reason: str | None = None) -> None:
     """Set the task as complete."""
 
-    global _task_status, _reason
-    _task_status = Status.COMPLETED
-    _reason = the_reason
-    on_event("task_complete", {"actor": _current_actor, "reason": the_reason})
+    run_state = current()
+    run_state.task_status = Status.COMPLETED
+    run_state.reason = the_reason
+    on_event("task_complete", {"actor": actor_name(run_state.current_actor), "reason": the_reason})
 
 
 def set_task_failed(the_reason: str) -> None:
     """Set the task as failed."""
 
-    global _task_status, _reason
-    _task_status = Status.FAILED
-    _reason = the_reason
-    on_event("task_failed", {"reason": _reason, "actor": _current_actor})
+    run_state = current()
+    run_state.task_status = Status.FAILED
+    run_state.reason = the_reason
+    on_event("task_failed", {"reason": run_state.reason, "actor": actor_name(run_state.current_actor)})
 
 
 def on_max_steps_reached() -> None:
     """Set the task as failed due to max steps reached."""
 
-    global _task_status, _reason
-    if _task_status == Status.RUNNING:
+    if current().task_status == Status.RUNNING:
         set_task_failed("max steps reached")
 
 
 def on_timeout() -> None:
     """Set the task as failed due to timeout."""
 
-    global _task_status, _reason
-    if _task_status == Status.RUNNING:
+    if current().task_status == Status.RUNNING:
         set_task_failed("timeout reached")
 
 
 def as_dict() -> dict[str, t.Any]:
     """Get the current state as a dictionary."""
 
+    run_state = current()
     return {
-        "mode": _mode,
+        "mode": run_state.mode,
         "current_task": {
-            "status": _task_status,
-            "reason": _reason,
+            "status": run_state.task_status,
+            "reason": run_state.reason,
         },
-        "variables": _variables,
-        "knowledge": _knowledge,
+        # copies, as the events referencing them are serialized later
+        "variables": dict(run_state.variables),
+        "knowledge": dict(run_state.knowledge),
     }
 
 
 def get_extra_tools() -> dict[str, t.Callable[..., t.Any]]:
     """Get any extra tool registered at runtime."""
 
-    global _extra_tools
-    return _extra_tools
+    return current().extra_tools
 
 
 def set_extra_tool(tool: t.Callable[..., t.Any]) -> None:
     """Register an extra tool at runtime (used by anytool namespace)."""
 
-    global _extra_tools
-    _extra_tools[tool.__name__] = tool
-    on_event("tool_created", {"name": tool.__name__, "code": tool.__code__.co_code})
+    current().extra_tools[tool.__name__] = tool
+    on_event("tool_created", {"name": tool.__name__})
 
 
 def get_variable(key: str, default: t.Any = None) -> t.Any:
     """Get a variable."""
 
-    global _variables
-    return _variables.get(key, default)
+    return current().variables.get(key, default)
 
 
 def get_knowledge() -> dict[str, t.Any]:
     """Get the knowledge variable (a piece of information appearing in the system prompt)."""
 
-    global _knowledge
-    return _knowledge
+    return current().knowledge
 
 
 def write_knowledge(key: str, value: t.Any) -> None:
     """Write a piece of knowledge that will be used in the system prompt."""
 
-    global _knowledge
+    run_state = current()
+    with run_state.knowledge_lock:
+        knowledge = run_state.knowledge
 
-    on_event("knowledge_change", {"name": key, "from": _knowledge.get(key), "to": value})
+        on_event("knowledge_change", {"name": key, "from": knowledge.get(key), "to": value})
 
-    _knowledge[key] = value
+        knowledge[key] = value
 
 
 def append_to_knowledge(key: str, value: t.Any) -> None:
     """Append a piece of knowledge to the existing knowledge."""
 
-    global _knowledge
-    if key not in _knowledge:
-        write_knowledge(key, value)
-    else:
-        write_knowledge(key, _knowledge[key] + "\n" + value)
+    run_state = current()
+    with run_state.knowledge_lock:
+        knowledge = run_state.knowledge
+        if key not in knowledge:
+            write_knowledge(key, value)
+        else:
+            write_knowledge(key, knowledge[key] + "\n" + value)
 
 
 def clear_knowledge(key: str) -> None:
     """Remove a piece of knowledge."""
 
-    global _knowledge
-    if key in _knowledge:
-        on_event("knowledge_change", {"name": key, "from": _knowledge[key], "to": None})
-        del _knowledge[key]
+    run_state = current()
+    with run_state.knowledge_lock:
+        knowledge = run_state.knowledge
+        if key in knowledge:
+            on_event("knowledge_change", {"name": key, "from": knowledge[key], "to": None})
+            del knowledge[key]
 
 
 def update_variables(update: dict[str, t.Any]) -> None:
     """Update variables."""
 
-    global _variables
+    variables = current().variables
     for key, value in update.items():
-        on_event("variable_change", {"name": key, "from": _variables.get(key), "to": value})
-    _variables.update(update)
+        on_event("variable_change", {"name": key, "from": variables.get(key), "to": value})
+    variables.update(update)
 
 
 def reset() -> None:
-    """Reset the state."""
+    """Reset the state of the active task."""
 
-    global _task_status, _reason, _knowledge
-    _task_status = Status.RUNNING
-    _reason = None
-    _knowledge = {}
+    run_state = current()
+    run_state.task_status = Status.RUNNING
+    run_state.reason = None
+    run_state.knowledge = {}
 
 
 def on_user_input_needed(input_name: str, prompt: str) -> str:
@@ -283,10 +405,11 @@ def on_user_input_needed(input_name: str, prompt: str) -> str:
     if input_name in os.environ:
         return os.environ[input_name]
 
-    elif input_name in _variables:
-        return str(_variables[input_name])
+    run_state = current()
+    if input_name in run_state.variables:
+        return str(run_state.variables[input_name])
 
-    if _mode == Mode.INTERACTIVE:
+    if run_state.mode == Mode.INTERACTIVE:
         # ask the user
         return input(prompt).strip()
     else:
@@ -300,27 +423,39 @@ def on_user_input_needed(input_name: str, prompt: str) -> str:
         )
 
 
-def interpolate(raw: str, extra: dict[str, t.Any] | None = None) -> str:
-    """Interpolate the current state into a string."""
+class OnUndefinedVariable(jinja2.Undefined):
+    """Ask for (or get from the environment) the value of an undefined variable, and save it to the state."""
 
-    class OnUndefinedVariable(jinja2.Undefined):
-        def __init__(self, *args: t.Any, **kwargs: t.Any) -> None:
-            super().__init__(*args, **kwargs)
+    def __init__(self, *args: t.Any, **kwargs: t.Any) -> None:
+        super().__init__(*args, **kwargs)
 
-            global _variables
+        undefined_name = self._undefined_name or ""
 
-            undefined_name = self._undefined_name or ""
+        logger.debug(f"undefined variable encountered: {undefined_name}")
+        logger.debug(f"current variables: {current().variables}")
 
-            logger.debug(f"undefined variable encountered: {undefined_name}")
-            logger.debug(f"current variables: {_variables}")
+        self.value = on_user_input_needed(undefined_name, f"Enter value for '{undefined_name}': ")
 
-            self.value = on_user_input_needed(undefined_name, f"Enter value for '{undefined_name}': ")
+        # save to state
+        update_variables({undefined_name or "": self.value or ""})
 
-            # save to state
-            update_variables({undefined_name or "": self.value or ""})
+    def __str__(self) -> str:
+        return self.value or "<UNDEFINED>"
 
-        def __str__(self) -> str:
-            return self.value or "<UNDEFINED>"
 
-    context = _variables | (extra or {})
-    return jinja2.Environment(undefined=OnUndefinedVariable).from_string(raw).render(**context)
+# max number of compiled templates kept in memory
+TEMPLATE_CACHE_SIZE: int = 512
+
+_environment = jinja2.Environment(undefined=OnUndefinedVariable)
+
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def _compile_template(raw: str) -> jinja2.Template:
+    return _environment.from_string(raw)
+
+
+def interpolate(raw: str, extra: dict[str, t.Any] | None = None) -> str:
+    """Interpolate the current state into a string."""
+
+    context = current().variables | (extra or {})
+    return _compile_template(raw).render(**context)
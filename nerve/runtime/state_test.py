@@ -0,0 +1,107 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import typing as t
+from types import SimpleNamespace
+
+import nerve.runtime.state as state
+from nerve.models import Status
+
+
+def test_run_contexts_are_isolated() -> None:
+    async def run(name: str) -> tuple[str, Status]:
+        with state.run_context():
+            state.update_variables({"name": name})
+            await asyncio.sleep(0.01)
+            if name == "first":
+                state.set_task_complete()
+            await asyncio.sleep(0.01)
+            return state.get_variable("name"), state.current().task_status
+
+    async def main() -> list[tuple[str, Status]]:
+        return list(await asyncio.gather(run("first"), run("second")))
+
+    assert asyncio.run(main()) == [("first", Status.COMPLETED), ("second", Status.RUNNING)]
+    assert state.get_variable("name") is None
+
+
+def test_run_context_events() -> None:
+    with state.run_context() as run_state:
+        state.on_event("test_event", {"value": 1})
+
+    assert [event.name for event in run_state.events] == ["test_event"]
+    assert all(event.name != "test_event" for event in state.current().events)
+
+
+def test_tool_called_step_and_actor() -> None:
+    actor = SimpleNamespace(runtime=SimpleNamespace(name="agent"))
+    with state.run_context() as run_state:
+        state.on_task_started(actor)
+        state.set_current_step(3)
+        state.on_tool_called(0.0, 1.0, "shell")
+
+    data = run_state.events.recent(name="tool_called")[0].data or {}
+    assert (data["step"], data["actor"]) == (3, "agent")
+
+
+def test_fork_and_merge() -> None:
+    parent = state.RunState()
+    parent.variables = {"shared": "value", "overridden": "old"}
+
+    first = parent.fork()
+    second = parent.fork()
+    with state.run_context(first):
+        state.update_variables({"overridden": "first", "from_first": 1})
+        state.set_task_complete()
+    with state.run_context(second):
+        state.update_variables({"overridden": "second"})
+        state.write_knowledge("note", "from second")
+
+    # branches don't see each other's changes and share the event log
+    assert second.variables == {"shared": "value", "overridden": "second"}
+    assert second.task_status == Status.RUNNING
+    assert first.events is parent.events
+    assert len(parent.events) == 5
+
+    parent.merge(first)
+    parent.merge(second)
+
+    assert parent.variables == {"shared": "value", "overridden": "second", "from_first": 1}
+    assert parent.knowledge == {"note": "from second"}
+
+
+def test_interpolate_compiles_templates_once() -> None:
+    with state.run_context():
+        state.update_variables({"name": "nerve"})
+        state._compile_template.cache_clear()
+
+        assert state.interpolate("hello {{ name }}") == "hello nerve"
+        assert state.interpolate("hello {{ name }}", {"name": "world"}) == "hello world"
+
+        assert state._compile_template.cache_info().misses == 1
+        assert state._compile_template.cache_info().hits == 1
+
+
+def test_interpolate_undefined_variable_from_environment(monkeypatch: t.Any) -> None:
+    monkeypatch.setenv("NERVE_TEST_UNDEFINED", "from env")
+
+    with state.run_context():
+        assert state.interpolate("value: {{ NERVE_TEST_UNDEFINED }}") == "value: from env"
+        assert state.get_variable("NERVE_TEST_UNDEFINED") == "from env"
+
+
+def test_append_to_knowledge_from_threads() -> None:
+    with state.run_context() as run_state:
+        state.write_knowledge("notes", "start")
+
+        def append(i: int) -> None:
+            for j in range(50):
+                state.append_to_knowledge("notes", f"{i}-{j}")
+
+        # tools run in worker threads with a copy of the context of the run
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, append, i) for i in range(8)]
+            for future in futures:
+                future.result()
+
+    assert len(run_state.knowledge["notes"].split("\n")) == 1 + 8 * 50
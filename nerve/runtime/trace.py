@@ -0,0 +1,377 @@
+import atexit
+import gzip
+import io
+import json
+import os
+import pathlib
+import queue
+import struct
+import threading
+import typing as t
+
+from loguru import logger
+
+from nerve.runtime.events import Event
+
+# max number of events waiting to be written, producers block when the queue is full
+DEFAULT_QUEUE_SIZE: int = 10000
+# max number of events written at once
+DEFAULT_BATCH_SIZE: int = 256
+# when to fsync the trace file: never, after every batch or when closing it
+DEFAULT_FSYNC: str = os.getenv("NERVE_TRACE_FSYNC", "close")
+
+FSYNC_POLICIES = ("never", "batch", "close")
+
+# extensions of traces in the msgpack format
+MSGPACK_SUFFIXES = (".msgpack", ".mpk")
+# length prefix of each msgpack record
+RECORD_HEADER = struct.Struct(">I")
+
+
+class CustomJSONEncoder(json.JSONEncoder):
+    def default(self, o: t.Any) -> t.Any:
+        logger.debug("serializing", o)
+        if hasattr(o, "model_dump"):
+            return o.model_dump()
+        elif hasattr(o, "__dict__"):
+            return o.__dict__
+        elif hasattr(o, "__str__"):
+            return str(o)
+
+        return super().default(o)
+
+
+def _import_zstandard() -> t.Any:
+    try:
+        import zstandard
+
+        return zstandard
+    except ImportError:
+        logger.error("zstandard package not installed. Run: pip install zstandard")
+        raise
+
+
+def _is_zstd(path: pathlib.Path) -> bool:
+    return path.suffix in (".zst", ".zstd")
+
+
+def open_for_append(path: pathlib.Path) -> t.BinaryIO:
+    """Open a trace file for writing, compressed with gzip or zstd depending on its extension."""
+
+    if path.suffix == ".gz":
+        return t.cast(t.BinaryIO, gzip.open(path, "ab"))
+    elif _is_zstd(path):
+        zstandard = _import_zstandard()
+        return t.cast(t.BinaryIO, zstandard.ZstdCompressor().stream_writer(open(path, "ab"), closefd=True))
+
+    return open(path, "ab")
+
+
+def open_for_reading(path: pathlib.Path) -> t.TextIO:
+    """Open a (possibly compressed) trace file for reading."""
+
+    if path.suffix == ".gz":
+        return t.cast(t.TextIO, gzip.open(path, "rt"))
+    elif _is_zstd(path):
+        zstandard = _import_zstandard()
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True, closefd=True)
+        return io.TextIOWrapper(reader)
+
+    return open(path)
+
+
+def encode_event(event: Event) -> bytes:
+    """Encode an event as a line of JSON."""
+
+    try:
+        line = json.dumps(event.to_dict(), cls=CustomJSONEncoder)
+    except Exception as e:
+        # the data changed while it was being encoded, or can't be encoded at all
+        logger.debug(f"could not encode event {event.name}: {e}")
+        line = json.dumps({"timestamp": event.timestamp, "name": event.name, "data": repr(event.data)})
+
+    return f"{line}\n".encode()
+
+
+def is_msgpack(path: pathlib.Path) -> bool:
+    return path.suffix in MSGPACK_SUFFIXES
+
+
+def get_index_path(path: pathlib.Path) -> pathlib.Path:
+    """Path of the sidecar index of a msgpack trace."""
+
+    return path.with_name(path.name + ".idx")
+
+
+def _import_msgpack() -> t.Any:
+    try:
+        import msgpack
+
+        return msgpack
+    except ImportError:
+        logger.error("msgpack package not installed. Run: pip install msgpack")
+        raise
+
+
+def _msgpack_default(o: t.Any) -> t.Any:
+    if hasattr(o, "model_dump"):
+        return o.model_dump()
+    elif hasattr(o, "__dict__"):
+        return o.__dict__
+    return str(o)
+
+
+class _JSONLSink:
+    """Events as lines of JSON, optionally compressed."""
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self.file = open_for_append(path)
+
+    def write(self, events: list[Event]) -> None:
+        self.file.write(b"".join(encode_event(event) for event in events))
+        self.file.flush()
+
+    def sync(self) -> None:
+        _sync(self.file)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class _MsgpackSink:
+    """
+    Events as msgpack records prefixed by their length, with a sidecar index of
+    [offset, timestamp, step, name] records to seek to the events without decoding the others.
+    """
+
+    def __init__(self, path: pathlib.Path) -> None:
+        self.msgpack = _import_msgpack()
+        self.file = open(path, "ab")
+        self.index = open(get_index_path(path), "ab")
+        self.offset = self.file.tell()
+        # the step the next events belong to (-1 before the first step)
+        self.step = -1
+
+    def _encode(self, event: Event) -> bytes:
+        try:
+            return t.cast(bytes, self.msgpack.packb(event.to_dict(), default=_msgpack_default))
+        except Exception as e:
+            logger.debug(f"could not encode event {event.name}: {e}")
+            return t.cast(
+                bytes,
+                self.msgpack.packb({"timestamp": event.timestamp, "name": event.name, "data": repr(event.data)}),
+            )
+
+    def write(self, events: list[Event]) -> None:
+        records: list[bytes] = []
+        index: list[bytes] = []
+        for event in events:
+            if event.name == "step_started" and event.data:
+                self.step = event.data.get("step", self.step)
+
+            record = self._encode(event)
+            records.append(RECORD_HEADER.pack(len(record)))
+            records.append(record)
+            index.append(self.msgpack.packb([self.offset, event.timestamp, self.step, event.name]))
+            self.offset += RECORD_HEADER.size + len(record)
+
+        # the index is written after the records it points to
+        self.file.write(b"".join(records))
+        self.file.flush()
+        self.index.write(b"".join(index))
+        self.index.flush()
+
+    def sync(self) -> None:
+        _sync(self.file)
+        _sync(self.index)
+
+    def close(self) -> None:
+        self.file.close()
+        self.index.close()
+
+
+def _sync(file: t.BinaryIO) -> None:
+    file.flush()
+    if hasattr(file, "fileno"):
+        try:
+            os.fsync(file.fileno())
+        except (OSError, io.UnsupportedOperation):
+            pass
+
+
+def _open_sink(path: pathlib.Path) -> _JSONLSink | _MsgpackSink:
+    return _MsgpackSink(path) if is_msgpack(path) else _JSONLSink(path)
+
+
+class TraceWriter:
+    """
+    Writes events to a trace file from a background thread, so that encoding and writing them is
+    not on the hot path. Events are written in batches and flushed at the end of each batch, the
+    trace is flushed and closed when the process exits (including because of an unhandled exception).
+    """
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        fsync: str = DEFAULT_FSYNC,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> None:
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"invalid fsync policy {fsync}, must be one of {', '.join(FSYNC_POLICIES)}")
+
+        self.path = path
+        self.fsync = fsync
+        self.batch_size = batch_size
+        self._sink = _open_sink(path)
+        self._queue: queue.Queue[Event | None] = queue.Queue(maxsize=queue_size)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="nerve-trace-writer", daemon=True)
+        self._thread.start()
+
+        atexit.register(self.close)
+
+    def write(self, event: Event) -> None:
+        """Queue an event to be written."""
+
+        if not self._closed:
+            self._queue.put(event)
+
+    def flush(self) -> None:
+        """Wait for every queued event to be written."""
+
+        if not self._closed:
+            self._queue.join()
+
+    def close(self) -> None:
+        """Write the queued events and close the trace file."""
+
+        if self._closed:
+            return
+
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        atexit.unregister(self.close)
+
+    def _run(self) -> None:
+        done = False
+        while not done:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                events = [event for event in batch if event is not None]
+                done = len(events) < len(batch)
+                if events:
+                    self._sink.write(events)
+                    if self.fsync == "batch":
+                        self._sink.sync()
+            except Exception as e:
+                logger.error(f"error writing to trace file {self.path}: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+        try:
+            if self.fsync != "never":
+                self._sink.sync()
+            self._sink.close()
+        except Exception as e:
+            logger.error(f"error closing trace file {self.path}: {e}")
+
+
+def _is_selected(
+    name: str, step: int, from_step: int | None, until_step: int | None, only: t.Collection[str] | None
+) -> bool:
+    return (
+        (from_step is None or step >= from_step)
+        and (until_step is None or step <= until_step)
+        and (not only or name in only)
+    )
+
+
+def _read_jsonl(
+    path: pathlib.Path, from_step: int | None, until_step: int | None, only: t.Collection[str] | None
+) -> t.Iterator[Event]:
+    step = -1
+    with open_for_reading(path) as f:
+        for line in f:
+            event = Event.from_dict(json.loads(line))
+            if event.name == "step_started" and event.data:
+                step = event.data.get("step", step)
+
+            if until_step is not None and step > until_step:
+                break
+            elif _is_selected(event.name, step, from_step, until_step, only):
+                yield event
+
+
+def _read_record(file: t.BinaryIO, msgpack: t.Any) -> Event | None:
+    header = file.read(RECORD_HEADER.size)
+    if len(header) < RECORD_HEADER.size:
+        return None
+
+    (size,) = RECORD_HEADER.unpack(header)
+    record = file.read(size)
+    if len(record) < size:
+        # truncated by a crash
+        return None
+
+    return Event.from_dict(msgpack.unpackb(record))
+
+
+def _read_msgpack(
+    path: pathlib.Path, from_step: int | None, until_step: int | None, only: t.Collection[str] | None
+) -> t.Iterator[Event]:
+    msgpack = _import_msgpack()
+    index_path = get_index_path(path)
+
+    with open(path, "rb") as f:
+        if not index_path.exists():
+            logger.warning(f"index {index_path} not found, scanning the whole trace")
+            step = -1
+            while (event := _read_record(f, msgpack)) is not None:
+                if event.name == "step_started" and event.data:
+                    step = event.data.get("step", step)
+
+                if until_step is not None and step > until_step:
+                    break
+                elif _is_selected(event.name, step, from_step, until_step, only):
+                    yield event
+            return
+
+        with open(index_path, "rb") as index:
+            for offset, _timestamp, step, name in msgpack.Unpacker(index):
+                if until_step is not None and step > until_step:
+                    break
+                elif not _is_selected(name, step, from_step, until_step, only):
+                    continue
+
+                # only the selected events are read and decoded
+                f.seek(offset)
+                event = _read_record(f, msgpack)
+                if event is None:
+                    break
+                yield event
+
+
+def read_events(
+    path: pathlib.Path,
+    from_step: int | None = None,
+    until_step: int | None = None,
+    only: t.Collection[str] | None = None,
+) -> t.Iterator[Event]:
+    """
+    Read the events of a trace, optionally only the ones of the steps between from_step and until_step
+    (inclusive, events before the first step belong to step -1) and with one of the given names. Msgpack
+    traces are read through their index, other traces are scanned.
+    """
+
+    if is_msgpack(path):
+        return _read_msgpack(path, from_step, until_step, only)
+    return _read_jsonl(path, from_step, until_step, only)
@@ -0,0 +1,138 @@
+import json
+import pathlib
+
+import pytest
+from loguru import logger
+
+import nerve.runtime.state as state
+from nerve.runtime import logging
+from nerve.runtime.events import Event
+from nerve.runtime.trace import TraceWriter, get_index_path, open_for_reading, read_events
+
+
+@pytest.mark.parametrize("file_name", ["trace.jsonl", "trace.jsonl.gz"])
+def test_trace_writer(tmp_path: pathlib.Path, file_name: str) -> None:
+    path = tmp_path / file_name
+    writer = TraceWriter(path, fsync="batch", batch_size=4)
+    for i in range(10):
+        writer.write(Event(name="test_event", data={"i": i}))
+    writer.close()
+
+    with open_for_reading(path) as f:
+        events = [json.loads(line) for line in f]
+
+    assert [event["data"]["i"] for event in events] == list(range(10))
+
+
+def test_trace_writer_flush(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "trace.jsonl"
+    writer = TraceWriter(path)
+    writer.write(Event(name="test_event"))
+    writer.flush()
+
+    assert json.loads(path.read_text())["name"] == "test_event"
+
+    writer.close()
+    # ignored once closed
+    writer.write(Event(name="test_event"))
+    assert len(path.read_text().splitlines()) == 1
+
+
+def test_unserializable_event_is_written(tmp_path: pathlib.Path) -> None:
+    class Broken:
+        def __str__(self) -> str:
+            raise ValueError("can't")
+
+    path = tmp_path / "trace.jsonl"
+    writer = TraceWriter(path)
+    writer.write(Event(name="broken", data={"value": Broken()}))
+    writer.close()
+
+    assert json.loads(path.read_text())["name"] == "broken"
+
+
+def test_state_events_are_traced(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "trace.jsonl"
+    with state.run_context() as run_state:
+        state.set_trace_file(path)
+        state.update_variables({"name": "nerve"})
+
+    assert run_state.trace_writer is not None
+    run_state.trace_writer.close()
+
+    event = json.loads(path.read_text())
+    assert event["name"] == "variable_change"
+    assert event["data"]["to"] == "nerve"
+
+
+def _write_steps(path: pathlib.Path) -> None:
+    writer = TraceWriter(path, batch_size=3)
+    writer.write(Event(name="flow_started"))
+    for step in range(5):
+        writer.write(Event(name="step_started", data={"step": step}))
+        writer.write(Event(name="tool_called", data={"name": f"tool_{step}"}))
+        writer.write(Event(name="step_complete", data={"step": step}))
+    writer.write(Event(name="flow_complete"))
+    writer.close()
+
+
+@pytest.mark.parametrize("file_name", ["trace.jsonl", "trace.msgpack"])
+def test_read_events(tmp_path: pathlib.Path, file_name: str) -> None:
+    pytest.importorskip("msgpack")
+
+    path = tmp_path / file_name
+    _write_steps(path)
+
+    assert len(list(read_events(path))) == 17
+
+    events = list(read_events(path, from_step=1, until_step=2))
+    assert [event.name for event in events] == ["step_started", "tool_called", "step_complete"] * 2
+    assert events[0].data == {"step": 1}
+
+    events = list(read_events(path, from_step=3, only=["tool_called", "flow_complete"]))
+    assert [event.data for event in events] == [{"name": "tool_3"}, {"name": "tool_4"}, None]
+
+
+def test_msgpack_trace_without_index(tmp_path: pathlib.Path) -> None:
+    pytest.importorskip("msgpack")
+
+    path = tmp_path / "trace.msgpack"
+    _write_steps(path)
+    get_index_path(path).unlink()
+
+    events = list(read_events(path, until_step=0, only=["tool_called"]))
+    assert [event.data for event in events] == [{"name": "tool_0"}]
+
+
+def test_play_old_trace(tmp_path: pathlib.Path) -> None:
+    # events recorded before the payloads referenced agents and flows by name
+    actor = {
+        "runtime": {"name": "agent", "generator": "openai/gpt-4o", "tools": [{}, {}]},
+        "configuration": {"version": "1.0.0"},
+        "conv_window_strategy": "full",
+    }
+    path = tmp_path / "trace.jsonl"
+    path.write_text(
+        "\n".join(
+            json.dumps({"timestamp": 0.0, "name": name, "data": data})
+            for name, data in (
+                ("agent_created", {"agent": actor}),
+                ("flow_started", {"flow": {"max_steps": 10, "timeout": None, "actors": [actor]}, "state": {}}),
+                ("task_complete", {"actor": actor, "reason": None}),
+            )
+        )
+    )
+
+    messages: list[str] = []
+    handler_id = logger.add(lambda message: messages.append(message.record["message"]), level="INFO")
+    try:
+        for event in read_events(path):
+            logging.log_event_to_terminal(event)
+    finally:
+        logger.remove(handler_id)
+
+    assert messages == [
+        "🤖 openai/gpt-4o | agent v1.0.0 with 2 tools",
+        "🚀 10 max steps | no timeout | full",
+        "✅ task agent completed",
+    ]
@@ -12,6 +12,7 @@ from loguru import logger
 
 from nerve.models import Tool
 from nerve.runtime import state
+from nerve.tools.protocol import serial, timeout
 
 
 def wrap_tool_function(func: t.Callable[..., t.Any], mime: str | None = None) -> t.Callable[..., t.Any]:
@@ -19,6 +20,51 @@ def wrap_tool_function(func: t.Callable[..., t.Any], mime: str | None = None) ->
     Creates a wrapper around a function that logs the function call and its result.
     """
 
+    def on_error(e: Exception) -> str:
+        import traceback
+
+        error_trace = traceback.format_exc()
+        logger.error(f"{func.__name__}: {e}")
+        logger.error(f"{error_trace}")
+
+        return f"ERROR in {func.__name__}: {e}"
+
+    def on_result(result: t.Any) -> t.Any:
+        if mime:
+            if mime.startswith("image/"):
+                result = {
+                    "type": "image_url",
+                    "image_url": {"url": f"data:{mime};base64,{base64.b64encode(result).decode('utf-8')}"},
+                }
+            else:
+                logger.error(f"tool {func.__name__} references an unsupported mime type: {mime}")
+                exit(1)
+
+        return result
+
+    if inspect.iscoroutinefunction(func):
+        # awaited by the wrapper so that the call is timed (and can be cancelled) as a whole
+        async def async_wrapper(*args: t.Any, **kwargs: t.Any) -> t.Any:
+            logger.debug(f"calling {func.__name__} ...")
+
+            state.on_before_tool_called(func.__name__, kwargs)
+
+            started_at = time.time()
+            error = None
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                result = on_error(e)
+                error = str(e)
+
+            finished_at = time.time()
+
+            state.on_tool_called(started_at, finished_at, func.__name__, kwargs, result, error)
+
+            return on_result(result)
+
+        return functools.wraps(func)(async_wrapper)
+
     def wrapper(*args: t.Any, **kwargs: t.Any) -> t.Any:
         logger.debug(f"calling {func.__name__} ...")
 
@@ -29,30 +75,14 @@ def wrap_tool_function(func: t.Callable[..., t.Any], mime: str | None = None) ->
         try:
             result = func(*args, **kwargs)
         except Exception as e:
-            import traceback
-
-            error_trace = traceback.format_exc()
-            logger.error(f"{func.__name__}: {e}")
-            logger.error(f"{error_trace}")
-
-            result = f"ERROR in {func.__name__}: {e}"
+            result = on_error(e)
             error = str(e)
 
         finished_at = time.time()
 
         state.on_tool_called(started_at, finished_at, func.__name__, kwargs, result, error)
 
-        if mime:
-            if mime.startswith("image/"):
-                result = {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:{mime};base64,{base64.b64encode(result).decode('utf-8')}"},
-                }
-            else:
-                logger.error(f"tool {func.__name__} references an unsupported mime type: {mime}")
-                exit(1)
-
-        return result
+        return on_result(result)
 
     # Preserve the function's metadata
     wrapper = functools.wraps(func)(wrapper)
@@ -144,7 +174,15 @@ def get_tool_from_yml(working_dir: pathlib.Path, tool: Tool) -> t.Callable[...,
     func_namespace: dict[str, t.Any] = {}
     exec(func_body, func_namespace)
 
-    return wrap_tool_function(func_namespace[tool.name], tool.mime)
+    func = func_namespace[tool.name]
+    if tool.serial or tool.complete_task:
+        # tools completing the task must not race with other tool calls
+        serial(func)
+
+    if tool.timeout:
+        timeout(tool.timeout)(func)
+
+    return wrap_tool_function(func, tool.mime)
 
 
 def get_tools_from_yml(working_dir: pathlib.Path, yml_tools: list[Tool]) -> list[t.Callable[..., t.Any]]:
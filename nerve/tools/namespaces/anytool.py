@@ -9,8 +9,10 @@ from loguru import logger
 
 from nerve.runtime import state
 from nerve.tools.compiler import wrap_tool_function
+from nerve.tools.protocol import invalidate_tool_schema, serial
 
 
+@serial
 def create_tool(
     code: Annotated[
         str,
@@ -43,6 +45,11 @@ def this_will_be_the_tool_name(
         elif value.__module__ is not None:
             continue
 
+        previous = state.get_extra_tools().get(name)
+        if previous is not None:
+            logger.debug(f"redefining tool: {name}")
+            invalidate_tool_schema(previous)
+
         logger.debug(f"creating tool: {name}")
         tool_fn = wrap_tool_function(value)
         state.set_extra_tool(tool_fn)
@@ -3,13 +3,26 @@ Read-only access primitives to the local filesystem.
 """
 
 import os
+import shlex
 from pathlib import Path
 from typing import Annotated
 
+import nerve.runtime.state as state
+
 # if set, the agent will only have access to these paths
 jail: list[str] = []
 
 
+def _resolve(path: str) -> str:
+    # relative paths are relative to the working directory of the task, not to the process one (shared by
+    # concurrent runs)
+    working_dir = state.get_working_dir()
+    if working_dir is None:
+        return path
+
+    return str(working_dir / path)
+
+
 def _path_allowed(path_to_check: str) -> bool:
     if not jail:
         return True
@@ -34,18 +47,20 @@ def list_folder_contents(
 ) -> str:
     """List the contents of a folder on disk."""
 
+    path = _resolve(path)
     _path_acl(path)
 
     # The rationale here is that because of training data, models can
     # understand an "ls -la" output better than any custom output format
     # I could generate manually, so we just use the "ls -la" command to
     # list the contents of the folder.
-    return os.popen(f"ls -la {path}").read()
+    return os.popen(f"ls -la {shlex.quote(path)}").read()
 
 
 def read_file(path: Annotated[str, "The path to the file to read"]) -> str:
     """Read the contents of a file from disk."""
 
+    path = _resolve(path)
     _path_acl(path)
 
     with open(path) as f:
@@ -2,13 +2,18 @@
 Let the agent execute shell commands.
 """
 
-import subprocess
 from typing import Annotated
 
+import nerve.runtime.state as state
+from nerve.tools.process import run_shell
 
-def execute_shell_command(
+
+async def execute_shell_command(
     command: Annotated[str, "The shell command to execute"],
 ) -> str:
     """Execute a shell command and return the output."""
 
-    return subprocess.check_output(command, shell=True).decode("utf-8")
+    # run in the working directory of the task (the process one is shared by concurrent runs),
+    # the command and its children are killed if the call is cancelled
+    output = await run_shell(command, cwd=state.get_working_dir())
+    return output.decode("utf-8")
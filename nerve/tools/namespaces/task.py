@@ -4,8 +4,10 @@ Let the agent autonomously set the task as complete or failed.
 import typing as t
 
 import nerve.runtime.state as state
+from nerve.tools.protocol import serial
 
 
+@serial
 def task_complete_success(
     reason: t.Annotated[
         str | None, "Optional reason why the task is complete or report of conclusive information."
@@ -16,6 +18,7 @@ def task_complete_success(
     state.set_task_complete(reason)
 
 
+@serial
 def task_failed(
     reason: t.Annotated[str, "The reason why the task is impossible"],
 ) -> None:
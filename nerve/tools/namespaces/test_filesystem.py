@@ -3,6 +3,7 @@ import tempfile
 import unittest
 from pathlib import Path
 
+import nerve.runtime.state as state
 from nerve.tools.namespaces import filesystem
 
 
@@ -123,3 +124,19 @@ class TestFilesystem(unittest.TestCase):
 
             with self.assertRaises(ValueError):
                 filesystem.read_file(str(symlink_path / "outside_file.txt"))
+
+    def test_relative_paths_use_working_dir(self) -> None:
+        # each run resolves relative paths against the working directory of its own task
+        with state.run_context():
+            state.set_working_dir(self.test_dir)
+            self.assertEqual(filesystem.read_file("test_file.txt"), "test content")
+            self.assertIn("subfile.txt", filesystem.list_folder_contents("subdir"))
+
+        with state.run_context():
+            state.set_working_dir(self.test_subdir)
+            self.assertEqual(filesystem.read_file("subfile.txt"), "subfile content")
+
+            # the jail applies to the resolved path
+            filesystem.jail = [str(self.test_subdir)]
+            with self.assertRaises(ValueError):
+                filesystem.read_file("../test_file.txt")
@@ -1,26 +1,42 @@
+import asyncio
+import os
 import subprocess
 import tempfile
+import time
 import unittest
 from pathlib import Path
 from unittest.mock import patch
 
+import nerve.runtime.state as state
 from nerve.tools.namespaces import shell
 
 
+def _is_running(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().split(")")[-1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+def execute_shell_command(command: str) -> str:
+    return asyncio.run(shell.execute_shell_command(command))
+
+
 class TestShell(unittest.TestCase):
     def test_execute_shell_command(self) -> None:
         # Test basic command execution
-        result = shell.execute_shell_command("echo 'hello world'")
+        result = execute_shell_command("echo 'hello world'")
         self.assertEqual(result.strip(), "hello world")
 
     def test_execute_shell_command_with_pipes(self) -> None:
         # Test command with pipes
-        result = shell.execute_shell_command("echo 'test' | tr 'e' 'E'")
+        result = execute_shell_command("echo 'test' | tr 'e' 'E'")
         self.assertEqual(result.strip(), "tEst")
 
     def test_execute_shell_command_with_environment_variables(self) -> None:
         # Test command with environment variables
-        result = shell.execute_shell_command("TEST_VAR='value' && echo $TEST_VAR")
+        result = execute_shell_command("TEST_VAR='value' && echo $TEST_VAR")
         self.assertEqual(result.strip(), "value")
 
     def test_execute_shell_command_with_file_operations(self) -> None:
@@ -29,23 +45,45 @@ class TestShell(unittest.TestCase):
             test_file = Path(temp_dir) / "test.txt"
 
             # Create a file and write to it
-            shell.execute_shell_command(f"echo 'test content' > {test_file}")
+            execute_shell_command(f"echo 'test content' > {test_file}")
 
             # Read the file
             self.assertTrue(test_file.exists())
             self.assertEqual(test_file.read_text().strip(), "test content")
 
-    @patch("subprocess.check_output")
-    def test_execute_shell_command_calls_subprocess(self, mock_check_output: unittest.mock.Mock) -> None:
-        # Test that the function calls subprocess.check_output with the right arguments
-        mock_check_output.return_value = b"mocked output"
+    @patch("nerve.tools.namespaces.shell.run_shell")
+    def test_execute_shell_command_runs_in_working_dir(self, mock_run_shell: unittest.mock.AsyncMock) -> None:
+        mock_run_shell.return_value = b"mocked output"
 
-        result = shell.execute_shell_command("some command")
+        with state.run_context():
+            state.set_working_dir(Path("/tmp"))
+            result = execute_shell_command("some command")
 
-        mock_check_output.assert_called_once_with("some command", shell=True)
+        mock_run_shell.assert_called_once_with("some command", cwd=Path("/tmp"))
         self.assertEqual(result, "mocked output")
 
     def test_execute_shell_command_error(self) -> None:
         # Test that the function raises an exception for invalid commands
         with self.assertRaises(subprocess.CalledProcessError):
-            shell.execute_shell_command("command_that_does_not_exist")
+            execute_shell_command("command_that_does_not_exist")
+
+    @unittest.skipUnless(os.path.exists("/proc"), "requires procfs")
+    def test_execute_shell_command_cancelled_kills_children(self) -> None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pid_file = Path(temp_dir) / "pid"
+
+            async def run() -> None:
+                command = f"sleep 30 & echo $! > {pid_file}; wait"
+                task = asyncio.create_task(shell.execute_shell_command(command))
+                while not pid_file.exists() or not pid_file.read_text().strip():
+                    await asyncio.sleep(0.01)
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+
+            started_at = time.monotonic()
+            asyncio.run(run())
+            self.assertLess(time.monotonic() - started_at, 5)
+
+            # the background child of the shell has been killed too (it can be left as a zombie until reaped)
+            self.assertFalse(_is_running(int(pid_file.read_text())))
@@ -2,6 +2,7 @@
 Provides tools for getting the current date and time and waiting for a given number of seconds.
 """
 
+import asyncio
 import time
 from typing import Annotated
 
@@ -12,9 +13,10 @@ def current_time_and_date() -> str:
     return time.strftime("%H:%M%p %Z on %b %d, %Y")
 
 
-def wait(
+async def wait(
     seconds: Annotated[int, "The number of seconds to wait"],
 ) -> None:
     """Wait for a given number of seconds."""
 
-    time.sleep(seconds)
+    # doesn't block the other tasks and can be cancelled
+    await asyncio.sleep(seconds)
@@ -0,0 +1,85 @@
+import asyncio
+import contextvars
+import os
+import pathlib
+import signal
+import subprocess
+import threading
+import typing as t
+
+import nerve.runtime.state as state
+
+
+async def run_shell(command: str, cwd: pathlib.Path | str | None = None, check: bool = True) -> bytes:
+    """
+    Run a shell command and return its output. The command runs in its own process group, which is killed
+    (including any child process) if the call is cancelled, for instance because a deadline was reached.
+    With check set, a non zero exit code raises subprocess.CalledProcessError like subprocess.check_output.
+    Unless cwd is given, the command runs in the working directory of the active task.
+    """
+
+    proc = await asyncio.create_subprocess_shell(
+        command,
+        stdout=asyncio.subprocess.PIPE,
+        cwd=cwd or state.get_working_dir(),
+        start_new_session=True,
+    )
+
+    try:
+        output, _ = await proc.communicate()
+    except asyncio.CancelledError:
+        _kill_group(proc)
+        # reap it, killed processes exit immediately
+        await asyncio.shield(proc.wait())
+        raise
+
+    if check and proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, command, output=output)
+
+    return output
+
+
+def _kill_group(proc: asyncio.subprocess.Process) -> None:
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        # already gone
+        pass
+
+
+async def run_in_thread(func: t.Callable[..., t.Any], *args: t.Any, **kwargs: t.Any) -> t.Any:
+    """
+    Run a blocking function in a daemon thread and return its result. Like asyncio.to_thread the function
+    runs in a copy of the current context, but a thread can't be interrupted: if the call is cancelled the
+    function keeps running in the background, without preventing the process from exiting (as the threads
+    of an executor would).
+    """
+
+    loop = asyncio.get_running_loop()
+    future: asyncio.Future[t.Any] = loop.create_future()
+    context = contextvars.copy_context()
+
+    def resolve(result: t.Any, error: BaseException | None) -> None:
+        if future.done():
+            # cancelled
+            return
+        elif error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def run() -> None:
+        result, error = None, None
+        try:
+            result = context.run(func, *args, **kwargs)
+        except BaseException as e:
+            error = e
+
+        try:
+            loop.call_soon_threadsafe(resolve, result, error)
+        except RuntimeError:
+            # the event loop is closed, nobody is waiting anymore
+            pass
+
+    threading.Thread(target=run, name=f"nerve-{getattr(func, '__name__', 'tool')}", daemon=True).start()
+    return await future
@@ -1,11 +1,94 @@
 import inspect
 import typing as t
+import weakref
 from typing import Annotated
 
 from loguru import logger
 
+# attribute set on tools that must not run concurrently with other tool calls
+SERIAL_TOOL_ATTRIBUTE: str = "__nerve_serial__"
+# attribute set on tools with a deadline, in seconds
+TIMEOUT_TOOL_ATTRIBUTE: str = "__nerve_timeout__"
+
+F = t.TypeVar("F", bound=t.Callable[..., t.Any])
+
+
+def serial(func: F) -> F:
+    """
+    Mark a tool as serial: when the model requests multiple tool calls at once, a serial tool
+    only runs after every call before it is done and before any call after it is started.
+    """
+    setattr(func, SERIAL_TOOL_ATTRIBUTE, True)
+    return func
+
+
+def is_serial(func: t.Callable[..., t.Any]) -> bool:
+    return bool(getattr(func, SERIAL_TOOL_ATTRIBUTE, False))
+
+
+def timeout(seconds: float) -> t.Callable[[F], F]:
+    """
+    Set a deadline for a tool: a call taking longer is cancelled (killing the processes started by
+    async tools) and the model is told that it timed out.
+    """
+
+    def decorator(func: F) -> F:
+        setattr(func, TIMEOUT_TOOL_ATTRIBUTE, seconds)
+        return func
+
+    return decorator
+
+
+def get_timeout(func: t.Callable[..., t.Any]) -> float | None:
+    return getattr(func, TIMEOUT_TOOL_ATTRIBUTE, None)
+
+
+# tool schemas registry: the (unwrapped) function -> (code hash, schema)
+_schemas: weakref.WeakKeyDictionary[t.Callable[..., t.Any], tuple[int, dict[str, t.Any]]] = weakref.WeakKeyDictionary()
+
+
+def _get_code_hash(func: t.Callable[..., t.Any], target: t.Callable[..., t.Any]) -> int:
+    return hash(
+        (func.__name__, getattr(target, "__code__", None), target.__doc__, getattr(target, "__defaults__", None))
+    )
+
 
 def get_tool_schema(func: t.Callable[..., t.Any]) -> dict[str, t.Any]:
+    """
+    Get the JSON schema of a tool, building it only the first time the tool is seen.
+
+    Schemas are shared by every wrapper of the same function (the same namespace tool imported by
+    multiple agents) and are rebuilt if the code of the function changes. The returned schema is
+    shared and must not be modified.
+    """
+    target = inspect.unwrap(func)
+    code_hash = _get_code_hash(func, target)
+
+    try:
+        cached = _schemas.get(target)
+    except TypeError:
+        # not weak referenceable, can't be cached
+        return _build_tool_schema(func)
+
+    if cached is not None and cached[0] == code_hash:
+        return cached[1]
+
+    schema = _build_tool_schema(func)
+    _schemas[target] = (code_hash, schema)
+    return schema
+
+
+def invalidate_tool_schema(func: t.Callable[..., t.Any]) -> None:
+    """Remove a tool from the schemas registry (used when a tool is redefined at runtime)."""
+
+    try:
+        _schemas.pop(inspect.unwrap(func), None)
+    except TypeError:
+        # not weak referenceable, never cached
+        pass
+
+
+def _build_tool_schema(func: t.Callable[..., t.Any]) -> dict[str, t.Any]:
     signature = inspect.signature(func)
     docstring = inspect.getdoc(func) or ""
 
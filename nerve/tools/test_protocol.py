@@ -0,0 +1,51 @@
+import typing as t
+import unittest
+from unittest.mock import patch
+
+from nerve.tools import protocol
+from nerve.tools.compiler import wrap_tool_function
+
+
+def sample_tool(path: t.Annotated[str, "The path to read"], limit: int = 10) -> str:
+    """Read a file."""
+    return path
+
+
+class TestToolSchema(unittest.TestCase):
+    def test_schema(self) -> None:
+        schema = protocol.get_tool_schema(sample_tool)
+
+        self.assertEqual(schema["function"]["name"], "sample_tool")
+        self.assertEqual(schema["function"]["description"], "Read a file.")
+        self.assertEqual(
+            schema["function"]["parameters"]["properties"],
+            {"path": {"type": "string", "description": "The path to read"}, "limit": {"type": "integer"}},
+        )
+        self.assertEqual(schema["function"]["parameters"]["required"], ["path"])
+
+    def test_schema_is_cached_across_wrappers(self) -> None:
+        protocol.invalidate_tool_schema(sample_tool)
+
+        with patch("nerve.tools.protocol._build_tool_schema", wraps=protocol._build_tool_schema) as build:
+            first = protocol.get_tool_schema(wrap_tool_function(sample_tool))
+            second = protocol.get_tool_schema(wrap_tool_function(sample_tool))
+
+        self.assertIs(first, second)
+        self.assertEqual(build.call_count, 1)
+
+    def test_schema_rebuilt_when_redefined(self) -> None:
+        namespace: dict[str, t.Any] = {}
+        exec('def dynamic(a: str) -> str:\n    """First."""\n    return a', namespace)
+        tool = namespace["dynamic"]
+
+        self.assertEqual(protocol.get_tool_schema(tool)["function"]["description"], "First.")
+
+        # same function object with new code, as when redefined in place
+        exec('def dynamic(a: str, b: int) -> str:\n    """Second."""\n    return a', namespace)
+        tool.__code__ = namespace["dynamic"].__code__
+        tool.__doc__ = namespace["dynamic"].__doc__
+        tool.__annotations__ = namespace["dynamic"].__annotations__
+
+        schema = protocol.get_tool_schema(tool)
+        self.assertEqual(schema["function"]["description"], "Second.")
+        self.assertIn("b", schema["function"]["parameters"]["properties"])